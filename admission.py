@@ -0,0 +1,226 @@
+"""Admission: Priority scheduling and per-user limits for AI requests.
+
+Every AI request passes through the AdmissionScheduler before it reaches OpenAI. A bounded pool of
+workers serves the waiting requests strictly by priority class (PTT, channel owner, mods, subs,
+followers, everyone else) and in arrival order within a class, so a chat flood cannot delay the
+streamer or the mods. Viewers are limited per user (requests and estimated tokens per time window);
+requests that waited longer than the maximum queue time are dropped instead of being answered late.
+"""
+import asyncio
+import collections
+import enum
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from config import env_number
+import metrics
+
+RATE_LIMITED = "rate_limited"
+BUDGET_EXCEEDED = "budget_exceeded"
+QUEUE_FULL = "queue_full"
+STALE = "stale"
+
+class Priority(enum.IntEnum):
+    """Priority classes; lower values are served first."""
+    PTT = 0
+    OWNER = 1
+    MOD = 2
+    SUB = 3
+    FOLLOWER = 4
+    VIEWER = 5
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted or dropped while waiting.
+
+    Attributes:
+        reason (str): One of RATE_LIMITED, BUDGET_EXCEEDED, QUEUE_FULL or STALE.
+    """
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Roughly estimates the number of tokens in text (about four characters per token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    enqueued_at: float = field(compare=False)
+    job: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+class AdmissionScheduler:
+    """Runs AI jobs with bounded concurrency, priority order and per-user limits.
+
+    Args:
+        workers (int): Number of jobs running at the same time.
+        max_queue (int): Maximum number of waiting jobs. When full, a new job displaces the waiting job
+            with the lowest priority, or is rejected if it has no higher priority itself.
+        max_wait (float): Seconds a job may wait before it is dropped as stale (0 disables).
+        user_rate (int): Requests per user and window (0 disables).
+        token_budget (int): Estimated tokens per user and window (0 disables).
+        window (float): Length of the rate and budget window in seconds.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+
+    PTT, the channel owner and mods are never rate limited.
+    """
+    SWEEP_THRESHOLD = 1024
+
+    def __init__(self, workers: int = 4, max_queue: int = 50, max_wait: float = 20.0, user_rate: int = 4,
+                 token_budget: int = 2000, window: float = 60.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.workers = max(workers, 1)
+        self.max_queue = max(max_queue, 1)
+        self.max_wait = max_wait
+        self.user_rate = user_rate
+        self.token_budget = token_budget
+        self.window = window
+        self.clock = clock
+        self.rejected: Dict[str, int] = collections.Counter()
+        self._heap: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._requests: Dict[str, Deque[float]] = collections.defaultdict(collections.deque)
+        self._tokens: Dict[str, Deque[Tuple[float, int]]] = collections.defaultdict(collections.deque)
+
+    @classmethod
+    def from_env(cls) -> "AdmissionScheduler":
+        """Creates a scheduler from AI_MAX_CONCURRENCY (default 4), AI_QUEUE_SIZE (50), AI_QUEUE_MAX_WAIT (20s),
+        AI_USER_RATE (4), AI_USER_TOKEN_BUDGET (2000) and AI_USER_WINDOW (60s)."""
+        return cls(
+            workers=int(env_number("AI_MAX_CONCURRENCY", 4)),
+            max_queue=int(env_number("AI_QUEUE_SIZE", 50)),
+            max_wait=env_number("AI_QUEUE_MAX_WAIT", 20.0),
+            user_rate=int(env_number("AI_USER_RATE", 4)),
+            token_budget=int(env_number("AI_USER_TOKEN_BUDGET", 2000)),
+            window=env_number("AI_USER_WINDOW", 60.0),
+        )
+
+    @property
+    def backlog(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return len(self._heap)
+
+    async def run(self, job: Callable[[], Awaitable[Any]], priority: Priority = Priority.VIEWER,
+                  user: Optional[str] = None, cost: int = 0) -> Any:
+        """Admits job, waits until a worker has run it and returns its result.
+
+        Args:
+            job (Callable[[], Awaitable]): Coroutine function doing the actual work.
+            priority (Priority): Priority class of the sender.
+            user (str, optional): Sender for the per-user limits; None skips the limits.
+            cost (int): Estimated tokens charged to the user's budget on admission.
+
+        Raises:
+            AdmissionRejected: If the job is rate limited, over budget, displaced or stale.
+        """
+        limited = user is not None and priority > Priority.MOD
+        if limited:
+            self._check_limits(user.lower(), cost)
+        self._start_workers()
+        ticket = _Ticket(priority, next(self._seq), self.clock(), job, asyncio.get_running_loop().create_future())
+        # Prüfen, Einreihen und Abrechnen ohne await dazwischen, damit parallele Anfragen konsistent zählen
+        if len(self._heap) >= self.max_queue:
+            worst = max(self._heap)
+            if worst < ticket:
+                self._reject(QUEUE_FULL)
+            self._heap.remove(worst)
+            heapq.heapify(self._heap)
+            self._drop(worst, QUEUE_FULL)
+        heapq.heappush(self._heap, ticket)
+        if limited:
+            self._charge(user.lower(), cost, count_request=True)
+        async with self._cond:
+            self._cond.notify()
+        return await ticket.future
+
+    def charge(self, user: Optional[str], tokens: int) -> None:
+        """Charges tokens used by a finished reply to the user's budget."""
+        if user is not None and tokens > 0:
+            self._charge(user.lower(), tokens, count_request=False)
+
+    async def aclose(self) -> None:
+        """Stops the workers and rejects all waiting jobs."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._heap:
+            self._drop(heapq.heappop(self._heap), QUEUE_FULL)
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason)
+
+    def _drop(self, ticket: _Ticket, reason: str) -> None:
+        self.rejected[reason] += 1
+        if not ticket.future.done():
+            ticket.future.set_exception(AdmissionRejected(reason))
+
+    def _prune(self, user: str, now: float) -> None:
+        requests, tokens = self._requests[user], self._tokens[user]
+        while requests and requests[0] <= now - self.window:
+            requests.popleft()
+        while tokens and tokens[0][0] <= now - self.window:
+            tokens.popleft()
+
+    def _sweep(self, now: float) -> None:
+        """Forgets users whose window is empty, so the per-user state stays bounded."""
+        for user in list(self._requests.keys() | self._tokens.keys()):
+            self._prune(user, now)
+            if not self._requests[user] and not self._tokens[user]:
+                del self._requests[user], self._tokens[user]
+
+    def _check_limits(self, user: str, cost: int) -> None:
+        now = self.clock()
+        if len(self._requests) > self.SWEEP_THRESHOLD:
+            self._sweep(now)
+        self._prune(user, now)
+        if self.user_rate > 0 and len(self._requests[user]) >= self.user_rate:
+            self._reject(RATE_LIMITED)
+        if self.token_budget > 0 and sum(t for _, t in self._tokens[user]) + cost > self.token_budget:
+            self._reject(BUDGET_EXCEEDED)
+
+    def _charge(self, user: str, tokens: int, count_request: bool) -> None:
+        now = self.clock()
+        if count_request:
+            self._requests[user].append(now)
+        if tokens > 0:
+            self._tokens[user].append((now, tokens))
+
+    def _start_workers(self) -> None:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for i in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"ai-admission-{i}"))
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._heap)
+                ticket = heapq.heappop(self._heap)
+            if ticket.future.done():
+                continue  # Aufrufer hat aufgegeben
+            waited = self.clock() - ticket.enqueued_at
+            metrics.QUEUE_WAIT.observe(waited, queue="admission")
+            if self.max_wait > 0 and waited > self.max_wait:
+                logging.info("KI-Anfrage nach %.1fs in der Warteschlange verworfen", waited)
+                self._drop(ticket, STALE)
+                continue
+            try:
+                result = await ticket.job()
+            except asyncio.CancelledError:
+                ticket.future.cancel()
+                raise
+            except Exception as exc:
+                if not ticket.future.done():
+                    ticket.future.set_exception(exc)
+            else:
+                if not ticket.future.done():
+                    ticket.future.set_result(result)
@@ -2,22 +2,90 @@
 
 This module provides the AIResponder class, which can be used to send prompts to the OpenAI API and receive generated responses. It is designed for integration with chatbots and other conversational agents.
 
+Die Anfragen laufen über den asynchronen OpenAI-Client, damit der Twitch-Event-Loop während der
+Generierung weiterarbeitet und mehrere Anfragen gleichzeitig offen sein können.
+
+Antworten werden für kurze Zeit in einem TTL-Cache gehalten (Schlüssel: normalisierter Prompt,
+System-Prompt, Modell, max_tokens, Gesprächsverlauf). Gleiche Prompts, die gleichzeitig eintreffen, teilen sich eine
+einzige OpenAI-Anfrage (Single-Flight).
+
+Fehlgeschlagene Anfragen werden innerhalb von OPENAI_TIMEOUT wiederholt, und bei anhaltenden Störungen
+antwortet ein Circuit Breaker sofort mit einer Fallback-Antwort (siehe resilience.Upstream).
+
+Modell und max_tokens wählt pro Anfrage der ModelRouter (Promptlänge, Priorität des Absenders,
+gemessene Latenz pro Modell, siehe model_router).
+
 PEP 8/PEP 257-konform, mit Fehlerbehandlung und Logging.
 """
+import asyncio
+import httpx
 import openai
 import logging
 import os
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+from config import env_number
+from admission import Priority, estimate_tokens
+from model_router import ModelRouter
+from ttl_cache import MISSING, TTLCache
+import http_clients
+import metrics
+import resilience
+
+class _InFlight:
+    """A running OpenAI request whose output is shared with identical concurrent requests."""
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.done = False
+        self.cancelled = False
+        self._changed = asyncio.Event()
+
+    def publish(self, delta: str) -> None:
+        """Appends a text delta and wakes up all followers."""
+        self.chunks.append(delta)
+        self._notify()
+
+    def finish(self, cancelled: bool = False) -> None:
+        """Marks the request as finished (or cancelled); further calls are ignored."""
+        if not self.done:
+            self.done = True
+            self.cancelled = cancelled
+            self._notify()
+
+    def _notify(self) -> None:
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Yields all deltas published so far and then new ones until the request is finished."""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            await self._changed.wait()
 
 class AIResponder:
     """Handles communication with the OpenAI API for chat responses."""
 
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", system_prompt: str = None, system_prompt_file: str = None):
+    FALLBACK_TIMEOUT = "Entschuldigung, die Antwort hat zu lange gedauert."
+    FALLBACK_API_ERROR = "Entschuldigung, ich kann gerade nicht antworten."
+    FALLBACK_UNEXPECTED = "Entschuldigung, ein unerwarteter Fehler ist aufgetreten."
+    FALLBACK_DEGRADED = "Entschuldigung, die KI ist gerade gestört. Bitte versuch es gleich noch einmal."
+    FALLBACK_TEXTS = frozenset((FALLBACK_TIMEOUT, FALLBACK_API_ERROR, FALLBACK_UNEXPECTED, FALLBACK_DEGRADED))
+
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", system_prompt: str = None, system_prompt_file: str = None, timeout: float = None):
         """
         Args:
             api_key (str): OpenAI API key.
-            model (str): OpenAI chat model to use.
+            model (str): OpenAI chat model to use when no routes are configured (see model_router).
             system_prompt (str, optional): System prompt for the AI session.
             system_prompt_file (str, optional): Path to a file containing the system prompt.
+            timeout (float, optional): Deadline per request in seconds, shared by all retries. Defaults to
+                OPENAI_TIMEOUT or 30.
         """
         self.api_key = api_key
         self.model = model
@@ -30,37 +98,327 @@ class AIResponder:
                 logging.error("Fehler beim Laden des System-Prompts aus Datei: %s", e)
         self.system_prompt = prompt or system_prompt or "Du bist ein hilfreicher, freundlicher Chatbot für Twitch."
         self.max_tokens = int(os.environ.get("OPENAI_MAX_TOKENS", 100))
+        self.timeout = timeout if timeout is not None else env_number("OPENAI_TIMEOUT", 30.0)
+        cache_ttl = env_number("OPENAI_CACHE_TTL", 120.0)
+        cache_size = int(env_number("OPENAI_CACHE_SIZE", 256))
+        self.response_cache: Optional[TTLCache] = TTLCache(ttl=cache_ttl, max_size=cache_size) if cache_ttl > 0 else None
+        self._in_flight: dict[tuple, _InFlight] = {}
+        self._system_prompt_tokens: Optional[tuple] = None
+        self.router = ModelRouter.from_env(default_model=model, default_max_tokens=self.max_tokens)
+        self.upstream = resilience.Upstream.from_env("openai", "OPENAI", is_transient=http_clients.is_transient_error)
+        self._client = None
+        self._http = None
         openai.api_key = api_key
 
-    def get_response(self, prompt: str, max_tokens: int = None, temperature: float = 0.7) -> str:
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """Returns the async OpenAI client, creating it lazily on first use.
+
+        The client is created inside the running event loop so its connection pool is bound to the bot's loop.
+        """
+        if self._client is None:
+            self._http = http_clients.create_async_httpx_client()
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=http_clients.openai_base_url(),
+                timeout=httpx.Timeout(self.timeout, connect=http_clients.connect_timeout()),
+                http_client=self._http,
+                max_retries=0,
+            )
+        return self._client
+
+    async def warm_up(self) -> None:
+        """Opens a pooled connection to the OpenAI API so the first reply skips the TLS handshake."""
+        base_url = str(self.client.base_url)
+        try:
+            await self._http.head(base_url, timeout=http_clients.connect_timeout())
+            logging.debug("Verbindung vorgewärmt: %s", base_url)
+        except httpx.HTTPError as exc:
+            logging.debug("Vorwärmen von %s fehlgeschlagen: %s", base_url, exc)
+
+    async def aclose(self) -> None:
+        """Closes the underlying async OpenAI client and its connection pool."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    @property
+    def system_prompt_tokens(self) -> int:
+        """Estimated token count of the system prompt, computed once per system prompt."""
+        if self._system_prompt_tokens is None or self._system_prompt_tokens[0] != self.system_prompt:
+            self._system_prompt_tokens = (self.system_prompt, estimate_tokens(self.system_prompt))
+        return self._system_prompt_tokens[1]
+
+    @classmethod
+    def is_fallback(cls, text: str) -> bool:
+        """Returns True if text is one of the fallback answers used when a request fails."""
+        return text in cls.FALLBACK_TEXTS
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalizes a prompt for cache lookups: case, whitespace and trailing sentence punctuation are ignored.
+
+        Other characters are kept, so questions that differ only in an operator (``2+2`` and ``2*2``) do not
+        share an answer.
+        """
+        return " ".join(prompt.casefold().split()).rstrip("?!. ")
+
+    def _cache_key(self, prompt: str, max_tokens: int, history: Optional[List[dict]] = None, model: Optional[str] = None) -> tuple:
+        context = tuple((message["role"], message["content"]) for message in history or ())
+        return (self.normalize_prompt(prompt), self.system_prompt, model or self.model, max_tokens, context)
+
+    def _route(self, prompt: str, max_tokens: Optional[int], history: Optional[List[dict]],
+               priority: Optional[Priority]) -> Tuple[str, int]:
+        """Returns model and max_tokens for a request; an explicit max_tokens overrides the route."""
+        prompt_tokens = estimate_tokens(prompt) + sum(estimate_tokens(message["content"]) for message in history or ())
+        route = self.router.choose(prompt_tokens, priority)
+        return route.model, max_tokens if max_tokens is not None else route.max_tokens
+
+    def _fallback_for(self, exc: Exception, timeout: float) -> str:
+        """Logs a failed request and returns the fallback text for the user."""
+        if isinstance(exc, resilience.CircuitOpenError):
+            logging.warning("OpenAI vorübergehend deaktiviert, sende Fallback-Antwort")
+            return self.FALLBACK_DEGRADED
+        metrics.ERRORS.inc(stage="openai")
+        if isinstance(exc, asyncio.TimeoutError):
+            logging.error("OpenAI API Timeout nach %.1fs", timeout)
+            return self.FALLBACK_TIMEOUT
+        if isinstance(exc, openai.OpenAIError):
+            logging.error("OpenAI API error: %s", exc)
+            return self.FALLBACK_API_ERROR
+        logging.error("Unerwarteter Fehler: %s", exc)
+        return self.FALLBACK_UNEXPECTED
+
+    def _release_flight(self, key: tuple, flight: _InFlight) -> None:
+        flight.finish(cancelled=True)
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    def _build_messages(self, prompt: str, history: Optional[List[dict]] = None) -> list[dict]:
+        """Builds the message list for a chat completion request, with earlier turns between system prompt and question."""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            *(history or ()),
+            {"role": "user", "content": prompt}
+        ]
+
+    async def _request_complete(self, prompt: str, max_tokens: int, temperature: float, timeout: float,
+                                history: Optional[List[dict]] = None, model: Optional[str] = None) -> str:
+        """Runs a non-streaming completion request and returns the stripped text. Errors are raised."""
+        model = model or self.model
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(prompt, history),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            # Ein Timeout zählt für die Latenzmessung als (mindestens) so langsam
+            self.router.observe(model, time.perf_counter() - started)
+            raise
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("OpenAI API response: %r", response)
+        elapsed = time.perf_counter() - started
+        self.router.observe(model, elapsed)
+        metrics.LLM_FIRST_TOKEN.observe(elapsed, mode="complete")
+        metrics.LLM_TOTAL.observe(elapsed, mode="complete")
+        return response.choices[0].message.content.strip()
+
+    async def _request_stream(self, prompt: str, max_tokens: int, temperature: float, timeout: float,
+                              history: Optional[List[dict]] = None, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Runs a streaming completion request and yields text deltas. Errors are raised.
+
+        The timeout applies to the whole generation, measured from the start of the request.
+        """
+        model = model or self.model
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        started = time.perf_counter()
+        stream = None
+        produced = False
+        try:
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(prompt, history),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                ),
+                timeout=timeout,
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not produced:
+                        delta = delta.lstrip()
+                        if not delta:
+                            continue
+                        first_token = time.perf_counter() - started
+                        metrics.LLM_FIRST_TOKEN.observe(first_token, mode="stream")
+                        self.router.observe(model, first_token)
+                    produced = True
+                    yield delta
+            metrics.LLM_TOTAL.observe(time.perf_counter() - started, mode="stream")
+        except asyncio.TimeoutError:
+            if not produced:
+                self.router.observe(model, time.perf_counter() - started)
+            raise
+        finally:
+            if stream is not None:
+                await stream.close()
+
+    async def _stream_with_retry(self, prompt: str, max_tokens: int, temperature: float, deadline: resilience.Deadline,
+                                 history: Optional[List[dict]] = None, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Yields the deltas of a streaming request; retries transient errors as long as no text was produced."""
+        attempt = 0
+        while True:
+            self.upstream.check()
+            produced = False
+            try:
+                async for delta in self._request_stream(prompt, max_tokens, temperature, deadline.remaining(), history, model):
+                    produced = True
+                    yield delta
+            except Exception as exc:
+                self.upstream.failure(exc)
+                # Nach dem ersten Token würde eine Wiederholung bereits gesendeten Text doppeln
+                delay = None if produced else self.upstream.backoff(exc, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Abbruch (CancelledError, GeneratorExit): nach dem ersten Token hat OpenAI geantwortet
+                if produced:
+                    self.upstream.success()
+                else:
+                    self.upstream.release()
+                raise
+            self.upstream.success()
+            return
+
+    async def get_response(self, prompt: str, max_tokens: int = None, temperature: float = 0.7, timeout: float = None,
+                           history: Optional[List[dict]] = None, priority: Optional[Priority] = None) -> str:
         """
         Sends a prompt to the OpenAI API and returns the response.
 
+        The call does not block the event loop. Cancelling the awaiting task aborts the HTTP request.
+        Cached answers are returned without a request, and identical prompts in flight share one request.
+        Transient errors are retried within the timeout; while OpenAI is degraded a fallback text is returned at once.
+
         Args:
             prompt (str): The user's message.
-            max_tokens (int, optional): Maximum number of tokens in the response. Defaults to value from environment.
+            max_tokens (int, optional): Maximum number of tokens in the response. Defaults to the chosen route.
             temperature (float): Sampling temperature.
+            timeout (float, optional): Deadline in seconds for all attempts together. Defaults to self.timeout.
+            history (List[dict], optional): Earlier messages of the conversation (see conversation_memory).
+            priority (Priority, optional): Sender class, used to choose the model (see model_router).
 
         Returns:
             str: The AI-generated response.
         """
+        timeout = timeout if timeout is not None else self.timeout
+        model, max_tokens = self._route(prompt, max_tokens, history, priority)
+        key = self._cache_key(prompt, max_tokens, history, model)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(key, MISSING)
+            metrics.record_lookup("response", cached is not MISSING)
+            if cached is not MISSING:
+                return cached
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            text = "".join([delta async for delta in flight.follow()]).strip()
+            if not flight.cancelled:
+                return text
+        flight = self._in_flight[key] = _InFlight()
         try:
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens if max_tokens is not None else self.max_tokens,
-                temperature=temperature,
+            text = await self.upstream.call_async(
+                lambda remaining: self._request_complete(prompt, max_tokens, temperature, remaining, history, model),
+                resilience.Deadline(timeout),
             )
-            if logging.getLogger().isEnabledFor(logging.DEBUG):
-                logging.debug("OpenAI API response: %r", response)
-            return response.choices[0].message.content.strip()
-        except openai.OpenAIError as e:
-            logging.error("OpenAI API error: %s", e)
-            return "Entschuldigung, ich kann gerade nicht antworten."
+            flight.publish(text)
+            flight.finish()
+            if self.response_cache is not None and text:
+                self.response_cache.set(key, text)
+            return text
+        except Exception as e:
+            fallback = self._fallback_for(e, timeout)
+            flight.publish(fallback)
+            flight.finish()
+            return fallback
+        finally:
+            self._release_flight(key, flight)
+
+    async def stream_response(self, prompt: str, max_tokens: int = None, temperature: float = 0.7, timeout: float = None,
+                              history: Optional[List[dict]] = None, priority: Optional[Priority] = None) -> AsyncIterator[str]:
+        """
+        Sends a prompt to the OpenAI API and yields the response text as it arrives.
+
+        The timeout applies to the whole generation, measured from the start of the request. Transient errors
+        before the first token are retried within it.
+        If the request fails before any text was produced, the same fallback text as in get_response is yielded.
+        If it fails midway, the stream ends after the text received so far.
+        Cached answers are yielded at once, and identical prompts in flight follow the running stream.
+
+        Args:
+            prompt (str): The user's message.
+            max_tokens (int, optional): Maximum number of tokens in the response. Defaults to the chosen route.
+            temperature (float): Sampling temperature.
+            timeout (float, optional): Overall timeout in seconds. Defaults to self.timeout.
+            history (List[dict], optional): Earlier messages of the conversation (see conversation_memory).
+            priority (Priority, optional): Sender class, used to choose the model (see model_router).
+
+        Yields:
+            str: Text deltas of the AI-generated response.
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        model, max_tokens = self._route(prompt, max_tokens, history, priority)
+        key = self._cache_key(prompt, max_tokens, history, model)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(key, MISSING)
+            metrics.record_lookup("response", cached is not MISSING)
+            if cached is not MISSING:
+                yield cached
+                return
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            produced = False
+            async for delta in flight.follow():
+                produced = True
+                yield delta
+            if produced or not flight.cancelled:
+                return
+        flight = self._in_flight[key] = _InFlight()
+        produced = False
+        fallback = None
+        try:
+            async for delta in self._stream_with_retry(
+                    prompt, max_tokens, temperature, resilience.Deadline(timeout), history, model):
+                produced = True
+                flight.publish(delta)
+                yield delta
+            flight.finish()
+            if self.response_cache is not None and produced:
+                self.response_cache.set(key, "".join(flight.chunks).strip())
         except Exception as e:
-            logging.error("Unerwarteter Fehler: %s", e)
-            return "Entschuldigung, ein unerwarteter Fehler ist aufgetreten."
+            fallback = self._fallback_for(e, timeout)
+            if not produced:
+                flight.publish(fallback)
+            flight.finish()
+        finally:
+            self._release_flight(key, flight)
+        if fallback and not produced:
+            yield fallback
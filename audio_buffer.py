@@ -0,0 +1,224 @@
+"""Audio buffer: Preallocated capture buffer, silence trimming and in-memory encoding for PTT recordings.
+
+The AudioRingBuffer copies every block from the sounddevice callback into one preallocated NumPy
+array instead of collecting a list of block copies. The array grows by doubling up to a maximum
+duration; beyond that it wraps around and keeps the most recent audio. trim_silence cuts leading and
+trailing silence with a vectorized energy VAD, find_pause locates pauses for cutting segments while
+recording continues, and encode_wav/encode_upload turn the recording into
+WAV or (with the optional soundfile package) FLAC bytes in memory, so nothing has to be written to disk
+before the upload.
+"""
+import io
+import logging
+import threading
+import wave
+from typing import Optional, Tuple
+import numpy as np
+try:
+    import soundfile  # optional, nur für den FLAC-Upload
+except ImportError:
+    soundfile = None
+
+class AudioRingBuffer:
+    """Growable ring buffer for mono or multi-channel audio samples.
+
+    Args:
+        samplerate (int): Sample rate in Hz.
+        channels (int): Number of channels.
+        initial_seconds (float): Initially allocated duration.
+        max_seconds (float): Maximum duration kept; older samples are overwritten beyond that.
+        dtype (str): NumPy sample type, e.g. ``int16``.
+    """
+    def __init__(self, samplerate: int = 16000, channels: int = 1, initial_seconds: float = 10.0,
+                 max_seconds: float = 120.0, dtype: str = "int16") -> None:
+        self.samplerate = samplerate
+        self.channels = channels
+        self.max_samples = max(int(max_seconds * samplerate), 1)
+        initial = min(max(int(initial_seconds * samplerate), 1), self.max_samples)
+        self._data = np.zeros((initial, channels), dtype=dtype)
+        self._write_pos = 0
+        self._length = 0
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        """Number of samples currently allocated."""
+        return len(self._data)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def total_written(self) -> int:
+        """Number of samples written since the last reset (absolute position of the next sample)."""
+        return self._total
+
+    @property
+    def duration(self) -> float:
+        """Duration of the buffered audio in seconds."""
+        return self._length / self.samplerate
+
+    def reset(self) -> None:
+        """Empties the buffer and keeps the allocation for the next recording."""
+        with self._lock:
+            self._write_pos = 0
+            self._length = 0
+            self._total = 0
+
+    def write(self, block: np.ndarray) -> None:
+        """Appends a block of samples (shape ``(frames, channels)``), e.g. from a sounddevice callback."""
+        frames = len(block)
+        if frames == 0:
+            return
+        with self._lock:
+            self._total += frames
+            if self._length + frames > len(self._data) and len(self._data) < self.max_samples:
+                self._grow(self._length + frames)
+            size = len(self._data)
+            if frames >= size:
+                # Block länger als der ganze Puffer: nur das Ende behalten
+                self._data[:] = block[-size:]
+                self._write_pos = 0
+                self._length = size
+                return
+            end = self._write_pos + frames
+            if end <= size:
+                self._data[self._write_pos:end] = block
+            else:
+                split = size - self._write_pos
+                self._data[self._write_pos:] = block[:split]
+                self._data[:frames - split] = block[split:]
+            self._write_pos = end % size
+            self._length = min(self._length + frames, size)
+
+    def read(self) -> np.ndarray:
+        """Returns the buffered samples in chronological order as a contiguous array."""
+        with self._lock:
+            if self._length < len(self._data):
+                return self._data[:self._length].copy()
+            # Puffer voll und umgelaufen: ältester Teil beginnt an der Schreibposition
+            return np.concatenate((self._data[self._write_pos:], self._data[:self._write_pos]))
+
+    def read_from(self, start: int) -> Tuple[int, np.ndarray]:
+        """Returns the samples from absolute position start (see total_written) up to now.
+
+        If start has already been overwritten, the result begins at the oldest buffered sample.
+
+        Returns:
+            Tuple[int, np.ndarray]: Actual absolute start position and a copy of the samples.
+        """
+        with self._lock:
+            oldest = self._total - self._length
+            start = min(max(start, oldest), self._total)
+            count = self._total - start
+            # Die Schreibposition markiert immer das Ende der gepufferten Daten
+            end = self._write_pos
+            indices = np.arange(end - count, end) % len(self._data)
+            return start, self._data[indices]
+
+    def _grow(self, needed: int) -> None:
+        size = len(self._data)
+        new_size = size
+        while new_size < needed:
+            new_size *= 2
+        new_size = min(new_size, self.max_samples)
+        grown = np.zeros((new_size, self.channels), dtype=self._data.dtype)
+        # Vor dem Vergrößern ist der Puffer nicht umgelaufen, die Daten liegen am Anfang
+        grown[:self._length] = self._data[:self._length]
+        self._data = grown
+        self._write_pos = self._length
+
+def encode_wav(samples: np.ndarray, samplerate: int) -> bytes:
+    """Encodes 16-bit PCM samples (shape ``(frames, channels)`` or ``(frames,)``) as WAV bytes in memory."""
+    samples = np.asarray(samples, dtype=np.int16)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(samplerate)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def _frame_levels(samples: np.ndarray, samplerate: int, frame_ms: int) -> Tuple[int, np.ndarray]:
+    """Returns the frame length in samples and the RMS level in dBFS of every complete frame."""
+    frame = max(int(samplerate * frame_ms / 1000), 1)
+    count = len(samples) // frame
+    mono = samples if samples.ndim == 1 else samples.mean(axis=1)
+    frames = mono[:count * frame].reshape(count, frame).astype(np.float32) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return frame, 20 * np.log10(np.maximum(rms, 1e-10))
+
+def find_pause(samples: np.ndarray, samplerate: int, threshold_db: float = -45.0, min_pause_ms: int = 500,
+               frame_ms: int = 20) -> Optional[int]:
+    """Finds the last pause of at least min_pause_ms after speech and returns the sample index of its middle.
+
+    Args:
+        samples (np.ndarray): Samples of shape ``(frames, channels)`` or ``(frames,)``.
+        samplerate (int): Sample rate in Hz.
+        threshold_db (float): Frames at or below this level (dBFS) count as silence.
+        min_pause_ms (int): Minimum pause length.
+        frame_ms (int): Frame length in milliseconds.
+
+    Returns:
+        Optional[int]: Cut position, or None if there is no such pause.
+    """
+    frame, level_db = _frame_levels(samples, samplerate, frame_ms)
+    silent = level_db <= threshold_db
+    if silent.all():
+        return None
+    # Grenzen der Stille-Abschnitte über die Änderungen des Stille-Flags bestimmen
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    first_voiced = int(np.argmin(silent))
+    long_pauses = np.flatnonzero((ends - starts) * frame_ms >= min_pause_ms)
+    long_pauses = long_pauses[starts[long_pauses] > first_voiced]
+    if not long_pauses.size:
+        return None
+    last = long_pauses[-1]
+    return int((starts[last] + ends[last]) // 2) * frame
+
+def trim_silence(samples: np.ndarray, samplerate: int, threshold_db: float = -45.0, frame_ms: int = 20,
+                 padding_ms: int = 200, min_speech_ms: int = 200) -> np.ndarray:
+    """Cuts leading and trailing silence from 16-bit PCM samples using the RMS energy of short frames.
+
+    Args:
+        samples (np.ndarray): Samples of shape ``(frames, channels)`` or ``(frames,)``.
+        samplerate (int): Sample rate in Hz.
+        threshold_db (float): Frames louder than this level (dBFS) count as speech.
+        frame_ms (int): Frame length in milliseconds.
+        padding_ms (int): Audio kept before the first and after the last speech frame.
+        min_speech_ms (int): Minimum total speech; shorter recordings are treated as empty.
+
+    Returns:
+        np.ndarray: A view of the speech part of samples, or an empty view if there is no speech.
+    """
+    frame, level_db = _frame_levels(samples, samplerate, frame_ms)
+    if not len(level_db):
+        return samples[:0]
+    voiced = np.flatnonzero(level_db > threshold_db)
+    if voiced.size * frame_ms < min_speech_ms:
+        return samples[:0]
+    pad = padding_ms // frame_ms
+    start = max(voiced[0] - pad, 0) * frame
+    end = min((voiced[-1] + 1 + pad) * frame, len(samples))
+    return samples[start:end]
+
+def encode_upload(samples: np.ndarray, samplerate: int, audio_format: str = "flac") -> Tuple[str, bytes]:
+    """Encodes 16-bit PCM samples for the transcription upload.
+
+    FLAC (lossless, usually about half the size of WAV) needs the optional soundfile package; without it,
+    or with audio_format "wav", WAV is used.
+
+    Returns:
+        Tuple[str, bytes]: File name (its extension tells the API the format) and encoded data.
+    """
+    if audio_format == "flac":
+        if soundfile is not None:
+            buffer = io.BytesIO()
+            soundfile.write(buffer, samples, samplerate, format="FLAC", subtype="PCM_16")
+            return "aufnahme.flac", buffer.getvalue()
+        logging.debug("soundfile nicht installiert, lade WAV statt FLAC hoch")
+    return "aufnahme.wav", encode_wav(samples, samplerate)
@@ -0,0 +1,228 @@
+"""Audio output: In-process PCM playback through one persistent sounddevice output stream.
+
+TTS audio is requested from ElevenLabs as raw 16-bit PCM and written into a sample queue that a single
+``sounddevice.OutputStream`` plays from. The stream stays open between utterances, so there is no
+process spawn, decoder start or device open per reply; when the queue runs empty the stream plays
+silence. A speak call returns shortly before its audio has finished (TTS_PREFETCH_SECONDS), so the next
+utterance is already being requested while the tail is still playing and follows without a gap.
+
+Volume (TTS_VOLUME) and ducking (TTS_DUCK_LEVEL, e.g. while the streamer holds push-to-talk) are applied
+in the stream callback with a short ramp to avoid clicks.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Deque, Iterable, Optional
+import numpy as np
+import sounddevice as sd
+from config import env_number
+import metrics
+
+# Von ElevenLabs angebotene PCM-Abtastraten (output_format=pcm_<rate>)
+SUPPORTED_SAMPLERATES = (16000, 22050, 24000, 44100)
+
+class PCMOutput:
+    """Gapless playback of 16-bit PCM chunks through one persistent output stream.
+
+    Args:
+        samplerate (int): Sample rate of the PCM data and the output stream.
+        channels (int): Number of channels of the PCM data.
+        volume (float): Output volume between 0 and 1.
+        duck_level (float): Volume factor while ducked.
+        prefetch_seconds (float): Audio still queued when play returns, so the next utterance can start
+            loading before the current one has finished.
+    """
+    def __init__(self, samplerate: int = 22050, channels: int = 1, volume: float = 1.0, duck_level: float = 0.3,
+                 prefetch_seconds: float = 0.5) -> None:
+        self.samplerate = samplerate
+        self.channels = channels
+        self.volume = min(max(volume, 0.0), 1.0)
+        self.duck_level = min(max(duck_level, 0.0), 1.0)
+        self.prefetch_seconds = max(prefetch_seconds, 0.0)
+        self.ducked = False
+        self._chunks: Deque[np.ndarray] = collections.deque()
+        self._offset = 0
+        self._written = 0
+        self._played = 0
+        self._gain = self.gain
+        self._cond = threading.Condition()
+        self._stream: Any = None
+
+    @property
+    def gain(self) -> float:
+        """Current target gain (volume, reduced while ducked)."""
+        return self.volume * (self.duck_level if self.ducked else 1.0)
+
+    @property
+    def buffered(self) -> float:
+        """Seconds of audio queued but not yet played."""
+        with self._cond:
+            return (self._written - self._played) / self.samplerate
+
+    def open(self) -> None:
+        """Opens and starts the output stream.
+
+        Raises:
+            sd.PortAudioError: If no output device is available or the sample rate is not supported.
+        """
+        if self._stream is None:
+            stream = sd.OutputStream(samplerate=self.samplerate, channels=self.channels, dtype="int16", callback=self._callback)
+            stream.start()
+            self._stream = stream
+            logging.info("Audioausgabe geöffnet (%d Hz, %d Kanal/Kanäle)", self.samplerate, self.channels)
+
+    def close(self) -> None:
+        """Stops and closes the output stream and drops queued audio."""
+        self.clear()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def set_volume(self, volume: float) -> None:
+        """Sets the output volume (0 to 1); the change is ramped in the next audio block."""
+        self.volume = min(max(volume, 0.0), 1.0)
+
+    def duck(self) -> None:
+        """Lowers the volume to duck_level, e.g. while someone speaks."""
+        self.ducked = True
+
+    def unduck(self) -> None:
+        """Restores the normal volume."""
+        self.ducked = False
+
+    def write(self, samples: np.ndarray) -> None:
+        """Queues int16 samples of shape ``(frames, channels)`` for playback."""
+        if not len(samples):
+            return
+        with self._cond:
+            self._chunks.append(samples)
+            self._written += len(samples)
+
+    def clear(self) -> None:
+        """Drops all queued audio; playback continues with silence."""
+        with self._cond:
+            self._chunks.clear()
+            self._offset = 0
+            self._played = self._written
+            self._cond.notify_all()
+
+    def play(self, chunks: Iterable[bytes], stop_event: Optional[threading.Event] = None) -> bool:
+        """Queues raw PCM chunks as they arrive and waits until the utterance has (almost) finished.
+
+        Args:
+            chunks (Iterable[bytes]): Little-endian 16-bit PCM data, e.g. from ``Response.iter_content``.
+            stop_event (threading.Event, optional): When set, download and playback are aborted and the
+                queued audio is dropped.
+
+        Returns:
+            bool: True (playback finished or was stopped).
+        """
+        started = time.perf_counter()
+        frame_bytes = 2 * self.channels
+        remainder = b""
+        for chunk in chunks:
+            if stop_event is not None and stop_event.is_set():
+                break
+            data = remainder + chunk if remainder else chunk
+            usable = len(data) - len(data) % frame_bytes
+            remainder = data[usable:]
+            if usable:
+                self.write(np.frombuffer(data[:usable], dtype="<i2").reshape(-1, self.channels))
+        with self._cond:
+            end = self._written
+        lead = int(self.prefetch_seconds * self.samplerate)
+        if not self._wait_played(end - lead, stop_event):
+            self.clear()
+            logging.info("TTS-Wiedergabe abgebrochen")
+        metrics.PLAYBACK.observe(time.perf_counter() - started)
+        return True
+
+    def _wait_played(self, position: int, stop_event: Optional[threading.Event]) -> bool:
+        """Waits until playback has reached position; returns False if stop_event was set first."""
+        with self._cond:
+            while self._played < position:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                if self._stream is None:
+                    # Ohne geöffneten Stream wird nie etwas abgespielt
+                    return True
+                self._cond.wait(timeout=0.1)
+        return stop_event is None or not stop_event.is_set()
+
+    def _callback(self, outdata: np.ndarray, frames: int, _time_info: Any, _status: Any) -> None:
+        """sounddevice callback: copies queued samples into outdata, silence when the queue is empty."""
+        filled = 0
+        with self._cond:
+            while filled < frames and self._chunks:
+                chunk = self._chunks[0]
+                take = min(frames - filled, len(chunk) - self._offset)
+                outdata[filled:filled + take] = chunk[self._offset:self._offset + take]
+                filled += take
+                self._offset += take
+                if self._offset == len(chunk):
+                    self._chunks.popleft()
+                    self._offset = 0
+            self._played += filled
+            if filled:
+                self._cond.notify_all()
+        outdata[filled:] = 0
+        target = self.gain
+        if filled and (self._gain != 1.0 or target != 1.0):
+            # Lautstärkeänderung über den Block verteilen, damit es nicht knackt
+            ramp = np.linspace(self._gain, target, frames, dtype=np.float32)[:, None]
+            outdata[:] = np.clip(outdata * ramp, -32768, 32767).astype(np.int16)
+        self._gain = target
+
+_lock = threading.Lock()
+_shared: Optional[PCMOutput] = None
+_unavailable = False
+
+def pcm_enabled() -> bool:
+    """True if TTS should play through the in-process engine (TTS_OUTPUT=pcm, the default)."""
+    return os.environ.get("TTS_OUTPUT", "pcm").lower() == "pcm"
+
+def shared_output() -> Optional[PCMOutput]:
+    """Returns the shared, opened PCM output, creating it on first use.
+
+    Settings: TTS_PCM_SAMPLERATE (default 22050; 16000, 22050, 24000 or 44100), TTS_VOLUME (default 1.0),
+    TTS_DUCK_LEVEL (default 0.3) and TTS_PREFETCH_SECONDS (default 0.5).
+
+    Returns:
+        Optional[PCMOutput]: The output, or None if no output device could be opened (the caller then
+        falls back to an external player).
+    """
+    global _shared, _unavailable
+    with _lock:
+        if _shared is None and not _unavailable:
+            samplerate = int(env_number("TTS_PCM_SAMPLERATE", 22050))
+            if samplerate not in SUPPORTED_SAMPLERATES:
+                logging.warning("TTS_PCM_SAMPLERATE %d nicht unterstützt, verwende 22050", samplerate)
+                samplerate = 22050
+            output = PCMOutput(
+                samplerate=samplerate,
+                volume=env_number("TTS_VOLUME", 1.0),
+                duck_level=env_number("TTS_DUCK_LEVEL", 0.3),
+                prefetch_seconds=env_number("TTS_PREFETCH_SECONDS", 0.5),
+            )
+            try:
+                output.open()
+                _shared = output
+            except (sd.PortAudioError, OSError, ValueError) as exc:
+                _unavailable = True
+                logging.warning("Audioausgabe nicht verfügbar, verwende externen Player: %s", exc)
+        return _shared
+
+def current_output() -> Optional[PCMOutput]:
+    """Returns the shared PCM output if it has been opened, without opening it."""
+    return _shared
+
+def close_shared() -> None:
+    """Closes the shared PCM output."""
+    global _shared
+    with _lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
@@ -0,0 +1,278 @@
+"""Load test: Offline end-to-end latency and throughput of the bot against local stub servers.
+
+Usage:
+    python benchmarks/load_test.py --duration 30 --chat-rate 5 --join-rate 2 --ptt-rate 0.2
+
+The bot runs without a Twitch connection: OpenAI, Whisper, ElevenLabs and Helix are replaced by the
+stub servers from stub_servers.py (configurable latency, jitter and error rate), chat messages go to
+a recording channel and TTS audio is discarded instead of played. A synthetic driver pushes
+``@nicole`` messages through ``Bot.event_message``, joins through ``Bot.event_join`` and recordings
+through ``PTTRecorder`` at fixed rates and measures:
+
+- chat: from the incoming message until the reply mentioning the user (AI answer or notice) is sent,
+- join: from the join until the greeting mentioning the user is sent,
+- ptt: from handing the recording to the recorder until the reply has been processed.
+
+At the end, p50/p95/p99 latency and completed events per second are printed per kind, together with
+admission rejections, chat queue and TTS figures. Bot settings (AI_MAX_CONCURRENCY, OPENAI_STREAM, ...)
+are read from the environment as usual; the real .env is not loaded, so no real API is contacted.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_servers import StubConfig, StubServers
+
+MENTION = re.compile(r"@(\w+)")
+PTT_SAMPLES = re.compile(r"Aufnahme mit (\d+) Samples")
+SAMPLERATE = 16000
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+class LatencyTracker:
+    """Start and completion times of the synthetic events, per kind (chat, join, ptt)."""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started: Dict[str, int] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self._pending: Dict[str, tuple] = {}
+
+    def start(self, kind: str, key: str) -> None:
+        """Records the start of an event identified by key."""
+        with self._lock:
+            self.started[kind] = self.started.get(kind, 0) + 1
+            self._pending[key] = (kind, time.perf_counter())
+
+    def finish(self, key: str) -> None:
+        """Records the completion of the event identified by key (unknown or finished keys are ignored)."""
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                kind, started = entry
+                self.latencies.setdefault(kind, []).append(now - started)
+
+    def open(self, kind: str) -> int:
+        """Number of started events of kind that have not completed."""
+        with self._lock:
+            return sum(1 for pending_kind, _ in self._pending.values() if pending_kind == kind)
+
+class RecordingChannel:
+    """Chat channel stand-in: completes every event whose user is mentioned in a sent message."""
+    name = "benchkanal"
+
+    def __init__(self, tracker: LatencyTracker) -> None:
+        self.tracker = tracker
+        self.messages = 0
+
+    async def send(self, message: str) -> None:
+        self.messages += 1
+        for login in MENTION.findall(message):
+            self.tracker.finish(login.lower())
+
+class Author:
+    """Chat author stand-in with the attributes read by Bot.event_message."""
+    def __init__(self, name: str, is_subscriber: bool = False) -> None:
+        self.name = name
+        self.is_subscriber = is_subscriber
+        self.is_mod = False
+
+class Message:
+    """Chat message stand-in."""
+    def __init__(self, content: str, author: Author, channel: RecordingChannel) -> None:
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.echo = False
+
+class JoinUser:
+    """Join event user stand-in."""
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+def discard_audio(chunks: Iterable[bytes], stop_event: Optional[threading.Event] = None) -> bool:
+    """Replacement for tts.play_audio_stream that reads the audio stream without playing it."""
+    for _chunk in chunks:
+        if stop_event is not None and stop_event.is_set():
+            break
+    return True
+
+def configure_environment(args: argparse.Namespace, stubs: StubServers) -> None:
+    """Points the bot at the stub servers and sets benchmark defaults that the environment can override."""
+    os.environ.update(stubs.environment())
+    defaults = {
+        "TMI_TOKEN": "benchmark",
+        "CLIENT_ID": "benchmark",
+        "TWITCH_CHANNEL": RecordingChannel.name,
+        "OPENAI_API_KEY": "benchmark",
+        "ELEVENLABS_API_KEY": "benchmark",
+        "TRANSCRIPTION_BACKEND": "openai",
+        "TTS_OUTPUT": "player",
+        "KI_ACCESS_LEVEL": args.access_level,
+        "LOG_LEVEL": "WARNING",
+    }
+    if not args.twitch_limits:
+        # Ohne Twitch-Limits misst der Lauf die Pipeline des Bots statt der Chat-Drosselung
+        defaults.update({"CHAT_RATE_LIMIT": "100000", "CHAT_BURST": "1000", "GREETING_BUDGET": "100000"})
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    # Die Stub-Transkription erkennt die Aufnahme nur an der Sample-Zahl im WAV-Header
+    os.environ["PTT_UPLOAD_FORMAT"] = "wav"
+
+async def drive(rate: float, duration: float, action) -> None:
+    """Calls action(index) rate times per second for duration seconds (open loop, fixed interval)."""
+    if rate <= 0:
+        return
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    index = 0
+    while index * interval < duration:
+        delay = started + index * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        action(index)
+        index += 1
+
+async def run(args: argparse.Namespace) -> Tuple[LatencyTracker, dict]:
+    """Runs the load against a bot instance and returns the measurements and a summary of the bot's state."""
+    import main
+    import tts
+    from ptt import PTTRecorder
+    from transcription import create_transcriber
+
+    tts.play_audio_stream = discard_audio
+    tracker = LatencyTracker()
+    bot = main.Bot()
+    type(bot).nick = property(lambda _self: "saarvisbench")
+    channel = RecordingChannel(tracker)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    def spawn(coro) -> None:
+        # twitchio startet jedes Event als eigene Task
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def ptt_done(prompt: str) -> None:
+        match = PTT_SAMPLES.search(prompt.rsplit("\n", 1)[-1])
+        future = asyncio.run_coroutine_threadsafe(bot.send_ptt_message(prompt), loop)
+        if match:
+            future.add_done_callback(lambda _future: tracker.finish(f"ptt{match.group(1)}"))
+
+    recorder = PTTRecorder(send_chat_callback=ptt_done, transcriber=create_transcriber("openai"))
+    tone = (np.sin(np.arange(SAMPLERATE * args.ptt_seconds) * 2 * np.pi * 220 / SAMPLERATE) * 8000).astype(np.int16)
+
+    def chat_event(index: int) -> None:
+        login = f"zuschauer{index:05d}"
+        tracker.start("chat", login)
+        message = Message(f"@nicole Frage Nummer {index}?", Author(login, index % 4 == 0), channel)
+        spawn(bot.event_message(message))
+
+    def join_event(index: int) -> None:
+        login = f"gast{index:05d}"
+        tracker.start("join", login)
+        spawn(bot.event_join(channel, JoinUser(login)))
+
+    def ptt_event(index: int) -> None:
+        # Die Länge der Aufnahme kennzeichnet das Ereignis im Transkript des Stub-Servers
+        samples = np.concatenate((tone, tone[:index + 1])).reshape(-1, 1)
+        tracker.start("ptt", f"ptt{len(samples)}")
+        loop.run_in_executor(None, recorder.handle_transcription_and_ai, samples)
+
+    await bot.ai.warm_up()
+    await bot.helix.resolve_channel_id()
+    started = time.perf_counter()
+    await asyncio.gather(
+        drive(args.chat_rate, args.duration, chat_event),
+        drive(args.join_rate, args.duration, join_event),
+        drive(args.ptt_rate, args.duration, ptt_event),
+    )
+    # Auf ausstehende Antworten warten, höchstens drain Sekunden
+    deadline = time.perf_counter() + args.drain
+    while time.perf_counter() < deadline and any(tracker.open(kind) for kind in ("chat", "join", "ptt")):
+        await asyncio.sleep(0.05)
+    summary = {
+        "elapsed": time.perf_counter() - started,
+        "rejected": dict(bot.admission.rejected),
+        "chat": bot.chat.stats(),
+        "tts_dropped": bot.playback.dropped,
+        "channel_messages": channel.messages,
+    }
+    try:
+        await bot.close()
+    except AttributeError:
+        # Ohne Twitch-Verbindung gibt es keine IRC-Verbindung zu schließen
+        pass
+    recorder.segment_pool.shutdown(wait=False)
+    return tracker, summary
+
+def report(tracker: LatencyTracker, summary: dict, stubs: StubServers) -> None:
+    """Prints latency percentiles and throughput per event kind."""
+    print(f"\n{'Art':<6}{'gestartet':>10}{'fertig':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'pro s':>8}")
+    for kind in ("chat", "join", "ptt"):
+        started = tracker.started.get(kind, 0)
+        if not started:
+            continue
+        latencies = tracker.latencies.get(kind, [])
+        if latencies:
+            p50, p95, p99 = (percentile(latencies, f) for f in (0.5, 0.95, 0.99))
+            figures = f"{p50:>8.3f}s{p95:>8.3f}s{p99:>8.3f}s"
+        else:
+            figures = f"{'-':>9}{'-':>9}{'-':>9}"
+        print(f"{kind:<6}{started:>10}{len(latencies):>8}{figures}{len(latencies) / summary['elapsed']:>8.2f}")
+    print(f"\nLaufzeit: {summary['elapsed']:.1f}s, Chat-Nachrichten gesendet: {summary['channel_messages']}")
+    print(f"Abgelehnte KI-Anfragen: {summary['rejected'] or 0}")
+    stats = summary["chat"]
+    print(f"Chat-Warteschlange: max. Tiefe {stats['max_depth']}, zusammengefasst {stats['coalesced']}, "
+          f"mittlere Latenz {stats['avg_latency']:.3f}s, max. {stats['max_latency']:.3f}s")
+    print(f"TTS verworfen (Warteschlange voll): {summary['tts_dropped']}")
+    print(f"Stub-Anfragen: {stubs.requests}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Misst Latenz und Durchsatz des Bots gegen lokale Stub-Server.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Dauer der Last in Sekunden")
+    parser.add_argument("--drain", type=float, default=15.0, help="maximale Wartezeit auf ausstehende Antworten")
+    parser.add_argument("--chat-rate", type=float, default=5.0, help="@nicole-Nachrichten pro Sekunde")
+    parser.add_argument("--join-rate", type=float, default=2.0, help="Joins pro Sekunde")
+    parser.add_argument("--ptt-rate", type=float, default=0.2, help="PTT-Aufnahmen pro Sekunde")
+    parser.add_argument("--ptt-seconds", type=float, default=3.0, help="Länge einer PTT-Aufnahme")
+    parser.add_argument("--access-level", default="all", choices=("all", "sub", "follower"), help="KI_ACCESS_LEVEL")
+    parser.add_argument("--twitch-limits", action="store_true", help="Chat- und Begrüßungslimits wie auf Twitch")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="Sekunden bis zum ersten Token")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Sekunden zwischen gestreamten Tokens")
+    parser.add_argument("--whisper-latency", type=float, default=0.5, help="Sekunden pro Transkription")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="Sekunden bis zum ersten Audio-Chunk")
+    parser.add_argument("--helix-latency", type=float, default=0.1, help="Sekunden pro Helix-Anfrage")
+    parser.add_argument("--jitter", type=float, default=0.1, help="zusätzliche zufällige Latenz (bis zu Sekunden)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil fehlschlagender Upstream-Anfragen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    def stub(latency: float) -> StubConfig:
+        return StubConfig(latency=latency, jitter=args.jitter, error_rate=args.error_rate)
+    stubs = StubServers(
+        openai=stub(args.openai_latency), whisper=stub(args.whisper_latency), elevenlabs=stub(args.tts_latency),
+        helix=stub(args.helix_latency), token_interval=args.token_interval,
+    ).start()
+    try:
+        configure_environment(args, stubs)
+        tracker, summary = asyncio.run(run(args))
+    finally:
+        stubs.stop()
+    report(tracker, summary, stubs)
+
+if __name__ == "__main__":
+    main()
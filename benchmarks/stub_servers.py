@@ -0,0 +1,218 @@
+"""Stub servers: Local stand-ins for OpenAI, ElevenLabs and Twitch Helix with configurable latency and errors.
+
+The servers speak just enough of each API for the bot's clients:
+
+- OpenAI: ``POST /v1/chat/completions`` (complete and streamed as server-sent events) and
+  ``POST /v1/audio/transcriptions`` (plain text; for WAV uploads the transcript names the number of
+  samples, so a load driver can match transcripts to recordings).
+- ElevenLabs: ``POST /v1/text-to-speech/{voice_id}/stream`` (chunked dummy audio).
+- Helix: ``GET /helix/users`` and ``GET /helix/users/follows``.
+
+All servers run on one aiohttp application in a background thread with its own event loop, so their
+work does not compete with the bot's loop. Point the bot at them with OPENAI_BASE_URL,
+ELEVENLABS_BASE_URL and TWITCH_HELIX_BASE_URL (see StubServers.environment).
+"""
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+import wave
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional
+from aiohttp import web
+
+@dataclass
+class StubConfig:
+    """Latency and error behaviour of one stubbed upstream.
+
+    Args:
+        latency (float): Seconds until the response starts.
+        jitter (float): Additional uniformly distributed delay of up to this many seconds.
+        error_rate (float): Fraction of requests answered with HTTP 500.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+    async def delay(self) -> None:
+        """Waits for the configured latency plus jitter."""
+        await asyncio.sleep(self.latency + random.uniform(0.0, self.jitter))
+
+    def fails(self) -> bool:
+        """Returns True if this request should fail."""
+        return random.random() < self.error_rate
+
+class StubServers:
+    """OpenAI, ElevenLabs and Helix stubs on one local port.
+
+    Args:
+        openai (StubConfig): Chat completion behaviour (latency until the first token).
+        whisper (StubConfig): Transcription behaviour.
+        elevenlabs (StubConfig): TTS behaviour (latency until the first audio chunk).
+        helix (StubConfig): Helix behaviour.
+        reply (str): Text of every chat completion.
+        token_interval (float): Seconds between streamed tokens.
+        audio_chunks (int): Number of 4 KiB chunks of dummy audio per TTS request.
+        audio_chunk_interval (float): Seconds between audio chunks.
+        follower_rate (float): Fraction of users reported as followers.
+    """
+    def __init__(self, openai: Optional[StubConfig] = None, whisper: Optional[StubConfig] = None,
+                 elevenlabs: Optional[StubConfig] = None, helix: Optional[StubConfig] = None,
+                 reply: str = "Das ist eine Antwort vom Stub-Server. Sie besteht aus zwei kurzen Sätzen.",
+                 token_interval: float = 0.02, audio_chunks: int = 8, audio_chunk_interval: float = 0.01,
+                 follower_rate: float = 0.5) -> None:
+        self.openai = openai or StubConfig()
+        self.whisper = whisper or StubConfig()
+        self.elevenlabs = elevenlabs or StubConfig()
+        self.helix = helix or StubConfig()
+        self.reply = reply
+        self.token_interval = token_interval
+        self.audio_chunks = audio_chunks
+        self.audio_chunk_interval = audio_chunk_interval
+        self.follower_rate = follower_rate
+        self.requests: Dict[str, int] = {}
+        self.port: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        """Base URL of the running servers."""
+        return f"http://127.0.0.1:{self.port}"
+
+    def environment(self) -> Dict[str, str]:
+        """Environment variables that point the bot's clients at the stubs."""
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "ELEVENLABS_BASE_URL": self.base_url,
+            "TWITCH_HELIX_BASE_URL": f"{self.base_url}/helix",
+        }
+
+    def start(self) -> "StubServers":
+        """Starts the servers in a background thread and waits until they accept connections."""
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stub-servers")
+        self._thread.start()
+        if not self._started.wait(timeout=10):
+            raise RuntimeError("Stub-Server konnten nicht gestartet werden")
+        return self
+
+    def stop(self) -> None:
+        """Stops the servers and their thread."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self._app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.port = self._runner.addresses[0][1]
+        self._started.set()
+        self._loop.run_forever()
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        app.router.add_post("/v1/audio/transcriptions", self._transcriptions)
+        app.router.add_post("/v1/text-to-speech/{voice_id}/stream", self._text_to_speech)
+        app.router.add_get("/helix/users", self._helix_users)
+        app.router.add_get("/helix/users/follows", self._helix_follows)
+        # Vorwärmen der Verbindungen per HEAD auf die Basis-URLs
+        app.router.add_route("HEAD", "/{tail:.*}", self._head)
+        return app
+
+    def _count(self, name: str) -> None:
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    @staticmethod
+    def _error() -> web.Response:
+        return web.json_response({"error": {"message": "Stub-Fehler", "type": "server_error"}}, status=500)
+
+    async def _head(self, _request: web.Request) -> web.Response:
+        return web.Response()
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self._count("chat")
+        body = await request.json()
+        await self.openai.delay()
+        if self.openai.fails():
+            return self._error()
+        created = int(time.time())
+        base = {"id": "chatcmpl-stub", "created": created, "model": body.get("model", "stub")}
+        if not body.get("stream"):
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}, "finish_reason": "stop"}],
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = self.reply.split(" ")
+        for index, word in enumerate(words):
+            delta = word if index == 0 else " " + word
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.token_interval)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _transcriptions(self, request: web.Request) -> web.Response:
+        self._count("transcription")
+        audio = b""
+        async for part in await request.multipart():
+            if part.name == "file":
+                audio = await part.read()
+        await self.whisper.delay()
+        if self.whisper.fails():
+            return self._error()
+        try:
+            with wave.open(io.BytesIO(audio), "rb") as wav_file:
+                text = f"Aufnahme mit {wav_file.getnframes()} Samples"
+        except (wave.Error, EOFError):
+            text = f"Aufnahme mit {len(audio)} Bytes"
+        return web.Response(text=text + "\n", content_type="text/plain")
+
+    async def _text_to_speech(self, request: web.Request) -> web.StreamResponse:
+        self._count("tts")
+        await request.read()
+        await self.elevenlabs.delay()
+        if self.elevenlabs.fails():
+            return web.json_response({"detail": "Stub-Fehler"}, status=500)
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+        for _ in range(self.audio_chunks):
+            await response.write(b"\xff" * 4096)
+            await asyncio.sleep(self.audio_chunk_interval)
+        await response.write_eof()
+        return response
+
+    async def _helix_users(self, request: web.Request) -> web.Response:
+        self._count("helix")
+        await self.helix.delay()
+        if self.helix.fails():
+            return self._error()
+        logins = request.query.getall("login", [])
+        return web.json_response({"data": [{"id": str(zlib.crc32(login.encode("utf-8"))), "login": login} for login in logins]})
+
+    async def _helix_follows(self, request: web.Request) -> web.Response:
+        self._count("helix")
+        await self.helix.delay()
+        if self.helix.fails():
+            return self._error()
+        # Deterministisch pro Nutzer, damit wiederholte Prüfungen dasselbe Ergebnis liefern
+        follows = (zlib.crc32(request.query.get("from_id", "").encode("utf-8")) % 1000) < self.follower_rate * 1000
+        return web.json_response({"total": int(follows), "data": []})
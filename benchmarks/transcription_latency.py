@@ -0,0 +1,76 @@
+"""Transcription latency: Compares the configured transcription backends on recorded utterances.
+
+Usage:
+    python benchmarks/transcription_latency.py aufnahme1.wav aufnahme2.wav --backends openai local --runs 5
+
+Every file must be a 16 kHz, 16-bit mono WAV (e.g. a PTT recording). Each backend transcribes each file
+``--runs`` times after one warm-up run; the script prints median, p95 and maximum latency per backend
+and the real-time factor (processing time / audio duration). The backends read their settings from the
+environment (.env), like the bot itself.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import wave
+from typing import Dict, List
+import dotenv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from audio_buffer import trim_silence
+from transcription import create_transcriber
+
+def load_wav(path: str) -> np.ndarray:
+    """Reads a 16 kHz, 16-bit mono WAV file into an int16 array of shape (frames, 1)."""
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getframerate() != 16000 or wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+            raise ValueError(f"{path}: erwartet 16 kHz, 16 Bit, mono")
+        frames = wav_file.readframes(wav_file.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).reshape(-1, 1)
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vergleicht die Latenz der Transkriptions-Backends.")
+    parser.add_argument("files", nargs="+", help="16-kHz-Mono-WAV-Dateien")
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"], help="zu vergleichende Backends")
+    parser.add_argument("--runs", type=int, default=5, help="Messläufe pro Datei")
+    parser.add_argument("--no-trim", action="store_true", help="Stille nicht vor der Transkription entfernen")
+    args = parser.parse_args()
+    dotenv.load_dotenv()
+    recordings = [load_wav(path) for path in args.files]
+    if not args.no_trim:
+        recordings = [trim_silence(samples, 16000) for samples in recordings]
+    audio_seconds = sum(len(samples) for samples in recordings) / 16000
+    results: Dict[str, List[float]] = {}
+    for name in args.backends:
+        backend = create_transcriber(name)
+        try:
+            started = time.perf_counter()
+            backend.transcribe(recordings[0], 16000)  # Aufwärmen: Verbindung bzw. Modell laden
+            print(f"{name}: erster Aufruf {time.perf_counter() - started:.2f}s")
+            latencies = []
+            for _ in range(args.runs):
+                for samples in recordings:
+                    started = time.perf_counter()
+                    text = backend.transcribe(samples, 16000)
+                    latencies.append(time.perf_counter() - started)
+            results[name] = latencies
+            print(f"{name}: letztes Transkript: {text!r}")
+        except Exception as exc:
+            print(f"{name}: fehlgeschlagen: {exc}")
+        finally:
+            backend.close()
+    print(f"\n{'Backend':<10}{'Median':>10}{'p95':>10}{'Max':>10}{'RTF':>8}")
+    for name, latencies in results.items():
+        rtf = sum(latencies) / (audio_seconds * args.runs) if audio_seconds else 0.0
+        print(f"{name:<10}{statistics.median(latencies):>9.2f}s{percentile(latencies, 0.95):>9.2f}s"
+              f"{max(latencies):>9.2f}s{rtf:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Chat output: Rate-limited, ordered sending of chat messages.
+
+Twitch drops messages silently when an account sends too many within 30 seconds (20 for normal
+accounts, 100 for mods and the broadcaster). The ChatOutbox queues outgoing messages per channel,
+sends them in order through a token bucket sized to these limits and, while messages have to wait,
+merges queued short messages of the same channel into one chat line.
+"""
+import asyncio
+import collections
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+from config import env_number
+import metrics
+
+MAX_MESSAGE_LENGTH = 500
+
+class TokenBucket:
+    """Token bucket: up to ``capacity`` sends at once, refilled at ``rate`` tokens per second.
+
+    Args:
+        capacity (float): Maximum number of stored tokens (burst size).
+        rate (float): Tokens added per second.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    def __init__(self, capacity: float, rate: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.capacity = max(capacity, 1.0)
+        self.rate = rate
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until a token is available."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+@dataclass
+class _Outgoing:
+    text: str
+    posted_at: float
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+class ChatOutbox:
+    """Sends chat messages in order per channel within the Twitch rate limits.
+
+    The token bucket allows ``burst`` messages at once and refills so that at most ``limit`` messages
+    are sent in any window of ``window`` seconds (burst + refill per window = limit).
+
+    Args:
+        limit (int): Messages allowed per window.
+        window (float): Window length in seconds.
+        burst (int): Messages that may be sent back-to-back.
+        max_length (int): Maximum length of a merged chat line.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    def __init__(self, limit: int = 20, window: float = 30.0, burst: int = 5, max_length: int = MAX_MESSAGE_LENGTH,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        burst = min(max(burst, 1), limit)
+        self.bucket = TokenBucket(burst, max(limit - burst, 1) / window, clock)
+        self.max_length = max_length
+        self.clock = clock
+        self.sent: int = 0
+        self.coalesced: int = 0
+        self.failed: int = 0
+        self.max_depth: int = 0
+        self.total_latency: float = 0.0
+        self.max_latency: float = 0.0
+        self._queues: "collections.OrderedDict[Any, Deque[_Outgoing]]" = collections.OrderedDict()
+        self._channels: Dict[Any, Any] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "ChatOutbox":
+        """Creates an outbox from CHAT_BOT_IS_MOD (default false: 20 messages per 30s, true: 100),
+        CHAT_RATE_LIMIT and CHAT_RATE_WINDOW (override the limit) and CHAT_BURST (default 5)."""
+        is_mod = os.environ.get("CHAT_BOT_IS_MOD", "false").lower() in ("1", "true", "yes", "on")
+        return cls(
+            limit=int(env_number("CHAT_RATE_LIMIT", 100 if is_mod else 20)),
+            window=env_number("CHAT_RATE_WINDOW", 30.0),
+            burst=int(env_number("CHAT_BURST", 5)),
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting to be sent."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def post(self, channel: Any, text: str) -> asyncio.Future:
+        """Queues text for channel and returns immediately.
+
+        Returns:
+            asyncio.Future: Resolves to True when the message was sent, False if sending failed.
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        key = getattr(channel, "name", None) or id(channel)
+        self._channels[key] = channel
+        self._queues.setdefault(key, collections.deque()).append(_Outgoing(text, self.clock(), [future]))
+        self.max_depth = max(self.max_depth, self.depth)
+        self._wakeup.set()
+        return future
+
+    async def send(self, channel: Any, text: str) -> bool:
+        """Queues text for channel and waits until it was sent (see post)."""
+        return await self.post(channel, text)
+
+    def stats(self) -> dict:
+        """Returns queue depth and send latency metrics."""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "avg_latency": self.total_latency / self.sent if self.sent else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+    async def aclose(self) -> None:
+        """Stops the sender; waiting messages are discarded."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for queue in self._queues.values():
+            for outgoing in queue:
+                self._resolve(outgoing, False)
+        self._queues.clear()
+
+    def _start(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sender(), name="chat-outbox")
+
+    def _next_message(self) -> tuple:
+        """Pops the next message round-robin over channels and merges queued messages that still fit."""
+        key, queue = next(iter(self._queues.items()))
+        self._queues.move_to_end(key)
+        outgoing = queue.popleft()
+        while queue and len(outgoing.text) + 1 + len(queue[0].text) <= self.max_length:
+            merged = queue.popleft()
+            outgoing.text += " " + merged.text
+            outgoing.futures.extend(merged.futures)
+            self.coalesced += 1
+        if not queue:
+            del self._queues[key]
+        return self._channels[key], outgoing
+
+    @staticmethod
+    def _resolve(outgoing: _Outgoing, result: bool) -> None:
+        for future in outgoing.futures:
+            if not future.done():
+                future.set_result(result)
+
+    async def _sender(self) -> None:
+        while True:
+            if not self._queues:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self.bucket.try_take()
+            if delay > 0:
+                # Während des Wartens können weitere Nachrichten eintreffen und zusammengefasst werden
+                await asyncio.sleep(delay)
+                continue
+            channel, outgoing = self._next_message()
+            try:
+                await channel.send(outgoing.text)
+            except Exception as exc:
+                self.failed += 1
+                metrics.ERRORS.inc(stage="chat")
+                logging.error("Chat-Nachricht konnte nicht gesendet werden: %s", exc)
+                self._resolve(outgoing, False)
+                continue
+            latency = self.clock() - outgoing.posted_at
+            self.sent += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            metrics.CHAT_SEND_DELAY.observe(latency)
+            if self.depth:
+                logging.debug("Chat-Warteschlange: %d Nachrichten, Latenz %.2fs", self.depth, latency)
+            self._resolve(outgoing, True)
@@ -0,0 +1,9 @@
+"""Config: Helpers for reading settings from environment variables."""
+import os
+
+def env_number(name: str, default: float) -> float:
+    """Reads a numeric environment variable, falling back to default on missing or invalid values."""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
@@ -0,0 +1,128 @@
+"""Conversation memory: Per-user chat history with a token budget for the prompt.
+
+Each conversation (key: channel and user) keeps its last turns in a bounded deque together with the
+token count of every turn, counted once when the turn is added. When a prompt is built, the newest
+turns are taken until the token budget (minus the tokens reserved for the system prompt and the new
+question) is used up, so prompts never grow without bound. Conversations that are idle for longer
+than the idle time, or the least recently used ones beyond the maximum number, are forgotten.
+
+With a state store (STATE_DB), every conversation is also written to SQLite after each exchange and
+restored at startup, so viewers can continue a conversation across a restart.
+"""
+import collections
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, Deque, Hashable, List, Optional
+from config import env_number
+from admission import estimate_tokens
+from state_store import StateStore
+from ttl_cache import TTLCache
+
+@dataclass(frozen=True)
+class Turn:
+    """A message of a conversation with its token count."""
+    role: str
+    content: str
+    tokens: int
+
+class ConversationMemory:
+    """Bounded multi-turn history per conversation key.
+
+    Args:
+        token_budget (int): Tokens available for the whole prompt (history, system prompt and question).
+        max_turns (int): Messages kept per conversation (a question and its answer are two messages).
+        idle_ttl (float): Seconds after the last exchange until a conversation is forgotten.
+        max_conversations (int): Conversations kept at most; the least recently used is evicted first.
+        count_tokens (Callable[[str], int]): Token counter; defaults to an estimate of four characters per token.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+        state (StateStore, optional): Store that persists the conversations; they are restored on creation.
+    """
+    NAMESPACE = "conversations"
+
+    def __init__(self, token_budget: int = 1200, max_turns: int = 20, idle_ttl: float = 1800.0, max_conversations: int = 500,
+                 count_tokens: Callable[[str], int] = estimate_tokens, clock: Callable[[], float] = time.monotonic,
+                 state: Optional[StateStore] = None) -> None:
+        self.token_budget = token_budget
+        self.max_turns = max(max_turns, 2)
+        self.count_tokens = count_tokens
+        self.state = state if self.enabled else None
+        self._conversations = TTLCache(ttl=idle_ttl, max_size=max_conversations, clock=clock)
+        if self.state is not None:
+            self._restore()
+
+    @staticmethod
+    def _state_key(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False)
+
+    def _restore(self) -> None:
+        """Loads the persisted conversations, the least recently active first."""
+        for state_key, turns, ttl in self.state.load(self.NAMESPACE):
+            key = json.loads(state_key)
+            restored = collections.deque((Turn(*turn) for turn in turns), maxlen=self.max_turns)
+            self._conversations.set(tuple(key) if isinstance(key, list) else key, restored, ttl=ttl)
+
+    @classmethod
+    def from_env(cls, state: Optional[StateStore] = None) -> "ConversationMemory":
+        """Creates a memory from CHAT_MEMORY_TOKENS (default 1200, 0 disables), CHAT_MEMORY_TURNS (default 20),
+        CHAT_MEMORY_IDLE (default 1800s) and CHAT_MEMORY_USERS (default 500)."""
+        return cls(
+            token_budget=int(env_number("CHAT_MEMORY_TOKENS", 1200)),
+            max_turns=int(env_number("CHAT_MEMORY_TURNS", 20)),
+            idle_ttl=env_number("CHAT_MEMORY_IDLE", 1800.0),
+            max_conversations=int(env_number("CHAT_MEMORY_USERS", 500)),
+            state=state,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """True if history is kept at all."""
+        return self.token_budget > 0
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def history(self, key: Hashable, reserved_tokens: int = 0) -> List[dict]:
+        """Returns the newest turns of a conversation that fit into the budget, oldest first.
+
+        Args:
+            key (Hashable): Conversation key, e.g. ``(channel, user)``.
+            reserved_tokens (int): Tokens already used by the system prompt and the new question.
+
+        Returns:
+            List[dict]: Chat messages (``role``, ``content``) ready for the OpenAI API.
+        """
+        turns: Optional[Deque[Turn]] = self._conversations.get(key)
+        if not turns or not self.enabled:
+            return []
+        available = self.token_budget - reserved_tokens
+        selected: List[Turn] = []
+        for turn in reversed(turns):
+            if turn.tokens > available:
+                break
+            available -= turn.tokens
+            selected.append(turn)
+        # Der Verlauf soll mit einer Frage beginnen, nicht mit einer abgeschnittenen Antwort
+        while selected and selected[-1].role != "user":
+            selected.pop()
+        return [{"role": turn.role, "content": turn.content} for turn in reversed(selected)]
+
+    def add_exchange(self, key: Hashable, question: str, answer: str) -> None:
+        """Appends a question and its answer and marks the conversation as active."""
+        if not self.enabled:
+            return
+        turns: Optional[Deque[Turn]] = self._conversations.get(key)
+        if turns is None:
+            turns = collections.deque(maxlen=self.max_turns)
+        turns.append(Turn("user", question, self.count_tokens(question)))
+        turns.append(Turn("assistant", answer, self.count_tokens(answer)))
+        self._conversations.set(key, turns)
+        if self.state is not None:
+            self.state.put(self.NAMESPACE, self._state_key(key), [[turn.role, turn.content, turn.tokens] for turn in turns],
+                           ttl=self._conversations.ttl)
+
+    def forget(self, key: Hashable) -> None:
+        """Removes a conversation."""
+        self._conversations.pop(key)
+        if self.state is not None:
+            self.state.delete(self.NAMESPACE, self._state_key(key))
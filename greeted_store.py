@@ -0,0 +1,309 @@
+"""Greeted store: Memory-bounded, optionally persistent record of greeted users.
+
+Two in-process tiers are available (GREETED_STORE):
+
+- ``lru`` (default): TTL LRU of user names. A user is greeted again after GREETED_TTL_HOURS; at most
+  GREETED_MAX_USERS names are kept.
+- ``bloom``: two rotating Bloom filters sized for GREETED_MAX_USERS names at the false positive rate
+  GREETED_FALSE_POSITIVE. Memory is fixed; a false positive means a user is not greeted.
+
+With GREETED_STORE_FILE set, the store is loaded from that file on first use and new names are written
+in batches by a background thread every GREETED_FLUSH_INTERVAL seconds, so returning viewers are not
+greeted again after a restart. Without a file but with the SQLite state store (STATE_DB, see
+state_store), the ``lru`` tier is persisted there instead.
+"""
+import abc
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+from config import env_number
+from state_store import StateStore
+from ttl_cache import TTLCache
+
+class GreetedStore(abc.ABC):
+    """Base class: lazy loading and batched background flushing of a greeted-user tier.
+
+    Subclasses implement ``_contains``, ``_add`` and ``_load``, and ``_snapshot`` (taken under the lock) and
+    ``_write`` (file I/O outside the lock, so lookups are not blocked by the disk).
+
+    Args:
+        path (str, optional): Backing file. If None, the store is memory-only.
+        flush_interval (float): Seconds between background flushes.
+    """
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 30.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._loaded = path is None
+        self._dirty: List[str] = []
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def __contains__(self, name: str) -> bool:
+        self.load()
+        with self._lock:
+            return self._contains(name.lower())
+
+    def add(self, name: str) -> None:
+        """Marks name as greeted."""
+        self.load()
+        key = name.lower()
+        with self._lock:
+            self._add(key)
+            if self.path:
+                self._dirty.append(key)
+                self._start_flusher()
+
+    def flush(self) -> None:
+        """Writes pending changes to the backing file."""
+        with self._flush_lock:
+            with self._lock:
+                if not self.path or not self._dirty:
+                    return
+                snapshot = self._snapshot(self._dirty)
+                self._dirty = []
+            try:
+                self._write(snapshot)
+            except OSError as exc:
+                logging.warning("Begrüßte Nutzer konnten nicht gespeichert werden (%s): %s", self.path, exc)
+
+    def close(self) -> None:
+        """Stops the background flusher and writes pending changes."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+
+    def load(self) -> None:
+        """Loads the backing file once; called implicitly on first use."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if os.path.exists(self.path):
+                try:
+                    self._load()
+                except (OSError, ValueError) as exc:
+                    logging.warning("Begrüßte Nutzer konnten nicht geladen werden (%s): %s", self.path, exc)
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="greeted-flush")
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    @abc.abstractmethod
+    def _contains(self, key: str) -> bool:
+        """True if the normalized name was greeted."""
+
+    @abc.abstractmethod
+    def _add(self, key: str) -> None:
+        """Records a normalized name."""
+
+    @abc.abstractmethod
+    def _load(self) -> None:
+        """Reads the backing file."""
+
+    @abc.abstractmethod
+    def _snapshot(self, batch: List[str]) -> Any:
+        """Captures the data to write for a batch of new names (called under the lock)."""
+
+    @abc.abstractmethod
+    def _write(self, snapshot: Any) -> None:
+        """Writes a snapshot to the backing file (called outside the lock)."""
+
+class LRUGreetedStore(GreetedStore):
+    """Greeted users in a TTL LRU; the backing file is an append-only log of ``expires_at<TAB>name`` lines.
+
+    Args:
+        ttl (float): Seconds until a user is greeted again.
+        max_users (int): Maximum number of names kept in memory.
+        path (str, optional): Backing file.
+        flush_interval (float): Seconds between background flushes.
+    """
+    def __init__(self, ttl: float = 24 * 3600, max_users: int = 100000, path: Optional[str] = None, flush_interval: float = 30.0) -> None:
+        super().__init__(path, flush_interval)
+        # Wanduhr statt monotonic, damit Ablaufzeiten einen Neustart überdauern
+        self._cache = TTLCache(ttl=ttl, max_size=max_users, clock=time.time)
+        self._log_lines = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _contains(self, key: str) -> bool:
+        return key in self._cache
+
+    def _add(self, key: str) -> None:
+        self._cache.set(key, True)
+
+    def _load(self) -> None:
+        now = time.time()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._log_lines += 1
+                expires_at, _, key = line.rstrip("\n").partition("\t")
+                remaining = float(expires_at) - now
+                if key and remaining > 0:
+                    self._cache.set(key, True, ttl=remaining)
+        logging.info("Begrüßte Nutzer geladen: %d", len(self._cache))
+
+    def _snapshot(self, batch: List[str]) -> Tuple[bool, List[Tuple[str, float]]]:
+        entries = {key: expires_at for key, _, expires_at in self._cache.entries()}
+        if self._log_lines + len(batch) > 2 * max(len(entries), 1000):
+            # Log verdichten: nur noch gültige Einträge behalten
+            self._log_lines = len(entries)
+            return True, list(entries.items())
+        self._log_lines += len(batch)
+        return False, [(key, entries[key]) for key in batch if key in entries]
+
+    def _write(self, snapshot: Tuple[bool, List[Tuple[str, float]]]) -> None:
+        compact, lines = snapshot
+        text = "".join(f"{expires_at:.0f}\t{key}\n" for key, expires_at in lines)
+        if not compact:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+class StateGreetedStore(LRUGreetedStore):
+    """Greeted users in a TTL LRU, persisted in the SQLite state store instead of a file.
+
+    Every new name is handed to the store's writer thread, which commits it with the next batch.
+
+    Args:
+        state (StateStore): Shared state store.
+        ttl (float): Seconds until a user is greeted again.
+        max_users (int): Maximum number of names kept in memory.
+    """
+    NAMESPACE = "greeted"
+
+    def __init__(self, state: StateStore, ttl: float = 24 * 3600, max_users: int = 100000) -> None:
+        super().__init__(ttl, max_users)
+        self.state = state
+        self._loaded = False
+
+    def load(self) -> None:
+        """Loads the greeted users from the state store once; called implicitly on first use."""
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self._load()
+
+    def _add(self, key: str) -> None:
+        super()._add(key)
+        self.state.put(self.NAMESPACE, key, True, ttl=self._cache.ttl)
+
+    def _load(self) -> None:
+        for key, _, ttl in self.state.load(self.NAMESPACE):
+            self._cache.set(key, True, ttl=ttl)
+        logging.info("Begrüßte Nutzer aus dem Zustandsspeicher geladen: %d", len(self._cache))
+
+class BloomGreetedStore(GreetedStore):
+    """Greeted users in two rotating Bloom filters with fixed memory; the backing file is a snapshot.
+
+    When the current filter holds ``max_users`` names it becomes the previous filter and a new one is
+    started, so at most two generations (up to ``2 * max_users`` names) are remembered.
+
+    Args:
+        max_users (int): Names per filter generation.
+        error_rate (float): False positive rate of a full filter.
+        path (str, optional): Backing file.
+        flush_interval (float): Seconds between background flushes.
+    """
+    def __init__(self, max_users: int = 100000, error_rate: float = 0.001, path: Optional[str] = None, flush_interval: float = 30.0) -> None:
+        super().__init__(path, flush_interval)
+        self.max_users = max(max_users, 1)
+        self.error_rate = min(max(error_rate, 1e-9), 0.5)
+        self.num_bits = max(int(-self.max_users * math.log(self.error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(round(self.num_bits / self.max_users * math.log(2)), 1)
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def _test(bits: bytearray, positions: List[int]) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _contains(self, key: str) -> bool:
+        positions = self._positions(key)
+        return self._test(self._current, positions) or self._test(self._previous, positions)
+
+    def _add(self, key: str) -> None:
+        positions = self._positions(key)
+        if self._test(self._current, positions):
+            return
+        if self._count >= self.max_users:
+            self._previous, self._current = self._current, bytearray(len(self._current))
+            self._count = 0
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+
+    def _load(self) -> None:
+        with open(self.path, "rb") as f:
+            header = json.loads(f.readline())
+            if (header["num_bits"], header["num_hashes"]) != (self.num_bits, self.num_hashes):
+                logging.info("Bloom-Filter-Parameter geändert, gespeicherte Begrüßungen werden verworfen")
+                return
+            size = len(self._current)
+            current, previous = f.read(size), f.read(size)
+        if len(current) != size or len(previous) != size:
+            raise ValueError("unvollständige Bloom-Filter-Datei")
+        self._current, self._previous = bytearray(current), bytearray(previous)
+        self._count = header["count"]
+        logging.info("Begrüßte Nutzer geladen: Bloom-Filter mit %d Einträgen", self._count)
+
+    def _snapshot(self, batch: List[str]) -> bytes:
+        header = {"num_bits": self.num_bits, "num_hashes": self.num_hashes, "count": self._count}
+        return json.dumps(header).encode("utf-8") + b"\n" + bytes(self._current) + bytes(self._previous)
+
+    def _write(self, snapshot: bytes) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.path)
+
+def store_from_env(state: Optional[StateStore] = None) -> GreetedStore:
+    """Creates the greeted-user store configured by GREETED_STORE (lru or bloom), GREETED_MAX_USERS
+    (default 100000), GREETED_TTL_HOURS (default 24, lru only), GREETED_FALSE_POSITIVE (default 0.001,
+    bloom only), GREETED_STORE_FILE (default unset, memory only) and GREETED_FLUSH_INTERVAL (default 30s).
+
+    Args:
+        state (StateStore, optional): State store that persists the lru tier if GREETED_STORE_FILE is unset.
+    """
+    kind = os.environ.get("GREETED_STORE", "lru").lower()
+    max_users = int(env_number("GREETED_MAX_USERS", 100000))
+    path = os.environ.get("GREETED_STORE_FILE") or None
+    flush_interval = env_number("GREETED_FLUSH_INTERVAL", 30.0)
+    if kind == "bloom":
+        return BloomGreetedStore(max_users, env_number("GREETED_FALSE_POSITIVE", 0.001), path, flush_interval)
+    if kind != "lru":
+        logging.warning("Unbekannter GREETED_STORE '%s', verwende lru", kind)
+    ttl = env_number("GREETED_TTL_HOURS", 24.0) * 3600
+    if state is not None and path is None:
+        return StateGreetedStore(state, ttl, max_users)
+    return LRUGreetedStore(ttl, max_users, path, flush_interval)
@@ -0,0 +1,150 @@
+"""Greeting: Batched welcome messages for joining viewers.
+
+Joins are collected per channel for a short window and greeted with one combined chat message that
+mentions as many users as fit into 500 characters. Extra messages are only sent while the greeting
+budget (a token bucket) allows it; users that do not fit are summarized as "und N weitere", so a raid
+with hundreds of viewers costs about as much chat budget as a handful of joins.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+from config import env_number
+from chat_output import MAX_MESSAGE_LENGTH, TokenBucket
+
+GREETING_START = "Willkommen im Chat, "
+GREETING_END = "! Viel Spaß beim Zuschauen!"
+
+def _join_names(names: List[str], rest: int = 0) -> str:
+    mentions = [f"@{name}" for name in names]
+    if rest:
+        mentions.append(f"{rest} weitere")
+    if len(mentions) == 1:
+        return mentions[0]
+    return ", ".join(mentions[:-1]) + " und " + mentions[-1]
+
+def build_greetings(names: List[str], max_messages: int, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Builds at most max_messages welcome lines that mention all names, or as many as fit.
+
+    Names that do not fit into the last allowed message are counted as "und N weitere".
+
+    Args:
+        names (List[str]): Users to greet, in join order.
+        max_messages (int): Maximum number of messages.
+        max_length (int): Maximum length of a message.
+
+    Returns:
+        List[str]: The welcome messages (empty if names is empty or max_messages < 1).
+    """
+    messages: List[str] = []
+    index = 0
+    while index < len(names) and len(messages) < max_messages:
+        last = len(messages) == max_messages - 1
+        count = 1
+        # So viele Namen wie möglich aufnehmen; in der letzten Nachricht muss der Rest-Hinweis mit hineinpassen
+        while index + count < len(names):
+            rest = len(names) - index - count - 1 if last else 0
+            text = GREETING_START + _join_names(names[index:index + count + 1], rest) + GREETING_END
+            if len(text) > max_length:
+                break
+            count += 1
+        rest = len(names) - index - count if last else 0
+        messages.append(GREETING_START + _join_names(names[index:index + count], rest) + GREETING_END)
+        index += count
+    return messages
+
+class GreetingBatcher:
+    """Collects joins per channel and greets them with combined messages.
+
+    Args:
+        send (Callable[[Any, str], Awaitable]): Coroutine function sending a chat message to a channel.
+        window (float): Seconds joins are collected before greeting (0 greets immediately).
+        budget (int): Greeting messages allowed per budget_window (burst and refill of a token bucket).
+        budget_window (float): Length of the budget window in seconds.
+        max_length (int): Maximum length of a greeting message.
+    """
+    def __init__(self, send: Callable[[Any, str], Awaitable], window: float = 2.0, budget: int = 3,
+                 budget_window: float = 60.0, max_length: int = MAX_MESSAGE_LENGTH) -> None:
+        self.send = send
+        self.window = window
+        self.max_length = max_length
+        self.bucket = TokenBucket(budget, budget / budget_window if budget_window > 0 else budget)
+        self._pending: Dict[Any, Tuple[Any, List[str]]] = {}
+        self._timers: Dict[Any, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, send: Callable[[Any, str], Awaitable]) -> "GreetingBatcher":
+        """Creates a batcher from GREETING_WINDOW (default 2s), GREETING_BUDGET (default 3 messages)
+        and GREETING_BUDGET_WINDOW (default 60s)."""
+        return cls(
+            send,
+            window=env_number("GREETING_WINDOW", 2.0),
+            budget=max(int(env_number("GREETING_BUDGET", 3)), 1),
+            budget_window=env_number("GREETING_BUDGET_WINDOW", 60.0),
+        )
+
+    @property
+    def pending(self) -> int:
+        """Number of users waiting to be greeted."""
+        return sum(len(names) for _, names in self._pending.values())
+
+    def add(self, channel: Any, user_name: str) -> None:
+        """Queues user_name for a greeting in channel; the greeting is sent after the collection window."""
+        key = getattr(channel, "name", None) or id(channel)
+        self._pending.setdefault(key, (channel, []))[1].append(user_name)
+        if key not in self._timers:
+            self._schedule(key, self.window)
+
+    async def flush(self) -> None:
+        """Greets all pending users now (within the budget)."""
+        for key in list(self._pending):
+            await self._flush(key)
+
+    async def aclose(self) -> None:
+        """Cancels pending greetings."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def _schedule(self, key: Any, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(max(delay, 0.0), self._start_flush, key)
+
+    def _start_flush(self, key: Any) -> None:
+        self._timers.pop(key, None)
+        task = asyncio.ensure_future(self._flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: Any) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if key not in self._pending:
+            return
+        channel, names = self._pending[key]
+        needed = len(build_greetings(names, len(names), self.max_length))
+        allowed = 0
+        delay = 0.0
+        while allowed < needed:
+            delay = self.bucket.try_take()
+            if delay > 0:
+                break
+            allowed += 1
+        if not allowed:
+            # Budget erschöpft: weiter sammeln und später gemeinsam begrüßen
+            self._schedule(key, max(delay, self.window))
+            return
+        del self._pending[key]
+        messages = build_greetings(names, allowed, self.max_length)
+        if len(messages) < needed:
+            logging.info("Begrüßung von %d Nutzern in %d Nachricht(en) zusammengefasst", len(names), len(messages))
+        for message in messages:
+            try:
+                await self.send(channel, message)
+            except Exception as exc:
+                logging.error("Begrüßung konnte nicht gesendet werden: %s", exc)
@@ -0,0 +1,154 @@
+"""HTTP clients: Shared, pooled clients for OpenAI, Whisper, ElevenLabs and Twitch Helix.
+
+All modules get their HTTP clients from here, so every upstream keeps warm keep-alive connections
+instead of paying DNS, TCP and TLS setup per request. Pool size and timeouts are configured once:
+
+- HTTP_POOL_SIZE (default 10): connections kept per host.
+- HTTP_KEEPALIVE (default 60): seconds an idle connection is kept open.
+- HTTP_CONNECT_TIMEOUT (default 5): connect timeout in seconds.
+
+OPENAI_BASE_URL and ELEVENLABS_BASE_URL (like TWITCH_HELIX_BASE_URL in twitch_api) point the clients at
+another server, e.g. the stub servers of the offline benchmark (benchmarks/load_test.py).
+
+Synchronous clients (requests session, OpenAI client for Whisper) are process-wide singletons and
+thread-safe. Async clients are bound to an event loop and are therefore created per owner.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Iterable, Optional
+import aiohttp
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from config import env_number
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+ELEVENLABS_BASE_URL = "https://api.elevenlabs.io"
+
+_lock = threading.Lock()
+_requests_session: Optional[requests.Session] = None
+_openai_client: Optional[openai.OpenAI] = None
+_openai_http: Optional[httpx.Client] = None
+
+def pool_size() -> int:
+    """Number of pooled connections per host (HTTP_POOL_SIZE)."""
+    return max(int(env_number("HTTP_POOL_SIZE", 10)), 1)
+
+def keepalive_seconds() -> float:
+    """Seconds an idle pooled connection is kept open (HTTP_KEEPALIVE)."""
+    return env_number("HTTP_KEEPALIVE", 60.0)
+
+def connect_timeout() -> float:
+    """Connect timeout in seconds (HTTP_CONNECT_TIMEOUT)."""
+    return env_number("HTTP_CONNECT_TIMEOUT", 5.0)
+
+def openai_base_url() -> str:
+    """Base URL of the OpenAI API (OPENAI_BASE_URL)."""
+    return (os.environ.get("OPENAI_BASE_URL") or OPENAI_BASE_URL).rstrip("/")
+
+def elevenlabs_base_url() -> str:
+    """Base URL of the ElevenLabs API (ELEVENLABS_BASE_URL)."""
+    return (os.environ.get("ELEVENLABS_BASE_URL") or ELEVENLABS_BASE_URL).rstrip("/")
+
+def _is_retryable_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Returns True for errors worth retrying with any of the shared clients.
+
+    Timeouts, connection errors and HTTP 429/5xx are transient; other HTTP errors (e.g. 400, 401) mean
+    the upstream answered and a retry would fail the same way.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and _is_retryable_status(exc.response.status_code)
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return _is_retryable_status(exc.status)
+    return isinstance(exc, (aiohttp.ClientConnectionError, httpx.TransportError))
+
+def _httpx_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=pool_size() * 4,
+        max_keepalive_connections=pool_size(),
+        keepalive_expiry=keepalive_seconds(),
+    )
+
+def requests_session() -> requests.Session:
+    """Returns the shared requests session (used for ElevenLabs) with a keep-alive connection pool."""
+    global _requests_session
+    with _lock:
+        if _requests_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size(), pool_maxsize=pool_size())
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _requests_session = session
+        return _requests_session
+
+def openai_client() -> openai.OpenAI:
+    """Returns the shared synchronous OpenAI client (used for Whisper transcription)."""
+    global _openai_client, _openai_http
+    with _lock:
+        if _openai_client is None:
+            _openai_http = openai.DefaultHttpxClient(limits=_httpx_limits())
+            # Wiederholungen übernimmt resilience.Upstream (mit Zeitbudget), nicht das SDK
+            _openai_client = openai.OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"), base_url=openai_base_url(), http_client=_openai_http,
+                max_retries=0,
+            )
+        return _openai_client
+
+def create_async_httpx_client() -> httpx.AsyncClient:
+    """Creates an async httpx client for the OpenAI SDK with the shared pool settings.
+
+    Must be called inside the event loop that will use the client.
+    """
+    return openai.DefaultAsyncHttpxClient(limits=_httpx_limits())
+
+def create_aiohttp_session(headers: Optional[dict] = None, timeout: float = 10.0) -> aiohttp.ClientSession:
+    """Creates an aiohttp session with the shared pool settings (used for Twitch Helix).
+
+    Must be called inside the event loop that will use the session.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size() * 4, limit_per_host=pool_size(), keepalive_timeout=keepalive_seconds())
+    return aiohttp.ClientSession(
+        headers=headers,
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout, connect=connect_timeout()),
+    )
+
+def warm_up_sync(urls: Optional[Iterable[str]] = None) -> None:
+    """Opens pooled connections to the given hosts so the first real request skips the handshake.
+
+    Uses the requests session for ElevenLabs and the shared OpenAI client's pool for OpenAI.
+    Errors are logged at debug level, since warm-up is best effort.
+
+    Args:
+        urls (Iterable[str], optional): URLs to warm up. Defaults to the ElevenLabs and OpenAI base URLs.
+    """
+    if urls is None:
+        urls = (elevenlabs_base_url(), openai_base_url())
+    for url in urls:
+        try:
+            if url.startswith(openai_base_url()):
+                openai_client()
+                _openai_http.head(url, timeout=connect_timeout())
+            else:
+                requests_session().head(url, timeout=connect_timeout())
+            logging.debug("Verbindung vorgewärmt: %s", url)
+        except (requests.RequestException, httpx.HTTPError) as exc:
+            logging.debug("Vorwärmen von %s fehlgeschlagen: %s", url, exc)
+
+def warm_up_background() -> threading.Thread:
+    """Runs warm_up_sync in a daemon thread and returns the thread."""
+    thread = threading.Thread(target=warm_up_sync, daemon=True, name="http-warmup")
+    thread.start()
+    return thread
@@ -1,20 +1,41 @@
 import os
 import dotenv
 import logging
-import requests
-import tempfile
 from ai_responder import AIResponder
 from twitchio.ext import commands
-import subprocess
 from typing import List
+from playback import PlaybackScheduler
+from tts_cache import TTSAudioCache
+from twitch_api import HelixClient
+from chat_output import ChatOutbox
+from greeting import GreetingBatcher
+from greeted_store import store_from_env
+from conversation_memory import ConversationMemory
+from state_store import StateStore
+from admission import AdmissionRejected, AdmissionScheduler, Priority, estimate_tokens
+import http_clients
+import audio_output
+import metrics
+import tts
+import functools
 import threading
 from ptt import ptt_listener_background
 import glob
 import asyncio
+import time
 
 class Bot(commands.Bot):
     """Twitch-Chatbot mit OpenAI- und ElevenLabs-TTS-Integration."""
 
+    SENTENCE_END = tts.SENTENCE_END
+    # Kurze Antworten, wenn eine KI-Anfrage nicht angenommen oder verworfen wird
+    ADMISSION_REPLIES = {
+        "rate_limited": "Nicht so schnell, bitte frag gleich noch einmal.",
+        "budget_exceeded": "Dein KI-Kontingent ist für den Moment aufgebraucht.",
+        "queue_full": "Gerade ist viel los, bitte frag später noch einmal.",
+        "stale": "Deine Frage ist im Trubel untergegangen, bitte stell sie noch einmal.",
+    }
+
     def __init__(self) -> None:
         """Initialisiert den Bot und lädt Konfigurationen aus Umgebungsvariablen."""
         super().__init__(
@@ -27,7 +48,8 @@ class Bot(commands.Bot):
             self.IGNORED_USERS = {u.strip().lower() for u in ignored_users_env.split(",") if u.strip()}
         else:
             self.IGNORED_USERS = {"saaromansbot", "streamelements"}
-        self.greeted_users = set()
+        self.state = StateStore.from_env()
+        self.greeted_users = store_from_env(self.state)
         self.ai = AIResponder(
             api_key=os.environ.get('OPENAI_API_KEY', ''),
             model=os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo'),
@@ -37,6 +59,19 @@ class Bot(commands.Bot):
         log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
         logging.basicConfig(level=getattr(logging, log_level, logging.INFO))
         self.KI_ACCESS_LEVEL = os.environ.get("KI_ACCESS_LEVEL", "all").lower()  # 'all', 'sub', 'follower'
+        self.stream_replies = os.environ.get("OPENAI_STREAM", "true").lower() not in ("0", "false", "no", "off")
+        self.tts_cache = TTSAudioCache.from_env(self.state)
+        self.playback = PlaybackScheduler(speak=functools.partial(tts.speak_text, cache=self.tts_cache))
+        self.helix = HelixClient.from_env(self.state)
+        self.admission = AdmissionScheduler.from_env()
+        self.chat = ChatOutbox.from_env()
+        self.greeter = GreetingBatcher.from_env(self.chat.send)
+        self.memory = ConversationMemory.from_env(self.state)
+        metrics.QUEUE_DEPTH.set_function(lambda: self.admission.backlog, queue="admission")
+        metrics.QUEUE_DEPTH.set_function(lambda: self.chat.depth, queue="chat")
+        metrics.QUEUE_DEPTH.set_function(lambda: self.playback.backlog, queue="tts")
+        if self.state is not None:
+            metrics.QUEUE_DEPTH.set_function(lambda: self.state.backlog, queue="state")
 
     async def test_openai_connection(self) -> str:
         """Testet die Verbindung zur OpenAI-API und gibt eine Statusmeldung zurück.
@@ -44,25 +79,36 @@ class Bot(commands.Bot):
         Returns:
             str: Statusmeldung zur OpenAI-API.
         """
-        try:
-            response = self.ai.get_response("ping", max_tokens=5)
-            if response and "Entschuldigung" not in response:
-                return "OpenAI-Schnittstelle erreichbar."
-            return "OpenAI-Schnittstelle antwortet nicht wie erwartet."
-        except requests.RequestException as exc:
-            logging.error("OpenAI-Statusprüfung fehlgeschlagen: %s", exc)
-            return f"OpenAI-Schnittstelle FEHLER: {exc}"
+        # get_response fängt API-Fehler selbst ab und liefert dann einen Ersatztext
+        response = await self.ai.get_response("ping", max_tokens=5)
+        if response and "Entschuldigung" not in response:
+            return "OpenAI-Schnittstelle erreichbar."
+        return "OpenAI-Schnittstelle antwortet nicht wie erwartet."
 
     async def event_ready(self) -> None:
         """Wird aufgerufen, wenn der Bot erfolgreich verbunden ist."""
         print(f'Logged in as | {self.nick}')
+        http_clients.warm_up_background()
+        await asyncio.to_thread(self.greeted_users.load)
+        await self.helix.restore()
+        await self.ai.warm_up()
+        if self.KI_ACCESS_LEVEL == "follower":
+            await self.helix.warm_up()
+            await self.helix.resolve_channel_id()
         status = await self.test_openai_connection()
         print(f'[OpenAI-Status] {status}')
 
+    def prefetch_access(self, user_name: str) -> None:
+        """Merkt einen Nutzer für die gebündelte Follower-Vorabprüfung vor (nur bei KI_ACCESS_LEVEL=follower)."""
+        if self.KI_ACCESS_LEVEL == "follower":
+            self.helix.prefetch(user_name)
+
     async def event_join(self, channel, user) -> None:
-        """Begrüßt neue Nutzer im Chat."""
+        """Begrüßt neue Nutzer im Chat (gebündelt, siehe greeting.GreetingBatcher) und prüft ihren Follower-Status vorab."""
+        if user.name.lower() != self.nick.lower():
+            self.prefetch_access(user.name)
         if user.name.lower() != self.nick.lower() and user.name not in self.greeted_users:
-            await channel.send(f"Willkommen im Chat, @{user.name}! Viel Spaß beim Zuschauen!")
+            self.greeter.add(channel, user.name)
             self.greeted_users.add(user.name)
 
     @staticmethod
@@ -98,150 +144,216 @@ class Bot(commands.Bot):
             blocks.append(current_block)
         return blocks
 
-    async def speak_text(self, text: str) -> None:
+    async def speak_text(self, text: str) -> bool:
         """
-        Converts text to speech using the ElevenLabs API and plays the resulting audio file.
+        Queues text for speech output via ElevenLabs and returns immediately.
+
+        The text is spoken in order by the playback scheduler's background worker, so the event loop is never
+        blocked by the TTS request or by the audio playback.
 
         Args:
             text (str): The text to be spoken.
 
-        Raises:
-            requests.RequestException: If a network or API error occurs.
-            IOError: If audio file handling fails.
+        Returns:
+            bool: True if the text was queued, False if the TTS backlog is full (back-pressure) and the text is dropped.
 
         Notes:
-            - The timeout for the ElevenLabs API request is set to 60 seconds to support longer texts.
-            - For best reliability, keep texts reasonably short (e.g., <1000 characters).
-            - If a timeout occurs, a clear error is logged and the user is advised to shorten the text.
+            - The audio is played through the in-process output (or piped into mpg123/mpv), no file is written to disk.
+            - Long texts are synthesized sentence by sentence; each ElevenLabs request has a deadline of
+              ELEVENLABS_TIMEOUT seconds (default 20) including retries.
+            - The backlog size is configured with TTS_MAX_BACKLOG (default 5).
         """
-        api_key = os.environ.get('ELEVENLABS_API_KEY', 'PLACEHOLDER_API_KEY')
-        voice_id = os.environ.get('ELEVENLABS_VOICE_ID', 'tKmESGVo91DcC5kFPRS6')
-        model_id = os.environ.get('ELEVENLABS_MODEL_ID', 'eleven_multilingual_v2')
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        headers = {
-            "xi-api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "text": text,
-            "model_id": model_id,
-            "voice_settings": {"stability": 0.75, "similarity_boost": 0.25}
-        }
+        return self.playback.enqueue(text)
+
+    def _is_privileged(self, author) -> bool:
+        """Returns True if the author is the channel owner or a moderator."""
+        channel_owner = os.environ.get("TWITCH_CHANNEL", "").lower()
+        return author.name.lower() == channel_owner or getattr(author, "is_mod", False)
+
+    @commands.command(name="skip")
+    async def skip_command(self, ctx: commands.Context) -> None:
+        """!skip: Bricht die aktuelle TTS-Ausgabe ab (nur Kanalinhaber und Mods)."""
+        if self._is_privileged(ctx.author):
+            self.playback.skip()
+
+    @commands.command(name="flush")
+    async def flush_command(self, ctx: commands.Context) -> None:
+        """!flush: Verwirft alle wartenden TTS-Ausgaben (nur Kanalinhaber und Mods)."""
+        if self._is_privileged(ctx.author):
+            removed = self.playback.flush()
+            await self.chat.send(ctx.channel, f"TTS-Warteschlange geleert ({removed} verworfen).")
+
+    @commands.command(name="volume")
+    async def volume_command(self, ctx: commands.Context) -> None:
+        """!volume <0-100>: Setzt die Lautstärke der TTS-Ausgabe (nur Kanalinhaber und Mods)."""
+        if not self._is_privileged(ctx.author):
+            return
+        output = audio_output.current_output()
+        if output is None:
+            await self.chat.send(ctx.channel, "Lautstärke nur mit interner Audioausgabe einstellbar.")
+            return
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            try:
-                response.raise_for_status()
-            except requests.HTTPError as http_exc:
-                error_detail = None
-                try:
-                    error_json = response.json()
-                    error_detail = error_json.get('detail') or error_json.get('message') or str(error_json)
-                except ValueError:
-                    error_detail = response.text
-                logging.error(
-                    "TTS-Fehler (HTTP %s): %s | Detail: %s", response.status_code, http_exc, error_detail
-                )
-                return
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-                tmp_file.write(response.content)
-                tmp_file.flush()
-                logging.info("TTS-Audiodatei gespeichert: %s", tmp_file.name)
-                try:
-                    subprocess.run(["mpg123", "-q", tmp_file.name], check=True)
-                except subprocess.CalledProcessError as mpg_exc:
-                    logging.warning("mpg123 fehlgeschlagen: %s, versuche mpv", mpg_exc)
-                    try:
-                        subprocess.run(["mpv", "--quiet", tmp_file.name], check=True)
-                    except subprocess.CalledProcessError as mpv_exc:
-                        logging.error("mpv fehlgeschlagen: %s", mpv_exc)
-                finally:
-                    try:
-                        os.remove(tmp_file.name)
-                        logging.info("TTS-Audiodatei gelöscht: %s", tmp_file.name)
-                    except OSError as rm_exc:
-                        logging.warning("Konnte TTS-Audiodatei nicht löschen: %s", rm_exc)
-        except requests.Timeout:
-            logging.error("TTS-Fehler: Die Anfrage an ElevenLabs hat das Timeout überschritten (60s). Text ggf. kürzen oder später erneut versuchen.")
-        except (requests.RequestException, IOError) as exc:
-            logging.error("TTS-Fehler: %s", exc)
+            percent = int(ctx.message.content.split()[1])
+        except (IndexError, ValueError):
+            await self.chat.send(ctx.channel, f"TTS-Lautstärke: {round(output.volume * 100)}%")
+            return
+        output.set_volume(percent / 100)
+        await self.chat.send(ctx.channel, f"TTS-Lautstärke auf {round(output.volume * 100)}% gesetzt.")
 
     async def is_follower(self, user_name: str) -> bool:
         """Check if a user is a follower of the channel using the Twitch Helix API.
 
+        The check uses a shared HTTP session, the channel ID resolved at startup and cached
+        user IDs and follow results (see twitch_api.HelixClient).
+
         Args:
             user_name (str): The username to check.
         Returns:
             bool: True if the user is a follower, False otherwise.
         """
-        import aiohttp
-        channel = os.environ["TWITCH_CHANNEL"].lower()
-        client_id = os.environ.get("CLIENT_ID")
-        access_token = os.environ.get("TMI_TOKEN")
-        if not client_id or not access_token:
-            logging.warning("CLIENT_ID or TMI_TOKEN missing for follower check.")
-            return False
-        headers = {"Client-ID": client_id, "Authorization": f"Bearer {access_token}"}
-        async with aiohttp.ClientSession() as session:
-            # Get channel user ID
-            logging.debug("Requesting channel user ID for channel: %s", channel)
-            async with session.get(f"https://api.twitch.tv/helix/users?login={channel}", headers=headers) as resp:
-                data = await resp.json()
-                logging.debug("Channel user ID response: %s", data)
-                if not data.get("data"):
-                    logging.warning("No data found for channel user: %s", channel)
-                    return False
-                channel_id = data["data"][0]["id"]
-            # Get user ID
-            logging.debug("Requesting user ID for user: %s", user_name)
-            async with session.get(f"https://api.twitch.tv/helix/users?login={user_name}", headers=headers) as resp:
-                data = await resp.json()
-                logging.debug("User ID response: %s", data)
-                if not data.get("data"):
-                    logging.warning("No data found for user: %s", user_name)
-                    return False
-                user_id = data["data"][0]["id"]
-            # Check if user follows channel
-            url = f"https://api.twitch.tv/helix/users/follows?from_id={user_id}&to_id={channel_id}"
-            logging.debug("Checking follow status: %s", url)
-            async with session.get(url, headers=headers) as resp:
-                data = await resp.json()
-                logging.debug("Follow check response: %s", data)
-                is_follower = data.get("total", 0) > 0
-                if is_follower:
-                    logging.info("User '%s' IS a follower of channel '%s'", user_name, channel)
-                else:
-                    logging.info("User '%s' is NOT a follower of channel '%s'", user_name, channel)
-                return is_follower
+        started = time.perf_counter()
+        try:
+            return await self.helix.is_follower(user_name)
+        finally:
+            metrics.FOLLOWER_CHECK.observe(time.perf_counter() - started)
 
-    async def process_user_message(self, text: str, user: str = None, channel=None) -> None:
+    async def process_user_message(self, text: str, user: str = None, channel=None, priority: Priority = None) -> str:
         """Verarbeitet eine Nutzereingabe (aus Chat oder PTT):
-        - Holt eine KI-Antwort
+        - Holt eine KI-Antwort (gestreamt, falls OPENAI_STREAM aktiv ist)
         - Splittet die Antwort
         - Gibt sie im Chat aus (mit Prefix, falls user & channel gesetzt)
         - Gibt sie per TTS aus
 
+        Im Streaming-Modus wird jeder 500-Zeichen-Block gesendet, sobald er voll ist, und die TTS-Ausgabe
+        startet mit dem ersten vollständigen Satz. Bei Chat-Nachrichten werden die letzten Wortwechsel des
+        Nutzers im Kanal mitgeschickt (siehe conversation_memory.ConversationMemory). Das Modell wählt der
+        ModelRouter der AIResponder-Instanz anhand von Promptlänge und Priorität.
+
         Args:
             text (str): Die Nutzereingabe (Text).
             user (str, optional): Username für Chat-Prefix. Falls None, keine Chat-Ausgabe.
             channel: Channel-Objekt für Chat-Ausgabe. Falls None, keine Chat-Ausgabe.
+            priority (Priority, optional): Prioritätsklasse des Absenders für die Modellwahl.
+
+        Returns:
+            str: Die vollständige KI-Antwort.
         """
-        ai_reply = self.ai.get_response(text)
         max_total_length = 500
         prefix = f"@{user} " if user else ""
         first_block_max = max_total_length - len(prefix)
-        blocks = self.split_text_on_word_boundary(ai_reply, first_block_max)
-        # Chat-Ausgabe
+        memory_key = (getattr(channel, "name", None) or id(channel), user.lower()) if user and channel else None
+        request_kwargs = {"priority": priority} if priority is not None else {}
+        if memory_key is not None:
+            history = self.memory.history(memory_key, reserved_tokens=self.ai.system_prompt_tokens + estimate_tokens(text))
+            if history:
+                request_kwargs["history"] = history
+        if not self.stream_replies:
+            ai_reply = await self.ai.get_response(text, **request_kwargs)
+            self.remember_exchange(memory_key, text, ai_reply)
+            blocks = self.split_text_on_word_boundary(ai_reply, first_block_max)
+            # Chat-Ausgabe über die ratenbegrenzte Warteschlange, gewartet wird nur auf den letzten Block
+            if user and channel:
+                if blocks:
+                    first_block = blocks[0]
+                    last_post = self.chat.post(channel, f"{prefix}{first_block}")
+                    rest = ' '.join(blocks[1:])
+                    if rest:
+                        rest_blocks = self.split_text_on_word_boundary(rest, max_total_length)
+                        for block in rest_blocks:
+                            last_post = self.chat.post(channel, block)
+                    await last_post
+            # TTS-Ausgabe
+            if not await self.speak_text(ai_reply):
+                logging.info("TTS ausgelastet, Antwort nur im Chat.")
+            return ai_reply
+
+        ai_reply = ""
+        pending = ""
+        first_sent = False
+        spoken_until = None
+        tts_dropped = False
+        last_post = None
+
+        def send_blocks(final: bool) -> None:
+            """Reiht alle vollen Blöcke aus pending in die Chat-Warteschlange ein; bei final auch den Rest."""
+            nonlocal pending, first_sent, last_post
+            while pending.strip():
+                limit = max_total_length if first_sent else first_block_max
+                if not final and len(pending) <= limit:
+                    return
+                blocks = self.split_text_on_word_boundary(pending, limit)
+                if not final and len(blocks) < 2:
+                    return
+                last_post = self.chat.post(channel, blocks[0] if first_sent else f"{prefix}{blocks[0]}")
+                first_sent = True
+                # Ein abschließendes Leerzeichen bleibt erhalten, damit das nächste Token ein neues Wort beginnt
+                pending = ' '.join(blocks[1:]) + (' ' if pending[-1].isspace() and len(blocks) > 1 else '')
+
+        async for delta in self.ai.stream_response(text, **request_kwargs):
+            ai_reply += delta
+            if user and channel:
+                pending += delta
+                send_blocks(final=False)
+            if spoken_until is None:
+                match = self.SENTENCE_END.search(ai_reply)
+                if match:
+                    spoken_until = match.end()
+                    tts_dropped = not await self.speak_text(ai_reply[:spoken_until].strip())
+        # Chat-Ausgabe des letzten Blocks
         if user and channel:
-            if blocks:
-                first_block = blocks[0]
-                await channel.send(f"{prefix}{first_block}")
-                rest = ' '.join(blocks[1:])
-                if rest:
-                    rest_blocks = self.split_text_on_word_boundary(rest, max_total_length)
-                    for block in rest_blocks:
-                        await channel.send(block)
-        # TTS-Ausgabe
-        await self.speak_text(ai_reply)
+            send_blocks(final=True)
+            if last_post is not None:
+                await last_post
+        # TTS-Ausgabe des Rests, die Warteschlange hält die Reihenfolge ein
+        if spoken_until is None:
+            tts_dropped = not await self.speak_text(ai_reply)
+        elif not tts_dropped and ai_reply[spoken_until:].strip():
+            tts_dropped = not await self.speak_text(ai_reply[spoken_until:].strip())
+        if tts_dropped:
+            logging.info("TTS ausgelastet, Antwort nur im Chat.")
+        self.remember_exchange(memory_key, text, ai_reply)
+        return ai_reply
+
+    def remember_exchange(self, key, question: str, answer: str) -> None:
+        """Speichert Frage und Antwort im Gesprächsverlauf; Fehlerantworten werden nicht gespeichert."""
+        if key is None or not answer or self.ai.is_fallback(answer):
+            return
+        self.memory.add_exchange(key, question, answer)
+
+    async def submit_user_message(self, text: str, priority: Priority, user: str = None, channel=None) -> None:
+        """Reicht eine Nutzereingabe über die Admission-Steuerung an process_user_message weiter.
+
+        Anfragen werden nach Priorität abgearbeitet und pro Nutzer begrenzt (siehe admission.AdmissionScheduler).
+        Abgelehnte oder zu lange wartende Anfragen erhalten eine kurze Antwort im Chat.
+
+        Args:
+            text (str): Die Nutzereingabe (Text).
+            priority (Priority): Prioritätsklasse des Absenders.
+            user (str, optional): Username für Chat-Prefix und Nutzerlimits.
+            channel: Channel-Objekt für Chat-Ausgabe.
+        """
+        async def job() -> None:
+            reply = await self.process_user_message(text, user=user, channel=channel, priority=priority)
+            self.admission.charge(user, estimate_tokens(reply))
+        try:
+            await self.admission.run(job, priority=priority, user=user, cost=estimate_tokens(text))
+        except AdmissionRejected as exc:
+            logging.info("KI-Anfrage von %s nicht bearbeitet: %s", user or "PTT", exc.reason)
+            if user and channel:
+                await self.chat.send(channel, f"@{user} {self.ADMISSION_REPLIES[exc.reason]}")
+
+    @staticmethod
+    def sender_priority(is_owner: bool, is_mod: bool, is_sub: bool, is_follower: bool) -> Priority:
+        """Returns the admission priority class of a chat sender."""
+        if is_owner:
+            return Priority.OWNER
+        if is_mod:
+            return Priority.MOD
+        if is_sub:
+            return Priority.SUB
+        if is_follower:
+            return Priority.FOLLOWER
+        return Priority.VIEWER
 
     async def event_message(self, message) -> None:
         """Reagiert auf Nachrichten mit @Nicole und gibt eine KI-Antwort mit TTS aus.
@@ -256,6 +368,7 @@ class Bot(commands.Bot):
             return
         if message.author.name.lower() in self.IGNORED_USERS:
             return
+        self.prefetch_access(message.author.name)
         content = message.content.lower()
         if "@nicole" in content:
             access = self.KI_ACCESS_LEVEL
@@ -266,37 +379,52 @@ class Bot(commands.Bot):
             is_owner = message.author.name.lower() == channel_owner
             if not (is_owner or is_mod):
                 if access == "sub" and not is_sub:
-                    await message.channel.send(f"@{message.author.name} KI-Antworten sind nur für Abonnenten verfügbar.")
+                    await self.chat.send(message.channel, f"@{message.author.name} KI-Antworten sind nur für Abonnenten verfügbar.")
                     return
                 if access == "follower":
                     is_follower = await self.is_follower(message.author.name)
                     if not is_follower:
-                        await message.channel.send(f"@{message.author.name} KI-Antworten sind nur für Follower verfügbar.")
+                        await self.chat.send(message.channel, f"@{message.author.name} KI-Antworten sind nur für Follower verfügbar.")
                         return
                 if access not in ("all", "sub", "follower"):
-                    await message.channel.send("KI access misconfigured. Allowed: all, sub, follower.")
+                    await self.chat.send(message.channel, "KI access misconfigured. Allowed: all, sub, follower.")
                     return
-            await self.process_user_message(message.content, user=message.author.name, channel=message.channel)
+            # Ohne Follower-Modus ist der Follower-Status unbekannt, solche Nutzer zählen als Zuschauer
+            priority = self.sender_priority(is_owner, is_mod, is_sub, access == "follower" and is_follower)
+            await self.submit_user_message(message.content, priority, user=message.author.name, channel=message.channel)
             return
         await self.handle_commands(message)
 
     async def send_ptt_message(self, text: str) -> None:
         """Sendet eine PTT-Nachricht wie eine Chat-Nachricht an die zentrale Verarbeitungslogik."""
-        await self.process_user_message(text)
+        await self.submit_user_message(text, Priority.PTT)
+
+    async def close(self) -> None:
+        """Trennt die Twitch-Verbindung, beendet die TTS-Wiedergabe und schließt die HTTP-Clients und den Zustandsspeicher."""
+        self.playback.stop()
+        await asyncio.to_thread(audio_output.close_shared)
+        await self.admission.aclose()
+        await self.greeter.aclose()
+        await asyncio.to_thread(self.greeted_users.close)
+        await self.chat.aclose()
+        await self.ai.aclose()
+        await self.helix.aclose()
+        if self.state is not None:
+            await asyncio.to_thread(self.state.close)
+        await super().close()
 
 def cleanup_temp_audio_files() -> None:
-    """Removes leftover temporary audio files (*.mp3, aufnahme.wav) from the working directory.
+    """Removes a leftover PTT recording (aufnahme.wav) written by older versions from the working directory.
 
+    TTS audio is streamed directly to the player and PTT recordings are encoded in memory, so no new audio files are written.
     This should be called at program startup to prevent disk space issues from old files.
     """
-    patterns = ["*.mp3", "aufnahme.wav"]
-    for pattern in patterns:
-        for file_path in glob.glob(pattern):
-            try:
-                os.remove(file_path)
-                logging.info("Removed leftover audio file: %s", file_path)
-            except Exception as exc:
-                logging.warning("Could not remove %s: %s", file_path, exc)
+    for file_path in glob.glob("aufnahme.wav"):
+        try:
+            os.remove(file_path)
+            logging.info("Removed leftover audio file: %s", file_path)
+        except Exception as exc:
+            logging.warning("Could not remove %s: %s", file_path, exc)
 
 def check_required_env_vars() -> None:
     """Checks for required environment variables and exits if any are missing.
@@ -322,25 +450,22 @@ if __name__ == "__main__":
     dotenv.load_dotenv()
     cleanup_temp_audio_files()
     check_required_env_vars()
+    metrics.start_from_env()
     bot = Bot()
     # PTT-Listener im Hintergrund starten, Chat-Callback übergeben
     def ptt_chat_callback(text: str):
-        # Thread-sicheres Aufrufen der async-Methode aus dem PTT-Thread
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = None
-        if loop and loop.is_running():
+        # Thread-sicheres Aufrufen der async-Methode aus dem PTT-Thread.
+        # Der Bot-Loop wird verwendet, da der async OpenAI-Client an diesen Loop gebunden ist.
+        loop = bot.loop
+        if loop.is_running():
             asyncio.run_coroutine_threadsafe(bot.send_ptt_message(text), loop)
         else:
-            # Fallback: neuen Loop starten (sollte im Normalfall nicht nötig sein)
-            new_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(new_loop)
-            new_loop.run_until_complete(bot.send_ptt_message(text))
+            # Ein eigener Loop würde den OpenAI-Client an den falschen Loop binden
+            logging.warning("Bot-Loop läuft noch nicht, PTT-Nachricht wird verworfen.")
     try:
         threading.Thread(
             target=ptt_listener_background,
-            args=(ptt_chat_callback,),
+            args=(ptt_chat_callback, bot.state),
             daemon=True
         ).start()
         logging.info("PTT-Listener erfolgreich gestartet.")
@@ -0,0 +1,281 @@
+"""Metrics: Latency histograms, counters and gauges for the hot path in the Prometheus text format.
+
+The bot records per-stage timings (follower check, LLM time to first token and total time, TTS time to
+first byte, playback, queue waits, chat send delay, transcription) and counts errors and cache lookups.
+With METRICS_PORT set, the values are served at ``http://METRICS_HOST:METRICS_PORT/metrics`` (default
+host 127.0.0.1) by a small HTTP server in a daemon thread. Without it, recording is disabled and every
+``observe``/``inc`` call returns after a single flag check.
+"""
+import abc
+import bisect
+import http.server
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Sekunden, passend für Netzwerkaufrufe zwischen wenigen Millisekunden und einer Minute
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+
+def enable() -> None:
+    """Starts recording metrics."""
+    global _enabled
+    _enabled = True
+
+def disable() -> None:
+    """Stops recording metrics; recorded values are kept."""
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    """True if metrics are recorded."""
+    return _enabled
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric(abc.ABC):
+    """Base class: name, help text, label names and a lock for thread-safe updates."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} erwartet die Labels {self.labelnames}, erhalten {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Returns the metric in the Prometheus text exposition format."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Returns the sample lines of the metric."""
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. errors per stage."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Adds amount to the counter of the given label values."""
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Returns the current count of the given label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram(_Metric):
+    """Distribution of durations in cumulative buckets, plus sum and count.
+
+    Args:
+        name (str): Metric name, e.g. ``saarvis_tts_first_byte_seconds``.
+        documentation (str): Help text.
+        labelnames (Sequence[str]): Label names.
+        buckets (Sequence[float]): Upper bounds of the buckets in seconds.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Pro Labelkombination: Zähler je Bucket (letzter Eintrag: +Inf), Summe, Anzahl
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Records a duration in seconds."""
+        if not _enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        """Returns a context manager that observes the duration of its block."""
+        return _Timer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        """Returns the number of observations of the given label values."""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class _Timer:
+    """Context manager measuring a block with time.perf_counter."""
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+class Gauge(_Metric):
+    """Current value read at scrape time from a callback, e.g. a queue depth."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Registers the callback returning the value of the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._functions.items(), key=lambda item: item[0])
+        lines = []
+        for key, function in items:
+            try:
+                value = function()
+            except Exception as exc:
+                logging.debug("Gauge %s%s nicht lesbar: %s", self.name, key, exc)
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together."""
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Adds metric; its name must be unique."""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrik {metric.name} ist bereits registriert")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+FOLLOWER_CHECK = REGISTRY.register(Histogram("saarvis_follower_check_seconds", "Dauer von is_follower (inkl. Cache)."))
+LLM_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "saarvis_llm_first_token_seconds", "Zeit bis zum ersten Token einer OpenAI-Anfrage.", ("mode",)))
+LLM_ROUTED = REGISTRY.register(Counter("saarvis_llm_routed_total", "OpenAI-Anfragen pro Modell-Route.", ("route",)))
+LLM_TOTAL = REGISTRY.register(Histogram("saarvis_llm_total_seconds", "Gesamtdauer einer OpenAI-Anfrage.", ("mode",)))
+TTS_FIRST_BYTE = REGISTRY.register(Histogram("saarvis_tts_first_byte_seconds", "Zeit bis zum ersten Audio-Byte von ElevenLabs."))
+PLAYBACK = REGISTRY.register(Histogram("saarvis_playback_seconds", "Dauer der Audiowiedergabe einer Ausgabe."))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "saarvis_queue_wait_seconds", "Wartezeit in einer Warteschlange bis zur Bearbeitung.", ("queue",)))
+CHAT_SEND_DELAY = REGISTRY.register(Histogram(
+    "saarvis_chat_send_delay_seconds", "Zeit vom Einreihen bis zum Senden einer Chat-Nachricht."))
+TRANSCRIPTION = REGISTRY.register(Histogram("saarvis_transcription_seconds", "Dauer einer Transkription.", ("backend",)))
+ERRORS = REGISTRY.register(Counter("saarvis_errors_total", "Fehler pro Verarbeitungsstufe.", ("stage",)))
+CACHE_LOOKUPS = REGISTRY.register(Counter("saarvis_cache_lookups_total", "Cache-Zugriffe nach Ergebnis.", ("cache", "result")))
+QUEUE_DEPTH = REGISTRY.register(Gauge("saarvis_queue_depth", "Aktuell wartende Einträge.", ("queue",)))
+RETRIES = REGISTRY.register(Counter("saarvis_retries_total", "Wiederholte Anfragen pro Dienst.", ("service",)))
+HEDGES = REGISTRY.register(Counter("saarvis_hedged_requests_total", "Zusätzlich gestartete Anfragen (Hedging).", ("service",)))
+CIRCUIT_OPEN = REGISTRY.register(Gauge("saarvis_circuit_open", "1, solange der Circuit Breaker eines Dienstes offen ist.", ("service",)))
+
+def record_lookup(cache: str, hit: bool) -> None:
+    """Counts a cache lookup as hit or miss."""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self) -> None:  # noqa: N802 (Name von BaseHTTPRequestHandler vorgegeben)
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug("Metrics-Abruf: " + format, *args)
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> http.server.ThreadingHTTPServer:
+    """Enables recording and serves registry at ``/metrics`` in a daemon thread.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The running server (``shutdown()`` stops it).
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    enable()
+    logging.info("Metriken unter http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+def start_from_env() -> Optional[http.server.ThreadingHTTPServer]:
+    """Starts the metrics endpoint if METRICS_PORT is set (METRICS_HOST, default 127.0.0.1)."""
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_http_server(int(port), os.environ.get("METRICS_HOST", "127.0.0.1"))
+    except (ValueError, OSError) as exc:
+        logging.error("Metrik-Endpunkt konnte nicht gestartet werden: %s", exc)
+        return None
@@ -0,0 +1,181 @@
+"""Model router: Chooses the OpenAI model and max_tokens per request.
+
+Routes are checked in order; the first route whose limits match the request (prompt size in tokens,
+sender priority) is used, so cheap, fast models can take short chat traffic while long questions and
+the streamer's own requests go to the stronger model. With a latency SLO (OPENAI_LATENCY_SLO), the
+router also tracks a rolling percentile of the time to first token per model and skips a matching
+route whose model is currently slower than the SLO. Old samples expire, so a skipped model is tried
+again after the latency window.
+
+Routes are configured as a JSON list in OPENAI_ROUTES, e.g.::
+
+    [{"name": "fast", "model": "gpt-4o-mini", "max_tokens": 80, "max_prompt_tokens": 60,
+      "priorities": ["sub", "follower", "viewer"]},
+     {"name": "smart", "model": "gpt-4o", "max_tokens": 250}]
+
+Without OPENAI_ROUTES every request uses OPENAI_MODEL and OPENAI_MAX_TOKENS as before.
+"""
+import collections
+import json
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, FrozenSet, List, Optional, Sequence, Tuple
+from config import env_number
+from admission import Priority
+import metrics
+
+@dataclass(frozen=True)
+class Route:
+    """A model choice with the requests it is meant for.
+
+    Args:
+        name (str): Route name for logs and metrics.
+        model (str): OpenAI chat model.
+        max_tokens (int): Maximum tokens of the answer.
+        max_prompt_tokens (int, optional): Largest question (plus conversation history) in tokens; None for any size.
+        priorities (FrozenSet[Priority], optional): Sender classes served by this route; None for all.
+    """
+    name: str
+    model: str
+    max_tokens: int
+    max_prompt_tokens: Optional[int] = None
+    priorities: Optional[FrozenSet[Priority]] = None
+
+    def matches(self, prompt_tokens: int, priority: Optional[Priority]) -> bool:
+        """True if the route accepts a prompt of this size from this sender class."""
+        if self.max_prompt_tokens is not None and prompt_tokens > self.max_prompt_tokens:
+            return False
+        return self.priorities is None or priority is None or priority in self.priorities
+
+def parse_routes(spec: str, default_max_tokens: int) -> List[Route]:
+    """Parses the JSON route list of OPENAI_ROUTES.
+
+    Args:
+        spec (str): JSON list of objects with ``model`` and optional ``name``, ``max_tokens``,
+            ``max_prompt_tokens`` and ``priorities`` (names of admission.Priority, e.g. ``"viewer"``).
+        default_max_tokens (int): max_tokens of routes that do not set it.
+
+    Raises:
+        ValueError: If the JSON is invalid or a route lacks a model or names an unknown priority.
+    """
+    try:
+        entries = json.loads(spec)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"OPENAI_ROUTES ist kein gültiges JSON: {exc}") from exc
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("OPENAI_ROUTES muss eine nicht leere Liste sein")
+    routes = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("model"):
+            raise ValueError(f"Route {index} ohne Modell")
+        priorities = entry.get("priorities")
+        if priorities is not None:
+            try:
+                priorities = frozenset(Priority[str(name).upper()] for name in priorities)
+            except KeyError as exc:
+                raise ValueError(f"Route {index}: unbekannte Priorität {exc}") from exc
+        max_prompt_tokens = entry.get("max_prompt_tokens")
+        routes.append(Route(
+            name=str(entry.get("name") or entry["model"]),
+            model=str(entry["model"]),
+            max_tokens=int(entry.get("max_tokens", default_max_tokens)),
+            max_prompt_tokens=int(max_prompt_tokens) if max_prompt_tokens is not None else None,
+            priorities=priorities,
+        ))
+    return routes
+
+class ModelRouter:
+    """Picks a route per request from prompt size, sender priority and rolling model latency.
+
+    Args:
+        routes (Sequence[Route]): Routes in order of preference; the last one should accept everything.
+        latency_slo (float): Target time to first token in seconds; 0 disables latency-based routing.
+        percentile (float): Percentile of the observed latencies compared with the SLO, e.g. 0.9.
+        window (float): Seconds a latency sample is kept.
+        min_samples (int): Samples needed before a model can be considered too slow.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    MAX_SAMPLES = 50
+
+    def __init__(self, routes: Sequence[Route], latency_slo: float = 0.0, percentile: float = 0.9, window: float = 120.0,
+                 min_samples: int = 5, clock: Callable[[], float] = time.monotonic) -> None:
+        if not routes:
+            raise ValueError("Mindestens eine Route erforderlich")
+        self.routes = list(routes)
+        self.latency_slo = latency_slo
+        self.percentile = min(max(percentile, 0.0), 1.0)
+        self.window = window
+        self.min_samples = max(min_samples, 1)
+        self.clock = clock
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_model: str, default_max_tokens: int) -> "ModelRouter":
+        """Creates a router from OPENAI_ROUTES (see module docstring), OPENAI_LATENCY_SLO (default 0, off),
+        OPENAI_LATENCY_PERCENTILE (default 0.9), OPENAI_LATENCY_WINDOW (default 120s) and
+        OPENAI_LATENCY_MIN_SAMPLES (default 5). Invalid routes are logged and replaced by the default route."""
+        routes = [Route("default", default_model, default_max_tokens)]
+        spec = os.environ.get("OPENAI_ROUTES", "").strip()
+        if spec:
+            try:
+                routes = parse_routes(spec, default_max_tokens)
+            except ValueError as exc:
+                logging.error("%s; verwende nur %s", exc, default_model)
+        return cls(
+            routes,
+            latency_slo=env_number("OPENAI_LATENCY_SLO", 0.0),
+            percentile=env_number("OPENAI_LATENCY_PERCENTILE", 0.9),
+            window=env_number("OPENAI_LATENCY_WINDOW", 120.0),
+            min_samples=int(env_number("OPENAI_LATENCY_MIN_SAMPLES", 5)),
+        )
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Records the time to first token (or until a timeout) of a request to model."""
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = collections.deque(maxlen=self.MAX_SAMPLES)
+            samples.append((self.clock(), seconds))
+
+    def latency(self, model: str) -> Optional[float]:
+        """Returns the rolling latency percentile of model, or None with too few recent samples."""
+        with self._lock:
+            samples = self._samples.get(model)
+            if not samples:
+                return None
+            cutoff = self.clock() - self.window
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            if len(samples) < self.min_samples:
+                return None
+            values = sorted(seconds for _, seconds in samples)
+        return values[max(math.ceil(self.percentile * len(values)) - 1, 0)]
+
+    def choose(self, prompt_tokens: int, priority: Optional[Priority] = None) -> Route:
+        """Returns the route for a request.
+
+        The first matching route within the latency SLO wins. If every matching route is too slow, the
+        one with the lowest observed latency is used.
+
+        Args:
+            prompt_tokens (int): Estimated tokens of the question plus conversation history.
+            priority (Priority, optional): Sender class; None matches every route.
+        """
+        candidates = [route for route in self.routes if route.matches(prompt_tokens, priority)] or self.routes[-1:]
+        route = candidates[0]
+        if self.latency_slo > 0:
+            latencies = [(self.latency(candidate.model), candidate) for candidate in candidates]
+            within = [candidate for latency, candidate in latencies if latency is None or latency <= self.latency_slo]
+            if within:
+                route = within[0]
+            else:
+                route = min(latencies, key=lambda item: item[0])[1]
+            if route is not candidates[0]:
+                logging.debug("Modell %s über dem Latenzziel, verwende Route %s", candidates[0].model, route.name)
+        metrics.LLM_ROUTED.inc(route=route.name)
+        return route
@@ -0,0 +1,153 @@
+"""Playback: Ordered TTS utterance queue with a background worker.
+
+The PlaybackScheduler accepts texts from the event loop (or any thread), returns immediately and
+speaks them one after another in a dedicated worker thread. The backlog is bounded; when it is full,
+enqueue returns False so the caller can degrade (e.g. chat-only reply) instead of piling up audio.
+"""
+import collections
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Optional
+from config import env_number
+import metrics
+import tts
+
+@dataclass
+class Utterance:
+    """A queued text waiting to be spoken."""
+    text: str
+    seq: int
+    stop_event: threading.Event = field(default_factory=threading.Event)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class PlaybackScheduler:
+    """Speaks queued texts in order in a background thread.
+
+    Args:
+        speak (Callable[..., None], optional): Blocking speak function accepting ``text`` and ``stop_event``.
+            Defaults to ``tts.speak_text``.
+        max_backlog (int, optional): Maximum number of waiting utterances (the one playing is not counted).
+            Defaults to TTS_MAX_BACKLOG or 5.
+    """
+    def __init__(self, speak: Optional[Callable[..., None]] = None, max_backlog: int = None) -> None:
+        if max_backlog is None:
+            max_backlog = int(env_number("TTS_MAX_BACKLOG", 5))
+        self.speak = speak or tts.speak_text
+        self.max_backlog = max_backlog
+        self.dropped: int = 0
+        self._queue: Deque[Utterance] = collections.deque()
+        self._current: Optional[Utterance] = None
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._running = True
+        self.worker_thread = threading.Thread(target=self._worker, daemon=True, name="tts-playback")
+        self.worker_thread.start()
+
+    @property
+    def backlog(self) -> int:
+        """Number of utterances waiting to be played."""
+        with self._cond:
+            return len(self._queue)
+
+    def is_full(self) -> bool:
+        """Returns True if new utterances would currently be rejected."""
+        with self._cond:
+            return len(self._queue) >= self.max_backlog
+
+    def enqueue(self, text: str) -> bool:
+        """Queues a text for playback and returns immediately.
+
+        Args:
+            text (str): The text to be spoken.
+
+        A text that is identical to one already waiting is coalesced with it, so bursts of identical replies
+        are spoken only once.
+
+        Returns:
+            bool: True if the text was queued, coalesced or empty; False if the backlog is full or the scheduler stopped.
+        """
+        text = text.strip()
+        if not text:
+            return True
+        with self._cond:
+            if not self._running:
+                return False
+            if any(utterance.text == text for utterance in self._queue):
+                logging.debug("Gleiche TTS-Ausgabe wartet bereits: %.40s", text)
+                return True
+            if len(self._queue) >= self.max_backlog:
+                self.dropped += 1
+                logging.warning("TTS-Warteschlange voll (%d), Ausgabe wird verworfen: %.40s", self.max_backlog, text)
+                return False
+            self._queue.append(Utterance(text=text, seq=next(self._seq)))
+            self._cond.notify_all()
+            return True
+
+    def skip(self) -> bool:
+        """Stops the utterance that is currently playing.
+
+        Returns:
+            bool: True if something was playing.
+        """
+        with self._cond:
+            if self._current is None:
+                return False
+            self._current.stop_event.set()
+            return True
+
+    def flush(self) -> int:
+        """Removes all waiting utterances; the one currently playing continues.
+
+        Returns:
+            int: Number of removed utterances.
+        """
+        with self._cond:
+            removed = len(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        if removed:
+            logging.info("TTS-Warteschlange geleert (%d Einträge)", removed)
+        return removed
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Blocks until the queue is empty and nothing is playing.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the scheduler became idle within the timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and self._current is None, timeout)
+
+    def stop(self) -> None:
+        """Flushes the queue, stops current playback and ends the worker thread."""
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            if self._current is not None:
+                self._current.stop_event.set()
+            self._cond.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                utterance = self._queue.popleft()
+                self._current = utterance
+            metrics.QUEUE_WAIT.observe(time.monotonic() - utterance.enqueued_at, queue="tts")
+            try:
+                self.speak(utterance.text, stop_event=utterance.stop_event)
+            except Exception as exc:
+                metrics.ERRORS.inc(stage="playback")
+                logging.error("Fehler bei der TTS-Wiedergabe: %s", exc)
+            finally:
+                with self._cond:
+                    self._current = None
+                    self._cond.notify_all()
@@ -1,17 +1,25 @@
 import threading
 import os
+import concurrent.futures
+import time
 from typing import Any, List, Callable, Optional
-import tempfile
 import logging
 import queue
 from pynput import mouse
 import sounddevice as sd
 import numpy as np
-import scipy.io.wavfile as wav
-import requests
+from config import env_number
+from audio_buffer import AudioRingBuffer, find_pause, trim_silence
+from state_store import StateStore
+from transcription import TranscriptionBackend, create_transcriber
+import audio_output
+import metrics
+import tts
 
 logging.basicConfig(level=logging.INFO)
 
+SAMPLERATE = 16000
+
 class PTTRecorder:
     """Handles Push-to-Talk recording, transcription, AI response, TTS playback, and chat output.
 
@@ -19,12 +27,33 @@ class PTTRecorder:
         send_chat_callback (Optional[Callable[[str], None]]):
             Callback to send text to chat. Should accept a string (the message block).
         context_size (int): Number of transcripts to keep in memory for context.
+        transcriber (TranscriptionBackend, optional): Speech-to-text backend. Defaults to the backend
+            selected by TRANSCRIPTION_BACKEND (see transcription.create_transcriber).
+        state (StateStore, optional): Store that keeps the context across restarts.
     """
-    def __init__(self, send_chat_callback: Optional[Callable[[str], None]] = None, context_size: int = None) -> None:
+    STATE_NAMESPACE = "ptt"
+
+    def __init__(self, send_chat_callback: Optional[Callable[[str], None]] = None, context_size: int = None,
+                 transcriber: Optional[TranscriptionBackend] = None, state: Optional[StateStore] = None) -> None:
         self.recording: bool = False
-        self.frames: list[np.ndarray] = []
+        # Vorab allokierter Aufnahmepuffer, wird zwischen Aufnahmen wiederverwendet
+        self.buffer = AudioRingBuffer(samplerate=SAMPLERATE, channels=1, max_seconds=env_number("PTT_MAX_SECONDS", 120.0))
+        # Stille am Anfang und Ende wird vor dem Upload entfernt (PTT_VAD_THRESHOLD_DB, "off" deaktiviert)
+        vad_threshold = os.environ.get("PTT_VAD_THRESHOLD_DB", "-45")
+        try:
+            self.vad_threshold_db: Optional[float] = None if vad_threshold.lower() == "off" else float(vad_threshold)
+        except ValueError:
+            self.vad_threshold_db = -45.0
+        self.transcriber = transcriber or create_transcriber()
+        # Streaming-Modus: Segmente an Sprechpausen schon während der Aufnahme transkribieren
+        self.streaming = os.environ.get("PTT_STREAMING", "false").lower() in ("1", "true", "yes", "on")
+        self.segment_min_seconds = env_number("PTT_SEGMENT_MIN_SECONDS", 4.0)
+        self.segment_pause_ms = int(env_number("PTT_SEGMENT_PAUSE_MS", 500))
+        self.segment_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="ptt-segment")
+        self._segments: List[concurrent.futures.Future] = []
+        self._segment_start = 0
+        self._segmenter: Optional[threading.Thread] = None
         self.stream: Any = None
-        self.lock: threading.Lock = threading.Lock()
         self.send_chat_callback = send_chat_callback
         self.transcript_queue: queue.Queue = queue.Queue()
         self.worker_thread = threading.Thread(target=self._process_queue_worker, daemon=True)
@@ -35,8 +64,11 @@ class PTTRecorder:
                 context_size = int(os.environ.get("PTT_CONTEXT_SIZE", 5))
             except ValueError:
                 context_size = 5
-        self.context_memory: list[str] = []
         self.context_size = context_size
+        self.state = state
+        self.context_memory: list[str] = []
+        if state is not None:
+            self.context_memory = list(state.get(self.STATE_NAMESPACE, "context", []))[-context_size:] if context_size > 0 else []
 
     def _process_queue_worker(self):
         while True:
@@ -45,6 +77,8 @@ class PTTRecorder:
             self.context_memory.append(transcript)
             if len(self.context_memory) > self.context_size:
                 self.context_memory.pop(0)
+            if self.state is not None:
+                self.state.put(self.STATE_NAMESPACE, "context", self.context_memory)
             # Build prompt: Kontext als Hintergrund, letzte Frage explizit hervorheben
             if len(self.context_memory) > 1:
                 context_prompt = "\n".join(self.context_memory[:-1])
@@ -64,64 +98,127 @@ class PTTRecorder:
             self.transcript_queue.task_done()
 
     def _callback(self, indata: np.ndarray, _frames: int, _time_info: Any, _status: Any) -> None:
-        """Callback for sounddevice InputStream. Appends audio frames if recording."""
+        """Callback for sounddevice InputStream. Copies audio frames into the ring buffer if recording."""
         if self.recording:
-            with self.lock:
-                self.frames.append(indata.copy())
+            self.buffer.write(indata)
 
     def start_recording(self) -> None:
         """Start audio recording using sounddevice InputStream."""
         if not self.recording:
             logging.info("Aufnahme gestartet...")
-            self.frames = []
+            self.buffer.reset()
             self.stream = sd.InputStream(
-                samplerate=16000,
+                samplerate=SAMPLERATE,
                 channels=1,
+                dtype="int16",
                 callback=self._callback
             )
             self.stream.start()
             self.recording = True
+            # Laufende TTS-Ausgabe leiser stellen, solange gesprochen wird
+            output = audio_output.current_output()
+            if output is not None:
+                output.duck()
+            if self.streaming:
+                self._segments = []
+                self._segment_start = 0
+                self._segmenter = threading.Thread(target=self._segment_loop, daemon=True, name="ptt-segmenter")
+                self._segmenter.start()
+
+    def _segment_loop(self) -> None:
+        """Cuts finished segments at speech pauses while recording is running."""
+        while self.recording:
+            time.sleep(0.1)
+            self.cut_segment(final=False)
 
-    def stop_recording(self, filename: str = "aufnahme.wav") -> None:
-        """Stop recording, save audio to file, and process transcription and AI response.
+    def cut_segment(self, final: bool) -> None:
+        """Submits the audio since the last cut for background transcription.
 
         Args:
-            filename (str): Path to save the recorded WAV file.
+            final (bool): If False, only cut at a pause after at least PTT_SEGMENT_MIN_SECONDS of audio;
+                if True, submit the whole remaining tail.
+        """
+        start, samples = self.buffer.read_from(self._segment_start)
+        if not final:
+            if len(samples) < self.segment_min_seconds * SAMPLERATE:
+                return
+            threshold = self.vad_threshold_db if self.vad_threshold_db is not None else -45.0
+            cut = find_pause(samples, SAMPLERATE, threshold_db=threshold, min_pause_ms=self.segment_pause_ms)
+            if cut is None:
+                return
+            samples = samples[:cut]
+        self._segment_start = start + len(samples)
+        if self.vad_threshold_db is not None:
+            samples = trim_silence(samples, SAMPLERATE, threshold_db=self.vad_threshold_db)
+        if len(samples):
+            logging.debug("PTT-Segment: %.1fs ab %.1fs", len(samples) / SAMPLERATE, start / SAMPLERATE)
+            self._segments.append(self.segment_pool.submit(self._transcribe_segment, samples))
+
+    def _transcribe_segment(self, samples: np.ndarray) -> str:
+        try:
+            with metrics.TRANSCRIPTION.time(backend=self.transcriber.name):
+                return self.transcriber.transcribe(samples, SAMPLERATE)
+        except Exception as exc:
+            metrics.ERRORS.inc(stage="transcription")
+            logging.error("Fehler bei der Transkription eines Segments: %s", exc)
+            return ""
+
+    def stop_recording(self) -> None:
+        """Stop recording, trim silence, encode the audio in memory, and process transcription and AI response.
+
+        Recordings without speech are dropped without calling the API.
         """
         if self.recording:
-            logging.info("Aufnahme gestoppt. Speichere nach %s", filename)
             self.recording = False
             self.stream.stop()
             self.stream.close()
-            audio = np.concatenate(self.frames, axis=0)
-            wav.write(filename, 16000, audio)
-            logging.info("Datei gespeichert: %s", filename)
-            self.handle_transcription_and_ai(filename)
+            output = audio_output.current_output()
+            if output is not None:
+                output.unduck()
+            logging.info("Aufnahme gestoppt (%.1fs)", self.buffer.duration)
+            if self.streaming:
+                self._finish_segments()
+                return
+            samples = self.buffer.read()
+            if self.vad_threshold_db is not None:
+                samples = trim_silence(samples, SAMPLERATE, threshold_db=self.vad_threshold_db)
+                if not len(samples):
+                    logging.info("Keine Sprache erkannt, Aufnahme verworfen.")
+                    return
+            self.handle_transcription_and_ai(samples)
+
+    def _finish_segments(self) -> None:
+        """Transcribes the tail segment and stitches all segment transcripts together in order."""
+        if self._segmenter is not None:
+            self._segmenter.join()
+            self._segmenter = None
+        self.cut_segment(final=True)
+        segments, self._segments = self._segments, []
+        texts = [future.result() for future in segments]
+        transcript = " ".join(text for text in texts if text)
+        if not transcript:
+            logging.info("Keine Sprache erkannt, Aufnahme verworfen.")
+            return
+        logging.info("Transkript aus %d Segment(en): %s", len(segments), transcript)
+        self.transcript_queue.put(transcript)
 
-    def handle_transcription_and_ai(self, filename: str) -> None:
-        """Transcribes audio file, gets AI response, and triggers central message processing.
+    def handle_transcription_and_ai(self, samples: np.ndarray) -> None:
+        """Transcribes the recording, gets AI response, and triggers central message processing.
 
         Args:
-            filename (str): Path to the WAV file to transcribe.
+            samples (np.ndarray): The recording as 16-bit PCM samples at 16 kHz.
         """
+        logging.info("Transkribiere Audio (%s)...", self.transcriber.name)
         try:
-            from openai import OpenAI
-        except ImportError:
-            logging.error("Fehlende Abhängigkeit: openai. Bitte installiere mit 'pip install openai'.")
+            with metrics.TRANSCRIPTION.time(backend=self.transcriber.name):
+                transcript = self.transcriber.transcribe(samples, SAMPLERATE)
+        except Exception as exc:
+            metrics.ERRORS.inc(stage="transcription")
+            logging.error("Fehler bei der Transkription: %s", exc)
+            return
+        if not transcript:
+            logging.info("Leeres Transkript, nichts zu tun.")
             return
-        api_key = os.environ.get("OPENAI_API_KEY")
-        logging.info("Transkribiere Audio mit Whisper...")
-        client = OpenAI(api_key=api_key)
-        with open(filename, "rb") as audio_file:
-            try:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
-                )
-            except Exception as exc:
-                logging.error("Fehler bei der Transkription: %s", exc)
-                return
         logging.info("Transkript: %s", transcript)
         logging.info("Lege Transkript in die Warteschlange...")
         self.transcript_queue.put(transcript)
@@ -158,53 +255,23 @@ class PTTRecorder:
         return blocks
 
     def speak_text(self, text: str) -> None:
-        """Converts text to speech using the ElevenLabs API and plays the resulting audio file.
+        """Converts text to speech using the ElevenLabs streaming API and plays it while it downloads.
 
         Args:
             text (str): The text to be spoken.
         """
-        api_key = os.environ.get('ELEVENLABS_API_KEY', 'PLACEHOLDER_API_KEY')
-        voice_id = os.environ.get('ELEVENLABS_VOICE_ID', 'tKmESGVo91DcC5kFPRS6')
-        model_id = os.environ.get('ELEVENLABS_MODEL_ID', 'eleven_multilingual_v2')
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        headers = {
-            "xi-api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "text": text,
-            "model_id": model_id,
-            "voice_settings": {"stability": 0.75, "similarity_boost": 0.25}
-        }
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-                tmp_file.write(response.content)
-                tmp_file.flush()
-                try:
-                    import subprocess
-                    subprocess.run(["mpg123", "-q", tmp_file.name], check=True)
-                except FileNotFoundError:
-                    try:
-                        subprocess.run(["mpv", "--quiet", tmp_file.name], check=True)
-                    except FileNotFoundError as exc2:
-                        logging.error("Audioausgabe fehlgeschlagen: %s", exc2)
-                finally:
-                    try:
-                        os.remove(tmp_file.name)
-                    except Exception as exc3:
-                        logging.warning("Konnte TTS-Audiodatei nicht löschen: %s", exc3)
-        except (requests.exceptions.RequestException, subprocess.SubprocessError) as exc:
-            logging.error("TTS-Fehler: %s", exc)
-
-def ptt_listener_background(send_chat_callback: Optional[Callable[[str], None]] = None) -> mouse.Listener:
+        tts.speak_text(text)
+
+def ptt_listener_background(send_chat_callback: Optional[Callable[[str], None]] = None,
+                            state: Optional[StateStore] = None) -> mouse.Listener:
     """Starts a background listener for Push-to-Talk (Mouse5) and returns the listener object.
 
     Args:
         send_chat_callback (Optional[Callable[[str], None]]): Callback to send text to chat.
+        state (StateStore, optional): Store that keeps the PTT context across restarts.
     """
-    recorder = PTTRecorder(send_chat_callback=send_chat_callback)
+    recorder = PTTRecorder(send_chat_callback=send_chat_callback, state=state)
+    recorder.transcriber.warm_up()
     def on_click(x: float, y: float, button: Any, pressed: bool) -> None:
         SUPPORTED_BUTTONS = (mouse.Button.button9,)
         if button in SUPPORTED_BUTTONS:
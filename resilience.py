@@ -0,0 +1,322 @@
+"""Resilience: Deadline budgets, jittered retries, hedged requests and circuit breakers for upstream APIs.
+
+Every upstream (OpenAI chat, Whisper, ElevenLabs, Twitch Helix) gets an ``Upstream`` that wraps its
+calls:
+
+- Deadline: a request has one time budget for all attempts together; each attempt only gets the time
+  that is left, so a slow upstream cannot pin a handler longer than the budget.
+- Retry: transient errors (timeouts, connection errors, HTTP 429/5xx) are retried with full-jitter
+  exponential backoff, but only if the call is idempotent and the remaining budget allows it.
+- Hedging: optionally, a second identical request is started if the first has not answered after
+  ``hedge_after`` seconds; the first result wins and the other request is cancelled.
+- Circuit breaker: after ``failure_threshold`` consecutive transient failures the upstream is marked
+  as degraded and calls fail immediately with CircuitOpenError for ``reset_timeout`` seconds. Callers
+  then serve a cached or text-only fallback. Afterwards a single trial call decides whether the
+  circuit closes again.
+
+Settings per upstream (prefix OPENAI, WHISPER, ELEVENLABS or HELIX): ``<PREFIX>_RETRIES`` (default 2),
+``<PREFIX>_BREAKER_THRESHOLD`` (default 5, 0 disables the breaker), ``<PREFIX>_BREAKER_RESET``
+(default 30s) and ``<PREFIX>_HEDGE_AFTER`` (default 0, off). RETRY_BASE_DELAY (default 0.25s) and
+RETRY_MAX_DELAY (default 2s) shape the backoff.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from config import env_number
+import metrics
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+def is_timeout_or_connection_error(exc: BaseException) -> bool:
+    """Default classification of transient errors: timeouts and connection errors."""
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+class Deadline:
+    """Time budget of one logical request, shared by all of its attempts.
+
+    Args:
+        seconds (float): Budget in seconds from now.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.expires_at = clock() + max(seconds, 0.0)
+
+    def remaining(self) -> float:
+        """Seconds left in the budget (never negative)."""
+        return max(self.expires_at - self.clock(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """True if the budget is used up."""
+        return self.remaining() <= 0.0
+
+class RetryPolicy:
+    """Number of retries and full-jitter exponential backoff between them.
+
+    Args:
+        retries (int): Additional attempts after the first one.
+        base_delay (float): Backoff cap of the first retry in seconds; doubled for every further retry.
+        max_delay (float): Upper bound of the backoff cap.
+    """
+    def __init__(self, retries: int = 2, base_delay: float = 0.25, max_delay: float = 2.0) -> None:
+        self.retries = max(retries, 0)
+        self.base_delay = max(base_delay, 0.0)
+        self.max_delay = max(max_delay, 0.0)
+
+    def delay(self, attempt: int) -> float:
+        """Returns a random delay before retry number attempt + 1 (full jitter)."""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial call.
+
+    Args:
+        name (str): Upstream name for logging.
+        failure_threshold (int): Consecutive failures that open the circuit; 0 disables the breaker.
+        reset_timeout (float): Seconds the circuit stays open before a trial call is allowed.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state: closed, open or half_open."""
+        with self._lock:
+            self._update()
+            return self._state
+
+    def _update(self) -> None:
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_running = False
+
+    def allow(self) -> bool:
+        """Returns True if a call may go to the upstream now (in half-open state: one trial call)."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            self._update()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Records an answered call and closes the circuit."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info("%s antwortet wieder, Circuit geschlossen", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """Ends a half-open trial call that was aborted (e.g. cancelled) without an answer; the state is kept."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Records a transient failure; opens the circuit at the threshold or after a failed trial call."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial_running = False
+                logging.warning("%s gestört (%d Fehler in Folge), Circuit für %.0fs offen",
+                                self.name, self._failures, self.reset_timeout)
+
+class Upstream:
+    """Retry, hedging and circuit breaker settings of one upstream service.
+
+    Args:
+        name (str): Service name, used as metric label, e.g. ``openai``.
+        retry (RetryPolicy, optional): Retry policy; defaults to two retries.
+        breaker (CircuitBreaker, optional): Circuit breaker; defaults to five failures and 30s.
+        hedge_after (float): Seconds after which an async idempotent call is hedged; 0 disables hedging.
+        is_transient (Callable[[BaseException], bool]): Decides whether an error is retried and counted
+            by the breaker. Other errors mean the upstream answered (e.g. HTTP 400) and are raised at once.
+    """
+    def __init__(self, name: str, retry: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 hedge_after: float = 0.0,
+                 is_transient: Callable[[BaseException], bool] = is_timeout_or_connection_error) -> None:
+        self.name = name
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge_after = max(hedge_after, 0.0)
+        self.is_transient = is_transient
+        metrics.CIRCUIT_OPEN.set_function(lambda: int(self.breaker.state != CircuitBreaker.CLOSED), service=name)
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str,
+                 is_transient: Callable[[BaseException], bool] = is_timeout_or_connection_error) -> "Upstream":
+        """Creates an upstream from ``<prefix>_RETRIES``, ``<prefix>_BREAKER_THRESHOLD``,
+        ``<prefix>_BREAKER_RESET``, ``<prefix>_HEDGE_AFTER``, RETRY_BASE_DELAY and RETRY_MAX_DELAY."""
+        return cls(
+            name,
+            retry=RetryPolicy(
+                retries=int(env_number(f"{prefix}_RETRIES", 2)),
+                base_delay=env_number("RETRY_BASE_DELAY", 0.25),
+                max_delay=env_number("RETRY_MAX_DELAY", 2.0),
+            ),
+            breaker=CircuitBreaker(
+                name,
+                failure_threshold=int(env_number(f"{prefix}_BREAKER_THRESHOLD", 5)),
+                reset_timeout=env_number(f"{prefix}_BREAKER_RESET", 30.0),
+            ),
+            hedge_after=env_number(f"{prefix}_HEDGE_AFTER", 0.0),
+            is_transient=is_transient,
+        )
+
+    def check(self) -> None:
+        """Raises CircuitOpenError if the upstream may not be called now."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} ist vorübergehend deaktiviert")
+
+    def success(self) -> None:
+        """Records an answered call."""
+        self.breaker.record_success()
+
+    def release(self) -> None:
+        """Records a call that was aborted before it got an answer (cancelled, generator closed)."""
+        self.breaker.release_trial()
+
+    def failure(self, exc: BaseException) -> None:
+        """Records a failed call; errors that are not transient count as an answer of the upstream."""
+        if isinstance(exc, CircuitOpenError):
+            return
+        if self.is_transient(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def backoff(self, exc: BaseException, attempt: int, deadline: Deadline) -> Optional[float]:
+        """Returns the delay before the next attempt, or None if the error must be raised.
+
+        Args:
+            exc (BaseException): Error of the failed attempt.
+            attempt (int): Number of retries so far.
+            deadline (Deadline): Budget of the request; no retry is made if it would be used up.
+        """
+        if attempt >= self.retry.retries or not self.is_transient(exc) or isinstance(exc, CircuitOpenError):
+            return None
+        delay = self.retry.delay(attempt)
+        if deadline.remaining() <= delay or self.breaker.state == CircuitBreaker.OPEN:
+            return None
+        metrics.RETRIES.inc(service=self.name)
+        logging.info("%s: Versuch %d fehlgeschlagen (%s), neuer Versuch in %.2fs",
+                     self.name, attempt + 1, exc.__class__.__name__, delay)
+        return delay
+
+    def call(self, func: Callable[[float], T], deadline: Deadline) -> T:
+        """Runs a blocking idempotent call with retries within the deadline.
+
+        Args:
+            func (Callable[[float], T]): Performs one attempt; receives the remaining budget as its timeout.
+            deadline (Deadline): Budget of the whole request.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            Exception: The error of the last attempt.
+        """
+        attempt = 0
+        while True:
+            self.check()
+            try:
+                result = func(deadline.remaining())
+            except Exception as exc:
+                self.failure(exc)
+                delay = self.backoff(exc, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.success()
+            return result
+
+    async def call_async(self, factory: Callable[[float], Awaitable[T]], deadline: Deadline, hedge: bool = True) -> T:
+        """Runs an idempotent coroutine with retries (and hedging, if enabled) within the deadline.
+
+        Args:
+            factory (Callable[[float], Awaitable[T]]): Creates one attempt; receives the remaining budget
+                as its timeout.
+            deadline (Deadline): Budget of the whole request.
+            hedge (bool): Allow a hedged second request (only if hedge_after is set).
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            Exception: The error of the last attempt.
+        """
+        attempt = 0
+        while True:
+            self.check()
+            try:
+                if hedge and self.hedge_after > 0:
+                    result = await self._hedged(factory, deadline)
+                else:
+                    result = await factory(deadline.remaining())
+            except Exception as exc:
+                self.failure(exc)
+                delay = self.backoff(exc, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Abgebrochener Versuch (CancelledError): ein laufender Probeaufruf darf den Circuit nicht blockieren
+                self.release()
+                raise
+            self.success()
+            return result
+
+    async def _hedged(self, factory: Callable[[float], Awaitable[T]], deadline: Deadline) -> T:
+        """Starts a second request after hedge_after seconds and returns the first successful result."""
+        tasks = {asyncio.ensure_future(factory(deadline.remaining()))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_after, deadline.remaining()))
+            if not done and not deadline.expired:
+                metrics.HEDGES.inc(service=self.name)
+                logging.debug("%s: Antwort nach %.2fs ausstehend, starte zweite Anfrage", self.name, self.hedge_after)
+                tasks.add(asyncio.ensure_future(factory(deadline.remaining())))
+            error: Optional[BaseException] = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,246 @@
+"""State store: Embedded SQLite database for state that should survive a restart.
+
+Caches and histories that are expensive to rebuild (greeted users, Twitch user IDs and follower status,
+conversation history, the push-to-talk context and the index of the TTS disk cache) are mirrored into one
+SQLite file (STATE_DB), so a restarted bot is warm immediately instead of asking Helix and OpenAI again.
+
+The database runs in WAL mode, so reads never wait for a write. All writes go through a queue to a
+single writer thread, which commits them in batches (at most every STATE_FLUSH_INTERVAL seconds or
+STATE_BATCH_SIZE operations); ``put`` and ``delete`` therefore never block the caller, not even on the
+event loop. Reads use one connection per thread and indexed lookups; ``aget`` and ``aload`` run them in
+a worker thread for use in coroutines. The in-memory caches stay the source of truth while the bot is
+running; the store is read once at startup.
+
+Tables:
+
+- ``kv``: JSON values by namespace and key with an optional expiry time (wall clock).
+- ``tts_audio``: Key, size and last use of the files in the TTS disk cache, in LRU order.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+from config import env_number
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at);
+CREATE TABLE IF NOT EXISTS tts_audio (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tts_audio_last_used ON tts_audio (last_used);
+"""
+
+class StateStore:
+    """SQLite-backed key-value store with a single batching writer thread.
+
+    Args:
+        path (str): Database file; created with its tables if it does not exist.
+        flush_interval (float): Seconds the writer collects operations before it commits them.
+        batch_size (int): Operations committed at most in one transaction.
+        clock (Callable[[], float]): Wall clock for expiry times, replaceable in tests.
+
+    Raises:
+        sqlite3.Error: If the database cannot be opened or its tables cannot be created.
+    """
+    PURGE_INTERVAL = 3600.0
+    _STOP = object()
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 500, clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        self.flush_interval = max(flush_interval, 0.0)
+        self.batch_size = max(batch_size, 1)
+        self.clock = clock
+        self._queue: queue.Queue = queue.Queue()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._closed = False
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._purge_expired(self._writer)
+        self._writer.commit()
+        self._last_purge = self.clock()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True, name="state-writer")
+        self._thread.start()
+        logging.info("Zustandsspeicher geöffnet: %s", path)
+
+    @classmethod
+    def from_env(cls) -> Optional["StateStore"]:
+        """Creates a store from STATE_DB (default unset, no persistence), STATE_FLUSH_INTERVAL (default 0.5s)
+        and STATE_BATCH_SIZE (default 500). Returns None if STATE_DB is unset or cannot be opened."""
+        path = os.environ.get("STATE_DB")
+        if not path:
+            return None
+        try:
+            return cls(path, flush_interval=env_number("STATE_FLUSH_INTERVAL", 0.5), batch_size=int(env_number("STATE_BATCH_SIZE", 500)))
+        except sqlite3.Error as exc:
+            logging.error("Zustandsspeicher nicht nutzbar (%s): %s", path, exc)
+            return None
+
+    @property
+    def backlog(self) -> int:
+        """Write operations waiting for the writer thread."""
+        return self._queue.qsize()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Im WAL-Modus reicht NORMAL: ein Absturz kann nur die letzten Commits kosten, nie die Datei beschädigen
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _enqueue(self, sql: str, params: tuple) -> None:
+        if self._closed:
+            logging.debug("Zustandsspeicher geschlossen, Schreibvorgang verworfen")
+            return
+        self._queue.put((sql, params))
+
+    def put(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores a JSON-serializable value; returns immediately, the write is committed in the next batch.
+
+        Args:
+            namespace (str): Group of keys, e.g. ``"greeted"``.
+            key (str): Key within the namespace.
+            value (Any): JSON-serializable value.
+            ttl (float, optional): Seconds until the entry expires; None keeps it until it is deleted.
+        """
+        expires_at = None if ttl is None else self.clock() + ttl
+        self._enqueue("INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                      (namespace, key, json.dumps(value, ensure_ascii=False), expires_at))
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Removes an entry; returns immediately."""
+        self._enqueue("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Returns the committed value of an entry, or default if it is missing or expired."""
+        try:
+            row = self._reader().execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, self.clock())).fetchone()
+        except sqlite3.Error as exc:
+            logging.warning("Zustand %s/%s konnte nicht gelesen werden: %s", namespace, key, exc)
+            return default
+        return default if row is None else json.loads(row[0])
+
+    def load(self, namespace: str) -> List[Tuple[str, Any, Optional[float]]]:
+        """Returns all live entries of a namespace as ``(key, value, ttl)``, the soonest to expire first.
+
+        ttl is the remaining lifetime in seconds (None for entries without expiry), so the entries can be
+        put straight into a cache with a monotonic clock.
+        """
+        now = self.clock()
+        try:
+            rows = self._reader().execute(
+                "SELECT key, value, expires_at FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) "
+                "ORDER BY expires_at", (namespace, now)).fetchall()
+        except sqlite3.Error as exc:
+            logging.warning("Zustand %s konnte nicht geladen werden: %s", namespace, exc)
+            return []
+        return [(key, json.loads(value), None if expires_at is None else expires_at - now) for key, value, expires_at in rows]
+
+    async def aget(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Like ``get``, without blocking the event loop."""
+        return await asyncio.to_thread(self.get, namespace, key, default)
+
+    async def aload(self, namespace: str) -> List[Tuple[str, Any, Optional[float]]]:
+        """Like ``load``, without blocking the event loop."""
+        return await asyncio.to_thread(self.load, namespace)
+
+    def touch_audio(self, key: str, size: int, last_used: Optional[float] = None) -> None:
+        """Records a TTS cache file as used now (or at last_used); returns immediately."""
+        self._enqueue("INSERT OR REPLACE INTO tts_audio (key, size, last_used) VALUES (?, ?, ?)",
+                      (key, size, self.clock() if last_used is None else last_used))
+
+    def remove_audio(self, key: str) -> None:
+        """Removes a TTS cache file from the index; returns immediately."""
+        self._enqueue("DELETE FROM tts_audio WHERE key = ?", (key,))
+
+    def audio_index(self) -> List[Tuple[str, int]]:
+        """Returns ``(key, size)`` of all indexed TTS cache files, least recently used first."""
+        try:
+            return self._reader().execute("SELECT key, size FROM tts_audio ORDER BY last_used").fetchall()
+        except sqlite3.Error as exc:
+            logging.warning("TTS-Cache-Index konnte nicht gelesen werden: %s", exc)
+            return []
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Waits until all writes queued so far are committed; returns False on timeout or after close."""
+        if self._closed:
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Commits pending writes, stops the writer thread and closes all connections."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join(timeout=10)
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        self._writer.close()
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM kv WHERE expires_at <= ?", (self.clock(),))
+
+    def _write_loop(self) -> None:
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Weitere Schreibvorgänge sammeln, bis das Intervall abläuft, der Batch voll ist
+            # oder jemand auf den Commit wartet (flush, close)
+            while len(batch) < self.batch_size and isinstance(batch[-1], tuple):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit([op for op in batch if isinstance(op, tuple)])
+            for op in batch:
+                if isinstance(op, threading.Event):
+                    op.set()
+                elif op is self._STOP:
+                    running = False
+            if running and self._queue.empty() and self.clock() - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = self.clock()
+                self._commit([], purge=True)
+
+    def _commit(self, operations: List[Tuple[str, tuple]], purge: bool = False) -> None:
+        try:
+            with self._writer:
+                for sql, params in operations:
+                    self._writer.execute(sql, params)
+                if purge:
+                    self._purge_expired(self._writer)
+        except sqlite3.Error as exc:
+            logging.error("Zustand konnte nicht gespeichert werden (%d Änderungen verworfen): %s", len(operations), exc)
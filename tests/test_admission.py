@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from admission import AdmissionRejected, AdmissionScheduler, Priority
+
+@pytest.mark.asyncio
+async def test_waiting_jobs_run_by_priority():
+    """Test that a busy worker serves the highest priority class next, FIFO within a class."""
+    scheduler = AdmissionScheduler(workers=1, user_rate=0, token_budget=0)
+    gate = asyncio.Event()
+    order = []
+    def job(name):
+        async def run():
+            if name == "blocker":
+                await gate.wait()
+            order.append(name)
+        return run
+    tasks = [asyncio.create_task(scheduler.run(job("blocker"), Priority.VIEWER, "a"))]
+    await asyncio.sleep(0)
+    for name, priority in [("viewer", Priority.VIEWER), ("sub", Priority.SUB), ("mod", Priority.MOD),
+                           ("ptt", Priority.PTT), ("sub2", Priority.SUB)]:
+        tasks.append(asyncio.create_task(scheduler.run(job(name), priority, name)))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    assert order == ["blocker", "ptt", "mod", "sub", "sub2", "viewer"]
+    await scheduler.aclose()
+
+@pytest.mark.asyncio
+async def test_user_rate_and_token_budget():
+    """Test that viewers are limited per window while mods are exempt."""
+    now = [0.0]
+    scheduler = AdmissionScheduler(user_rate=2, token_budget=100, window=60, clock=lambda: now[0])
+    async def job():
+        return "ok"
+    assert await scheduler.run(job, Priority.VIEWER, "Fan") == "ok"
+    assert await scheduler.run(job, Priority.VIEWER, "fan") == "ok"
+    with pytest.raises(AdmissionRejected) as exc:
+        await scheduler.run(job, Priority.VIEWER, "fan")
+    assert exc.value.reason == "rate_limited"
+    assert await scheduler.run(job, Priority.MOD, "fan") == "ok"
+    now[0] = 61.0
+    scheduler.charge("gast", 90)
+    with pytest.raises(AdmissionRejected) as exc:
+        await scheduler.run(job, Priority.FOLLOWER, "gast", cost=20)
+    assert exc.value.reason == "budget_exceeded"
+    assert await scheduler.run(job, Priority.FOLLOWER, "fan") == "ok"
+    await scheduler.aclose()
+
+@pytest.mark.asyncio
+async def test_stale_and_displaced_jobs_are_dropped():
+    """Test that jobs waiting too long are dropped and a full queue displaces the lowest priority."""
+    now = [0.0]
+    scheduler = AdmissionScheduler(workers=1, max_queue=2, max_wait=10, user_rate=0, token_budget=0, clock=lambda: now[0])
+    gate = asyncio.Event()
+    async def blocker():
+        await gate.wait()
+    async def job():
+        return "ok"
+    first = asyncio.create_task(scheduler.run(blocker, Priority.VIEWER))
+    await asyncio.sleep(0)
+    old = asyncio.create_task(scheduler.run(job, Priority.VIEWER))
+    low = asyncio.create_task(scheduler.run(job, Priority.VIEWER))
+    await asyncio.sleep(0)
+    now[0] = 11.0
+    high = asyncio.create_task(scheduler.run(job, Priority.OWNER))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as exc:
+        await scheduler.run(job, Priority.VIEWER)
+    assert exc.value.reason == "queue_full"
+    gate.set()
+    await first
+    assert await high == "ok"
+    for task in (old, low):
+        with pytest.raises(AdmissionRejected) as exc:
+            await task
+        assert exc.value.reason in ("queue_full", "stale")
+    assert scheduler.rejected["queue_full"] == 2 and scheduler.rejected["stale"] == 1
+    await scheduler.aclose()
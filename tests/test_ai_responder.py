@@ -0,0 +1,263 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ai_responder import AIResponder
+
+def make_completion(text: str):
+    """Builds a minimal object shaped like an OpenAI chat completion."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+def make_responder(create) -> AIResponder:
+    """Creates an AIResponder whose async client uses the given create coroutine."""
+    responder = AIResponder(api_key="dummy", system_prompt="System")
+    client = MagicMock()
+    client.chat.completions.create = create
+    responder._client = client
+    return responder
+
+@pytest.mark.asyncio
+async def test_get_response_returns_stripped_text():
+    """Test that the async responder returns the stripped completion text."""
+    async def create(**kwargs):
+        assert kwargs["messages"][0] == {"role": "system", "content": "System"}
+        return make_completion("  Hallo!  ")
+    responder = make_responder(create)
+    assert await responder.get_response("Hi") == "Hallo!"
+
+@pytest.mark.asyncio
+async def test_get_response_timeout_returns_fallback():
+    """Test that a slow API call is aborted after the timeout."""
+    async def create(**kwargs):
+        await asyncio.sleep(5)
+    responder = make_responder(create)
+    reply = await responder.get_response("Hi", timeout=0.05)
+    assert reply.startswith("Entschuldigung")
+
+@pytest.mark.asyncio
+async def test_get_response_runs_concurrently():
+    """Test that several requests can be in flight at the same time."""
+    async def create(**kwargs):
+        await asyncio.sleep(0.2)
+        return make_completion(kwargs["messages"][1]["content"])
+    responder = make_responder(create)
+    start = time.monotonic()
+    replies = await asyncio.gather(*(responder.get_response(f"Frage {i}") for i in range(5)))
+    assert replies == [f"Frage {i}" for i in range(5)]
+    assert time.monotonic() - start < 0.6
+
+@pytest.mark.asyncio
+async def test_get_response_cancellation_propagates():
+    """Test that cancelling the awaiting task aborts the request instead of returning a fallback."""
+    async def create(**kwargs):
+        await asyncio.sleep(5)
+    responder = make_responder(create)
+    task = asyncio.create_task(responder.get_response("Hi"))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+class FakeStream:
+    """Async iterator shaped like an OpenAI chat completion stream."""
+    def __init__(self, deltas):
+        self.deltas = list(deltas)
+        self.closed = False
+    def __aiter__(self):
+        return self
+    async def __anext__(self):
+        if not self.deltas:
+            raise StopAsyncIteration
+        delta = self.deltas.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+    async def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_stream_response_yields_deltas():
+    """Test that the streaming mode yields the text deltas in order and closes the stream."""
+    stream = FakeStream(["\n", "Hallo", None, " Welt", "!"])
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+    responder = make_responder(create)
+    deltas = [d async for d in responder.stream_response("Hi")]
+    assert deltas == ["Hallo", " Welt", "!"]
+    assert stream.closed
+
+@pytest.mark.asyncio
+async def test_stream_response_error_yields_fallback():
+    """Test that a failing request yields the fallback text."""
+    import openai
+    async def create(**kwargs):
+        raise openai.OpenAIError("kaputt")
+    responder = make_responder(create)
+    deltas = [d async for d in responder.stream_response("Hi")]
+    assert deltas == ["Entschuldigung, ich kann gerade nicht antworten."]
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_before_first_token():
+    """Test that connection errors are retried in both modes while no text was produced."""
+    import httpx
+    import openai
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) % 2:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://test"))
+        return FakeStream(["Hallo"]) if kwargs.get("stream") else make_completion("Hallo")
+    responder = make_responder(create)
+    responder.upstream.retry.base_delay = 0
+    assert await responder.get_response("Hi") == "Hallo"
+    assert [d async for d in responder.stream_response("Na?")] == ["Hallo"]
+    assert len(calls) == 4
+
+@pytest.mark.asyncio
+async def test_open_circuit_returns_degraded_fallback_without_request():
+    """Test that the responder fails fast with a fallback text while OpenAI is degraded."""
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return make_completion("Hallo")
+    responder = make_responder(create)
+    responder.upstream.breaker.failure_threshold = 1
+    responder.upstream.breaker.record_failure()
+    assert await responder.get_response("Hi") == AIResponder.FALLBACK_DEGRADED
+    assert [d async for d in responder.stream_response("Hi")] == [AIResponder.FALLBACK_DEGRADED]
+    assert AIResponder.is_fallback(AIResponder.FALLBACK_DEGRADED)
+    assert calls == []
+
+@pytest.mark.asyncio
+async def test_router_chooses_model_and_max_tokens(monkeypatch):
+    """Test that the routed model and max_tokens are sent and the latency is recorded per model."""
+    from admission import Priority
+    monkeypatch.setenv("OPENAI_ROUTES", '[{"model": "mini", "max_tokens": 40, "priorities": ["viewer"]}, {"model": "big"}]')
+    calls = []
+    async def create(**kwargs):
+        calls.append((kwargs["model"], kwargs["max_tokens"]))
+        return make_completion("Antwort")
+    responder = make_responder(create)
+    responder.router.min_samples = 1
+    await responder.get_response("Hi", priority=Priority.VIEWER)
+    await responder.get_response("Hi", priority=Priority.PTT)
+    assert calls == [("mini", 40), ("big", responder.max_tokens)]
+    assert responder.router.latency("mini") is not None
+
+@pytest.mark.asyncio
+async def test_identical_prompts_share_one_request():
+    """Test that identical concurrent prompts are coalesced into a single API call."""
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.05)
+        return make_completion("Geteilte Antwort")
+    responder = make_responder(create)
+    prompts = ["@nicole wie alt bist du?", "@Nicole  wie alt bist du", "@NICOLE Wie alt bist du?!"]
+    replies = await asyncio.gather(*(responder.get_response(p) for p in prompts))
+    assert replies == ["Geteilte Antwort"] * 3
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_response_cache_hit_and_expiry():
+    """Test that answers are cached for the TTL and requested again afterwards."""
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return make_completion(f"Antwort {len(calls)}")
+    responder = make_responder(create)
+    now = [0.0]
+    responder.response_cache.clock = lambda: now[0]
+    responder.response_cache.ttl = 60
+    assert await responder.get_response("Hallo") == "Antwort 1"
+    assert await responder.get_response("hallo!") == "Antwort 1"
+    now[0] = 61.0
+    assert await responder.get_response("Hallo") == "Antwort 2"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached():
+    """Test that fallback answers after an error are not cached."""
+    import openai
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise openai.OpenAIError("kaputt")
+        return make_completion("Jetzt klappt es")
+    responder = make_responder(create)
+    assert (await responder.get_response("Hallo")).startswith("Entschuldigung")
+    assert await responder.get_response("Hallo") == "Jetzt klappt es"
+
+@pytest.mark.asyncio
+async def test_stream_followers_share_leader_stream():
+    """Test that a concurrent identical streaming prompt follows the running stream."""
+    calls = []
+    class SlowStream(FakeStream):
+        async def __anext__(self):
+            await asyncio.sleep(0.01)
+            return await super().__anext__()
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return SlowStream(["Eins", " zwei", " drei"])
+    responder = make_responder(create)
+    async def collect():
+        return "".join([d async for d in responder.stream_response("Zähl bis drei")])
+    results = await asyncio.gather(collect(), collect())
+    assert results == ["Eins zwei drei", "Eins zwei drei"]
+    assert len(calls) == 1
+    # Danach kommt die Antwort aus dem Cache
+    assert await collect() == "Eins zwei drei"
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_follower_retries_when_leader_is_cancelled():
+    """Test that a follower runs its own request if the shared request was cancelled."""
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return make_completion("Eigene Antwort")
+    responder = make_responder(create)
+    leader = asyncio.create_task(responder.get_response("Hallo"))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(responder.get_response("Hallo"))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == "Eigene Antwort"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_history_is_sent_between_system_prompt_and_question():
+    """Test that earlier turns are part of the request and of the cache key."""
+    calls = []
+    async def create(**kwargs):
+        calls.append(kwargs["messages"])
+        return make_completion("Antwort")
+    responder = make_responder(create)
+    history = [{"role": "user", "content": "Ich heiße Max."}, {"role": "assistant", "content": "Hallo Max!"}]
+    await responder.get_response("Wie heiße ich?", history=history)
+    await responder.get_response("Wie heiße ich?")
+    assert calls[0] == [{"role": "system", "content": "System"}, *history, {"role": "user", "content": "Wie heiße ich?"}]
+    assert len(calls) == 2
+
+def test_system_prompt_tokens_are_cached_per_prompt():
+    """Test that the system prompt token count is recomputed only when the prompt changes."""
+    responder = AIResponder(api_key="dummy", system_prompt="x" * 40)
+    assert responder.system_prompt_tokens == 10
+    responder.system_prompt = "x" * 80
+    assert responder.system_prompt_tokens == 20
+    assert AIResponder.is_fallback(AIResponder.FALLBACK_TIMEOUT)
+    assert not AIResponder.is_fallback("Hallo")
+
+def test_prompts_differing_in_operators_have_different_keys():
+    """Test that prompts differing only in operators or symbols do not share a cache entry."""
+    normalize = AIResponder.normalize_prompt
+    assert normalize("Nicole was ist 2+2?") != normalize("Nicole was ist 2*2?")
+    assert normalize("is 5>3") != normalize("is 5<3")
+    assert normalize("  Nicole   WAS ist 2+2?! ") == normalize("nicole was ist 2+2")
@@ -0,0 +1,79 @@
+import io
+import os
+import sys
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from audio_buffer import AudioRingBuffer, encode_wav
+
+def blocks(start, count, size=4):
+    """Returns count consecutive blocks of shape (size, 1) with increasing sample values."""
+    return [np.arange(start + i * size, start + (i + 1) * size, dtype=np.int16).reshape(-1, 1) for i in range(count)]
+
+def test_buffer_grows_and_keeps_order():
+    """Test that the buffer grows by doubling and returns all samples in order."""
+    buffer = AudioRingBuffer(samplerate=10, initial_seconds=0.8, max_seconds=10)
+    for block in blocks(0, 5):
+        buffer.write(block)
+    assert buffer.capacity == 32
+    assert len(buffer) == 20
+    assert buffer.read().ravel().tolist() == list(range(20))
+    buffer.reset()
+    assert len(buffer) == 0 and buffer.capacity == 32
+
+def test_buffer_wraps_at_max_duration():
+    """Test that only the most recent max_seconds of audio are kept."""
+    buffer = AudioRingBuffer(samplerate=10, initial_seconds=0.4, max_seconds=1)
+    for block in blocks(0, 7):
+        buffer.write(block)
+    assert buffer.capacity == 10
+    assert buffer.read().ravel().tolist() == list(range(18, 28))
+
+def test_encode_wav_in_memory():
+    """Test that encode_wav produces a readable 16-bit WAV without touching the disk."""
+    samples = np.arange(100, dtype=np.int16).reshape(-1, 1)
+    data = encode_wav(samples, 16000)
+    with wave.open(io.BytesIO(data)) as wav_file:
+        assert wav_file.getframerate() == 16000
+        assert wav_file.getsampwidth() == 2
+        assert np.frombuffer(wav_file.readframes(100), dtype=np.int16).tolist() == list(range(100))
+
+def test_trim_silence_keeps_speech_with_padding():
+    """Test that leading and trailing silence is cut and pure silence yields an empty result."""
+    from audio_buffer import trim_silence
+    rate = 1000
+    silence = np.zeros((1000, 1), dtype=np.int16)
+    speech = (10000 * np.sin(np.arange(500) / 3)).astype(np.int16).reshape(-1, 1)
+    trimmed = trim_silence(np.concatenate([silence, speech, silence]), rate, padding_ms=100)
+    assert len(trimmed) == 700
+    assert trimmed.base is not None  # Ausschnitt, keine Kopie
+    assert len(trim_silence(silence, rate)) == 0
+
+def test_encode_upload_falls_back_to_wav(monkeypatch):
+    """Test that WAV is used when FLAC is not available or not requested."""
+    import audio_buffer
+    samples = np.zeros((100, 1), dtype=np.int16)
+    monkeypatch.setattr(audio_buffer, "soundfile", None)
+    name, data = audio_buffer.encode_upload(samples, 16000, "flac")
+    assert name == "aufnahme.wav" and data.startswith(b"RIFF")
+    assert audio_buffer.encode_upload(samples, 16000, "wav")[0] == "aufnahme.wav"
+
+def test_find_pause_and_read_from_absolute_position():
+    """Test that the last long pause after speech is found and segments can be read by absolute position."""
+    from audio_buffer import find_pause
+    rate = 1000
+    speech = (10000 * np.sin(np.arange(400) / 3)).astype(np.int16).reshape(-1, 1)
+    short_pause = np.zeros((100, 1), dtype=np.int16)
+    long_pause = np.zeros((600, 1), dtype=np.int16)
+    samples = np.concatenate([long_pause, speech, short_pause, speech, long_pause, speech])
+    assert find_pause(samples, rate, min_pause_ms=500) == 1500 + 300
+    assert find_pause(np.concatenate([long_pause, speech]), rate) is None
+    buffer = AudioRingBuffer(samplerate=10, initial_seconds=1, max_seconds=1)
+    for block in blocks(0, 4):
+        buffer.write(block)
+    assert buffer.total_written == 16
+    start, data = buffer.read_from(12)
+    assert start == 12 and data.ravel().tolist() == [12, 13, 14, 15]
+    start, data = buffer.read_from(0)
+    assert start == 6 and data.ravel().tolist() == list(range(6, 16))
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import audio_output
+from audio_output import PCMOutput
+
+def pcm(*samples: int) -> bytes:
+    """Returns little-endian 16-bit PCM bytes for the given samples."""
+    return np.array(samples, dtype="<i2").tobytes()
+
+def render(output: PCMOutput, frames: int) -> np.ndarray:
+    """Runs one stream callback and returns the produced samples."""
+    outdata = np.full((frames, output.channels), 99, dtype=np.int16)
+    output._callback(outdata, frames, None, None)
+    return outdata[:, 0]
+
+def test_consecutive_writes_play_without_gap():
+    """Test that chunks of consecutive writes are played back to back across callback blocks."""
+    output = PCMOutput(samplerate=10)
+    output.write(np.array([[1], [2], [3]], dtype=np.int16))
+    output.write(np.array([[4], [5]], dtype=np.int16))
+    assert list(render(output, 4)) == [1, 2, 3, 4]
+    assert list(render(output, 4)) == [5, 0, 0, 0]
+    assert output.buffered == 0
+
+def test_underrun_plays_silence():
+    """Test that the stream plays silence while nothing is queued."""
+    output = PCMOutput(samplerate=10)
+    assert list(render(output, 3)) == [0, 0, 0]
+
+def test_duck_ramps_volume_down_and_back():
+    """Test that ducking lowers the gain with a ramp over the block instead of a jump."""
+    output = PCMOutput(samplerate=10, duck_level=0.5)
+    output.write(np.full((12, 1), 1000, dtype=np.int16))
+    output.duck()
+    block = render(output, 4)
+    assert block[0] == 1000 and block[-1] == 500
+    assert list(render(output, 4)) == [500] * 4
+    output.unduck()
+    block = render(output, 4)
+    assert block[0] == 500 and block[-1] == 1000
+
+def test_set_volume_is_clamped():
+    """Test that the volume stays between 0 and 1."""
+    output = PCMOutput()
+    output.set_volume(1.5)
+    assert output.volume == 1.0
+    output.set_volume(-1)
+    assert output.volume == 0.0
+
+def test_play_joins_frames_split_across_chunks():
+    """Test that play keeps odd bytes of a chunk and completes the sample with the next chunk."""
+    output = PCMOutput(samplerate=10, prefetch_seconds=0)
+    data = pcm(1, -2, 300)
+    assert output.play([data[:3], data[3:]])
+    assert list(render(output, 3)) == [1, -2, 300]
+
+def test_play_waits_for_playback_up_to_prefetch_lead():
+    """Test that play returns once only the prefetch lead is left unplayed."""
+    output = PCMOutput(samplerate=10, prefetch_seconds=0.2)
+    output._stream = object()
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (output.play([pcm(*range(1, 7))]), done.set()))
+    thread.start()
+    assert not done.wait(0.2)
+    render(output, 4)
+    assert done.wait(2)
+    thread.join()
+    assert output.buffered == 0.2
+
+def test_stop_event_drops_queued_audio():
+    """Test that setting the stop event ends play and clears the queue."""
+    output = PCMOutput(samplerate=10, prefetch_seconds=0)
+    output._stream = object()
+    stop_event = threading.Event()
+    def chunks():
+        yield pcm(1, 2, 3)
+        stop_event.set()
+        yield pcm(4, 5, 6)
+    assert output.play(chunks(), stop_event)
+    assert output.buffered == 0
+    assert list(render(output, 2)) == [0, 0]
+
+def test_pcm_enabled_from_env(monkeypatch):
+    """Test that TTS_OUTPUT=player switches to the external players."""
+    monkeypatch.delenv("TTS_OUTPUT", raising=False)
+    assert audio_output.pcm_enabled()
+    monkeypatch.setenv("TTS_OUTPUT", "player")
+    assert not audio_output.pcm_enabled()
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from chat_output import ChatOutbox, TokenBucket
+
+class RecordingChannel:
+    """A channel that records sent messages."""
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.sent_messages = []
+    async def send(self, message: str) -> None:
+        self.sent_messages.append(message)
+
+def test_token_bucket_burst_and_refill():
+    """Test that the bucket allows a burst and then one token per refill interval."""
+    now = [0.0]
+    bucket = TokenBucket(capacity=2, rate=0.5, clock=lambda: now[0])
+    assert bucket.try_take() == 0 and bucket.try_take() == 0
+    assert bucket.try_take() == pytest.approx(2.0)
+    now[0] = 2.0
+    assert bucket.try_take() == 0
+
+def test_outbox_stays_within_limit_per_window():
+    """Test that burst plus refill per window never exceeds the configured limit."""
+    outbox = ChatOutbox(limit=20, window=30, burst=5)
+    assert outbox.bucket.capacity + outbox.bucket.rate * 30 == pytest.approx(20)
+
+@pytest.mark.asyncio
+async def test_outbox_sends_in_order_and_coalesces_waiting_messages():
+    """Test that messages keep their order and short messages queued behind the limit are merged."""
+    outbox = ChatOutbox(limit=11, window=1, burst=1, max_length=40)
+    channel = RecordingChannel("kanal")
+    assert await outbox.send(channel, "eins") is True
+    futures = [outbox.post(channel, text) for text in ["zwei", "drei", "x" * 38]]
+    assert all(await asyncio.gather(*futures))
+    assert channel.sent_messages == ["eins", "zwei drei", "x" * 38]
+    stats = outbox.stats()
+    assert stats["sent"] == 3 and stats["coalesced"] == 1
+    assert stats["max_depth"] == 3 and stats["depth"] == 0
+    assert stats["max_latency"] >= 0.1
+    await outbox.aclose()
+
+@pytest.mark.asyncio
+async def test_outbox_reports_failed_sends():
+    """Test that a failing send resolves to False and does not stop the sender."""
+    class BrokenChannel(RecordingChannel):
+        async def send(self, message: str) -> None:
+            raise ConnectionError("weg")
+    outbox = ChatOutbox(limit=100, window=1)
+    assert await outbox.send(BrokenChannel("a"), "hallo") is False
+    channel = RecordingChannel("b")
+    assert await outbox.send(channel, "hallo") is True
+    assert outbox.stats()["failed"] == 1
+    await outbox.aclose()
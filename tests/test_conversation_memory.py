@@ -0,0 +1,91 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from conversation_memory import ConversationMemory
+from state_store import StateStore
+
+def count_words(text: str) -> int:
+    """Counts one token per word to keep the budgets in the tests readable."""
+    return len(text.split())
+
+def test_history_returns_exchanges_oldest_first():
+    """Test that stored exchanges are returned as chat messages in chronological order."""
+    memory = ConversationMemory(token_budget=100, count_tokens=count_words)
+    memory.add_exchange("a", "Frage eins", "Antwort eins")
+    memory.add_exchange("a", "Frage zwei", "Antwort zwei")
+    assert memory.history("a") == [
+        {"role": "user", "content": "Frage eins"},
+        {"role": "assistant", "content": "Antwort eins"},
+        {"role": "user", "content": "Frage zwei"},
+        {"role": "assistant", "content": "Antwort zwei"},
+    ]
+    assert memory.history("b") == []
+
+def test_history_keeps_newest_turns_within_budget():
+    """Test that only the newest turns fitting into the budget minus the reserved tokens are used."""
+    memory = ConversationMemory(token_budget=10, count_tokens=count_words)
+    memory.add_exchange("a", "alte Frage", "alte lange Antwort")
+    memory.add_exchange("a", "neue Frage", "neue Antwort")
+    # 4 Tokens reserviert, 6 verfügbar: das neue Paar (4) passt, die alte Antwort (3) nicht mehr
+    assert [m["content"] for m in memory.history("a", reserved_tokens=4)] == ["neue Frage", "neue Antwort"]
+    assert memory.history("a", reserved_tokens=10) == []
+
+def test_history_does_not_start_with_an_answer():
+    """Test that a turn list cut by the budget starts with a question."""
+    memory = ConversationMemory(token_budget=6, count_tokens=count_words)
+    memory.add_exchange("a", "eine sehr lange alte Frage", "kurz")
+    memory.add_exchange("a", "neu", "auch kurz")
+    assert [m["role"] for m in memory.history("a")] == ["user", "assistant"]
+
+def test_turn_cap_drops_oldest_turns():
+    """Test that a conversation keeps at most max_turns messages."""
+    memory = ConversationMemory(token_budget=1000, max_turns=4, count_tokens=count_words)
+    for i in range(5):
+        memory.add_exchange("a", f"Frage {i}", f"Antwort {i}")
+    assert [m["content"] for m in memory.history("a")] == ["Frage 3", "Antwort 3", "Frage 4", "Antwort 4"]
+
+def test_idle_conversations_are_forgotten():
+    """Test that conversations expire after the idle time and the least recently used one is evicted."""
+    now = [0.0]
+    memory = ConversationMemory(idle_ttl=60, max_conversations=2, clock=lambda: now[0])
+    memory.add_exchange("a", "Hallo", "Hi")
+    now[0] = 50.0
+    memory.add_exchange("a", "Noch da?", "Ja")
+    now[0] = 100.0
+    assert len(memory.history("a")) == 4
+    now[0] = 200.0
+    assert memory.history("a") == []
+    memory.add_exchange("b", "x", "y")
+    memory.add_exchange("c", "x", "y")
+    memory.add_exchange("d", "x", "y")
+    assert len(memory) == 2 and memory.history("b") == []
+
+def test_zero_budget_disables_memory(monkeypatch):
+    """Test that CHAT_MEMORY_TOKENS=0 disables the history."""
+    monkeypatch.setenv("CHAT_MEMORY_TOKENS", "0")
+    memory = ConversationMemory.from_env()
+    memory.add_exchange("a", "Hallo", "Hi")
+    assert not memory.enabled
+    assert memory.history("a") == []
+    assert len(memory) == 0
+
+def test_conversations_are_restored_from_state_store(tmp_path):
+    """Test that conversations are restored after a restart and forgotten ones are not."""
+    path = str(tmp_path / "state.db")
+    state = StateStore(path)
+    memory = ConversationMemory(token_budget=100, count_tokens=count_words, state=state)
+    memory.add_exchange(("kanal", "anna"), "Frage", "Antwort")
+    memory.add_exchange(("kanal", "ben"), "Hallo", "Hi")
+    memory.forget(("kanal", "ben"))
+    state.close()
+    state = StateStore(path)
+    try:
+        restored = ConversationMemory(token_budget=100, count_tokens=count_words, state=state)
+        assert restored.history(("kanal", "anna")) == [
+            {"role": "user", "content": "Frage"},
+            {"role": "assistant", "content": "Antwort"},
+        ]
+        assert restored.history(("kanal", "ben")) == []
+    finally:
+        state.close()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from greeted_store import BloomGreetedStore, LRUGreetedStore, StateGreetedStore, store_from_env
+from state_store import StateStore
+
+def test_lru_store_is_bounded_and_case_insensitive():
+    """Test that names are matched case-insensitively and the oldest names are evicted."""
+    store = LRUGreetedStore(ttl=3600, max_users=2)
+    store.add("Anna")
+    store.add("ben")
+    store.add("cem")
+    assert "ANNA" not in store
+    assert "Ben" in store and "cem" in store
+    assert len(store) == 2
+
+def test_lru_store_survives_restart(tmp_path):
+    """Test that flushed names are loaded again and expired names are skipped."""
+    path = str(tmp_path / "greeted.log")
+    store = LRUGreetedStore(ttl=3600, path=path, flush_interval=60)
+    store.add("anna")
+    store.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(f"{time.time() - 10:.0f}\tabgelaufen\n")
+    restarted = LRUGreetedStore(ttl=3600, path=path)
+    assert "anna" in restarted
+    assert "abgelaufen" not in restarted
+
+def test_bloom_store_has_fixed_size_and_persists(tmp_path):
+    """Test that the Bloom filter keeps its size, rotates generations and reloads its snapshot."""
+    path = str(tmp_path / "greeted.bloom")
+    store = BloomGreetedStore(max_users=100, error_rate=0.01, path=path)
+    size = len(store._current)
+    for i in range(250):
+        store.add(f"user{i}")
+    assert len(store._current) == size
+    assert all(f"user{i}" in store for i in range(200, 250))
+    false_positives = sum(f"fremd{i}" in store for i in range(1000))
+    assert false_positives < 50
+    store.close()
+    restarted = BloomGreetedStore(max_users=100, error_rate=0.01, path=path)
+    assert "user249" in restarted
+
+def test_store_from_env(monkeypatch):
+    """Test that the backend is selected by GREETED_STORE."""
+    monkeypatch.setenv("GREETED_STORE", "bloom")
+    assert isinstance(store_from_env(), BloomGreetedStore)
+    monkeypatch.setenv("GREETED_STORE", "lru")
+    assert isinstance(store_from_env(), LRUGreetedStore)
+
+def test_state_store_persists_greeted_users(tmp_path, monkeypatch):
+    """Test that without GREETED_STORE_FILE the lru tier is persisted in the state store."""
+    monkeypatch.delenv("GREETED_STORE_FILE", raising=False)
+    monkeypatch.delenv("GREETED_STORE", raising=False)
+    path = str(tmp_path / "state.db")
+    state = StateStore(path)
+    store = store_from_env(state)
+    assert isinstance(store, StateGreetedStore)
+    store.add("Anna")
+    store.close()
+    state.close()
+    state = StateStore(path)
+    try:
+        assert "anna" in store_from_env(state)
+    finally:
+        state.close()
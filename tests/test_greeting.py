@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from greeting import GreetingBatcher, build_greetings
+
+def test_build_greetings_fits_names_and_summarizes_rest():
+    """Test that greetings respect the length limit and summarize users beyond the message budget."""
+    names = [f"viewer{i:03d}" for i in range(200)]
+    messages = build_greetings(names, max_messages=2)
+    assert len(messages) == 2
+    assert all(len(m) <= 500 for m in messages)
+    assert messages[0].startswith("Willkommen im Chat, @viewer000, @viewer001")
+    assert messages[1].endswith("weitere! Viel Spaß beim Zuschauen!")
+    mentioned = sum(m.count("@") for m in messages)
+    rest = int(messages[1].rsplit(" und ", 1)[1].split()[0])
+    assert mentioned + rest == 200
+    assert build_greetings(["solo"], max_messages=3) == ["Willkommen im Chat, @solo! Viel Spaß beim Zuschauen!"]
+
+@pytest.mark.asyncio
+async def test_batcher_greets_after_window_within_budget():
+    """Test that joins are collected for the window and later joins wait for the budget."""
+    sent = []
+    async def send(channel, text):
+        sent.append(text)
+    batcher = GreetingBatcher(send, window=0.05, budget=1, budget_window=0.3)
+    batcher.add("kanal", "anna")
+    batcher.add("kanal", "ben")
+    assert sent == []
+    await asyncio.sleep(0.1)
+    assert sent == ["Willkommen im Chat, @anna und @ben! Viel Spaß beim Zuschauen!"]
+    batcher.add("kanal", "cem")
+    await asyncio.sleep(0.1)
+    assert len(sent) == 1 and batcher.pending == 1
+    await asyncio.sleep(0.35)
+    assert sent[-1] == "Willkommen im Chat, @cem! Viel Spaß beim Zuschauen!"
+    await batcher.aclose()
@@ -0,0 +1,58 @@
+import os
+import sys
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import http_clients
+
+def test_sync_clients_are_shared(monkeypatch):
+    """Test that the requests session and the OpenAI client are created once and reused."""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    assert http_clients.requests_session() is http_clients.requests_session()
+    assert http_clients.openai_client() is http_clients.openai_client()
+
+def test_pool_settings_from_env(monkeypatch):
+    """Test that pool size and keep-alive are read from the environment with safe defaults."""
+    monkeypatch.setenv("HTTP_POOL_SIZE", "3")
+    monkeypatch.setenv("HTTP_KEEPALIVE", "kaputt")
+    assert http_clients.pool_size() == 3
+    assert http_clients.keepalive_seconds() == 60.0
+    limits = http_clients._httpx_limits()
+    assert limits.max_keepalive_connections == 3
+
+@pytest.mark.asyncio
+async def test_aiohttp_session_reuses_connection():
+    """Test that consecutive requests over the pooled session share one TCP connection."""
+    peers = []
+    async def handler(request):
+        peers.append(request.transport.get_extra_info("peername"))
+        return web.json_response({"ok": True})
+    app = web.Application()
+    app.router.add_get("/ping", handler)
+    server = TestServer(app)
+    await server.start_server()
+    session = http_clients.create_aiohttp_session(headers={"X-Test": "1"}, timeout=5)
+    try:
+        for _ in range(3):
+            async with session.get(server.make_url("/ping")) as response:
+                assert (await response.json())["ok"] is True
+    finally:
+        await session.close()
+        await server.close()
+    assert len(peers) == 3
+    assert len(set(peers)) == 1
+
+def test_base_urls_from_env(monkeypatch):
+    """Test that OPENAI_BASE_URL and ELEVENLABS_BASE_URL redirect the clients, e.g. to stub servers."""
+    import tts
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    monkeypatch.delenv("ELEVENLABS_BASE_URL", raising=False)
+    assert http_clients.openai_base_url() == http_clients.OPENAI_BASE_URL
+    assert tts.build_tts_request("Hallo")[0].startswith("https://api.elevenlabs.io/v1/text-to-speech/")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:8080/v1/")
+    monkeypatch.setenv("ELEVENLABS_BASE_URL", "http://127.0.0.1:8080")
+    monkeypatch.setenv("ELEVENLABS_VOICE_ID", "stimme")
+    assert http_clients.openai_base_url() == "http://127.0.0.1:8080/v1"
+    assert tts.build_tts_request("Hallo")[0] == "http://127.0.0.1:8080/v1/text-to-speech/stimme/stream"
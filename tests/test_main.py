@@ -1,11 +1,12 @@
 from unittest.mock import patch, PropertyMock, AsyncMock, MagicMock
+import asyncio
 import os
 import sys
-import subprocess
 import pytest
 
 # Füge das Projektverzeichnis zum sys.path hinzu, damit main importiert werden kann
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from admission import Priority
 from main import Bot
 
 class DummyUser:
@@ -39,9 +40,24 @@ async def test_event_join_greets_new_user():
         channel = DummyChannel()
         user = DummyUser('testuser')
         await bot.event_join(channel, user)
+        await bot.greeter.flush()
         assert 'Willkommen im Chat, @testuser!' in channel.sent_messages[0]
         assert 'testuser' in bot.greeted_users
 
+@pytest.mark.asyncio
+async def test_event_join_prefetches_follower_status(monkeypatch):
+    """Test that joins are handed to the follower prefetch in follower mode."""
+    monkeypatch.setenv('KI_ACCESS_LEVEL', 'follower')
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    bot.helix = MagicMock()
+    with patch.object(type(bot), "nick", new_callable=PropertyMock) as mock_nick:
+        mock_nick.return_value = "botnick"
+        await bot.event_join(DummyChannel(), DummyUser('raider'))
+        await bot.event_join(DummyChannel(), DummyUser('botnick'))
+    bot.helix.prefetch.assert_called_once_with('raider')
+
 @pytest.mark.asyncio
 async def test_event_join_does_not_greet_self():
     """Test that the bot does not greet itself when joining."""
@@ -53,6 +69,7 @@ async def test_event_join_does_not_greet_self():
         channel = DummyChannel()
         user = DummyUser('botnick')
         await bot.event_join(channel, user)
+        await bot.greeter.flush()
         assert channel.sent_messages == []
         assert 'botnick' not in bot.greeted_users
 
@@ -70,9 +87,35 @@ async def test_event_join_does_not_greet_twice():
         await bot.event_join(channel, user)
         # Zweiter Join
         await bot.event_join(channel, user)
+        await bot.greeter.flush()
         assert channel.sent_messages.count('Willkommen im Chat, @testuser! Viel Spaß beim Zuschauen!') == 1
         assert 'testuser' in bot.greeted_users
 
+@pytest.mark.asyncio
+async def test_event_join_greets_raid_in_one_message():
+    """Test that joins within the collection window are greeted with one combined message."""
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    with patch.object(type(bot), "nick", new_callable=PropertyMock) as mock_nick:
+        mock_nick.return_value = "botnick"
+        channel = DummyChannel()
+        for name in ('anna', 'ben', 'cem'):
+            await bot.event_join(channel, DummyUser(name))
+        assert channel.sent_messages == []
+        await bot.greeter.flush()
+    assert channel.sent_messages == ["Willkommen im Chat, @anna, @ben und @cem! Viel Spaß beim Zuschauen!"]
+
+def fake_stream(deltas, events=None):
+    """Returns a stream_response replacement that yields the given deltas."""
+    async def stream(*_args, **_kwargs):
+        for delta in deltas:
+            await asyncio.sleep(0)  # wie beim Warten auf das nächste Netzwerk-Chunk
+            if events is not None:
+                events.append(("delta", delta))
+            yield delta
+    return stream
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("content", [
     "Hallo @Nicole, wie geht's?",
@@ -86,49 +129,192 @@ async def test_event_message_triggers_on_nicole_with_ai(content: str):
     bot = Bot()
     channel = DummyChannel()
     message = DummyMessage(content, 'fragenderUser', channel)
-    # Patch AIResponder.get_response to avoid real API calls
-    with patch.object(bot.ai, 'get_response', return_value="Das ist eine KI-Antwort.") as mock_ai, \
+    # Patch AIResponder.stream_response to avoid real API calls
+    with patch.object(bot.ai, 'stream_response', new=MagicMock(side_effect=fake_stream(["Das ist ", "eine KI-Antwort."]))) as mock_ai, \
+         patch.object(bot, 'speak_text', new=AsyncMock()), \
          patch.object(bot, 'handle_commands', new=AsyncMock()):
         await bot.event_message(message)
     assert any("@fragenderUser Das ist eine KI-Antwort." in m for m in channel.sent_messages)
-    mock_ai.assert_called_once_with(content)
+    mock_ai.assert_called_once_with(content, priority=Priority.VIEWER)
+
+@pytest.mark.asyncio
+async def test_event_message_without_streaming(monkeypatch):
+    """Test that OPENAI_STREAM=false falls back to the complete response."""
+    monkeypatch.setenv('OPENAI_STREAM', 'false')
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    channel = DummyChannel()
+    message = DummyMessage("@nicole hallo", 'fragenderUser', channel)
+    with patch.object(bot.ai, 'get_response', new=AsyncMock(return_value="Das ist eine KI-Antwort.")) as mock_ai, \
+         patch.object(bot, 'speak_text', new=AsyncMock()), \
+         patch.object(bot, 'handle_commands', new=AsyncMock()):
+        await bot.event_message(message)
+    assert channel.sent_messages == ["@fragenderUser Das ist eine KI-Antwort."]
+    mock_ai.assert_awaited_once_with("@nicole hallo", priority=Priority.VIEWER)
+
+@pytest.mark.asyncio
+async def test_follow_up_question_gets_conversation_history(monkeypatch):
+    """Test that a user's second question is sent together with the first exchange."""
+    monkeypatch.setenv('OPENAI_STREAM', 'false')
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    channel = DummyChannel()
+    with patch.object(bot.ai, 'get_response', new=AsyncMock(side_effect=["Hallo Max!", "Du heißt Max.", "Das weiß ich nicht."])) as mock_ai, \
+         patch.object(bot, 'speak_text', new=AsyncMock()):
+        await bot.process_user_message("Ich heiße Max", user="Max", channel=channel)
+        await bot.process_user_message("Wie heiße ich?", user="max", channel=channel)
+        await bot.process_user_message("Wer bin ich?", user="anderer", channel=channel)
+    assert mock_ai.await_args_list[1].kwargs["history"] == [
+        {"role": "user", "content": "Ich heiße Max"},
+        {"role": "assistant", "content": "Hallo Max!"},
+    ]
+    assert "history" not in mock_ai.await_args_list[2].kwargs
+
+@pytest.mark.asyncio
+async def test_event_message_rate_limited_user_gets_short_reply(monkeypatch):
+    """Test that a viewer over the per-user rate gets a short reply instead of an AI answer."""
+    monkeypatch.setenv('AI_USER_RATE', '1')
+    monkeypatch.setenv('OPENAI_STREAM', 'false')
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    channel = DummyChannel()
+    with patch.object(bot.ai, 'get_response', new=AsyncMock(return_value="Antwort.")) as mock_ai, \
+         patch.object(bot, 'speak_text', new=AsyncMock()):
+        await bot.event_message(DummyMessage("@nicole eins", 'spammer', channel))
+        await bot.event_message(DummyMessage("@nicole zwei", 'spammer', channel))
+    assert channel.sent_messages == ["@spammer Antwort.", "@spammer Nicht so schnell, bitte frag gleich noch einmal."]
+    mock_ai.assert_awaited_once()
+    await bot.admission.aclose()
+
+@pytest.mark.asyncio
+async def test_process_user_message_posts_blocks_while_streaming():
+    """Test that full 500-character blocks are posted before the stream has finished."""
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    events = []
+    class RecordingChannel(DummyChannel):
+        async def send(self, message: str) -> None:
+            events.append(("send", message))
+            await super().send(message)
+    channel = RecordingChannel()
+    words = [f"wort{i:03d}" for i in range(200)]
+    deltas = [w + " " for w in words]
+    with patch.object(bot.ai, 'stream_response', new=MagicMock(side_effect=fake_stream(deltas, events))), \
+         patch.object(bot, 'speak_text', new=AsyncMock()):
+        await bot.process_user_message("frage", user="viewer", channel=channel)
+    sent = channel.sent_messages
+    assert len(sent) == 4
+    assert sent[0].startswith("@viewer wort000")
+    assert all(len(m) <= 500 for m in sent)
+    assert " ".join(sent)[len("@viewer "):].split() == words
+    # Der erste Block wurde gesendet, bevor das letzte Token ankam
+    first_send = events.index(("send", sent[0]))
+    assert first_send < events.index(("delta", deltas[-1]))
+
+@pytest.mark.asyncio
+async def test_process_user_message_speaks_first_sentence_early():
+    """Test that TTS starts on the first finished sentence and the rest follows in order."""
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    events = []
+    async def speak(text):
+        events.append(("speak", text))
+        return True
+    deltas = ["Erster ", "Satz. ", "Zweiter ", "Satz", " ohne Ende"]
+    with patch.object(bot.ai, 'stream_response', new=MagicMock(side_effect=fake_stream(deltas, events))), \
+         patch.object(bot, 'speak_text', new=speak):
+        await bot.process_user_message("frage")
+    spoken = [e[1] for e in events if e[0] == "speak"]
+    assert spoken == ["Erster Satz.", "Zweiter Satz ohne Ende"]
+    assert events.index(("speak", "Erster Satz.")) < events.index(("delta", " ohne Ende"))
+
+@pytest.mark.asyncio
+async def test_dropped_rest_of_reply_is_logged(caplog):
+    """Test that a rejected TTS remainder after the first sentence is logged like other dropped replies."""
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    events = []
+    spoken = []
+    async def speak(text):
+        spoken.append(text)
+        return len(spoken) == 1
+    deltas = ["Erster Satz. ", "Zweiter Satz"]
+    with patch.object(bot.ai, 'stream_response', new=MagicMock(side_effect=fake_stream(deltas, events))), \
+         patch.object(bot, 'speak_text', new=speak), caplog.at_level("INFO"):
+        await bot.process_user_message("frage")
+    assert spoken == ["Erster Satz.", "Zweiter Satz"]
+    assert "TTS ausgelastet" in caplog.text
+
+class FakePlayer:
+    """A fake player process that records the bytes written to its stdin."""
+    instances = []
+    def __init__(self, cmd, returncode: int = 0, **kwargs) -> None:
+        self.cmd = cmd
+        self.returncode = returncode
+        self.written = []
+        self.stdin = self
+        FakePlayer.instances.append(self)
+    def write(self, data: bytes) -> None:
+        self.written.append(data)
+    def close(self) -> None:
+        pass
+    def wait(self, timeout: float = None) -> int:
+        return self.returncode
+
+def streaming_response(chunks):
+    """Returns a fake streaming HTTP response with the given chunks."""
+    response = MagicMock(status_code=200)
+    response.iter_content.return_value = iter(chunks)
+    return response
 
 @pytest.mark.asyncio
 async def test_speak_text_success(monkeypatch):
-    """Test that speak_text runs without error when dependencies work."""
+    """Test that speak_text pipes the streamed audio into the player without temp files."""
+    monkeypatch.setenv('TTS_OUTPUT', 'player')
     os.environ['ELEVENLABS_API_KEY'] = 'dummy'
     os.environ['ELEVENLABS_VOICE_ID'] = 'dummy_voice'
     os.environ['ELEVENLABS_MODEL_ID'] = 'dummy_model'
     bot = Bot()
-    monkeypatch.setattr("requests.post", lambda *a, **kw: MagicMock(status_code=200, content=b"audio"))
-    monkeypatch.setattr("subprocess.run", lambda *a, **kw: None)
-    with patch("os.remove") as mock_rm:
-        await bot.speak_text("Testausgabe")
-        mock_rm.assert_called()
+    FakePlayer.instances = []
+    monkeypatch.setattr("requests.Session.post", lambda *a, **kw: streaming_response([b"au", b"dio"]))
+    monkeypatch.setattr("subprocess.Popen", FakePlayer)
+    with patch("tempfile.NamedTemporaryFile") as mock_tmp:
+        assert await bot.speak_text("Testausgabe") is True
+        assert bot.playback.wait_idle(timeout=2)
+        mock_tmp.assert_not_called()
+    assert FakePlayer.instances[0].cmd[0] == "mpg123"
+    assert b"".join(FakePlayer.instances[0].written) == b"audio"
 
 @pytest.mark.asyncio
 async def test_speak_text_mpg123_fails(monkeypatch):
     """Test that speak_text falls back to mpv if mpg123 fails."""
+    monkeypatch.setenv('TTS_OUTPUT', 'player')
     os.environ['ELEVENLABS_API_KEY'] = 'dummy'
     os.environ['ELEVENLABS_VOICE_ID'] = 'dummy_voice'
     os.environ['ELEVENLABS_MODEL_ID'] = 'dummy_model'
     bot = Bot()
-    monkeypatch.setattr("requests.post", lambda *a, **kw: MagicMock(status_code=200, content=b"audio"))
-    def fail_mpg123(*a, **kw):
-        raise subprocess.CalledProcessError(1, 'mpg123')
-    # Erster Aufruf (mpg123) schlägt fehl, zweiter (mpv) funktioniert
-    monkeypatch.setattr("subprocess.run", fail_mpg123)
-    with patch("os.remove") as mock_rm:
-        try:
-            await bot.speak_text("Testausgabe")
-        except subprocess.CalledProcessError:
-            pass  # Falls auch mpv fehlschlägt, ignorieren für diesen Test
-        mock_rm.assert_called()
+    FakePlayer.instances = []
+    monkeypatch.setattr("requests.Session.post", lambda *a, **kw: streaming_response([b"au", b"dio"]))
+    def popen(cmd, **kwargs):
+        # mpg123 bricht ab, mpv spielt
+        return FakePlayer(cmd, returncode=1 if cmd[0] == "mpg123" else 0)
+    monkeypatch.setattr("subprocess.Popen", popen)
+    await bot.speak_text("Testausgabe")
+    assert bot.playback.wait_idle(timeout=2)
+    assert [p.cmd[0] for p in FakePlayer.instances] == ["mpg123", "mpv"]
+    assert b"".join(FakePlayer.instances[1].written) == b"audio"
 
 @pytest.mark.asyncio
 async def test_speak_text_quota_exceeded(monkeypatch, caplog):
     """Test that speak_text logs correctly on HTTP error (e.g., quota exceeded)."""
     import requests
+    monkeypatch.setenv('TTS_OUTPUT', 'player')
     os.environ['ELEVENLABS_API_KEY'] = 'dummy'
     os.environ['ELEVENLABS_VOICE_ID'] = 'dummy_voice'
     os.environ['ELEVENLABS_MODEL_ID'] = 'dummy_model'
@@ -136,6 +322,8 @@ async def test_speak_text_quota_exceeded(monkeypatch, caplog):
     class DummyResponse:
         status_code = 402
         content = b""
+        def close(self):
+            pass
         def raise_for_status(self):
             raise requests.HTTPError("402 Payment Required")
         def json(self):
@@ -143,12 +331,65 @@ async def test_speak_text_quota_exceeded(monkeypatch, caplog):
         @property
         def text(self):
             return '{"detail": "quota exceeded"}'
-    monkeypatch.setattr("requests.post", lambda *a, **kw: DummyResponse())
+    monkeypatch.setattr("requests.Session.post", lambda *a, **kw: DummyResponse())
     with caplog.at_level("ERROR"):
         await bot.speak_text("Testausgabe")
+        assert bot.playback.wait_idle(timeout=2)
     assert "quota exceeded" in caplog.text
     assert "TTS-Fehler (HTTP 402)" in caplog.text
 
+@pytest.mark.asyncio
+async def test_speak_text_returns_immediately():
+    """Test that speak_text only queues the text and does not wait for playback."""
+    import threading
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    release = threading.Event()
+    spoken = []
+    def slow_speak(text, stop_event=None):
+        release.wait(2)
+        spoken.append(text)
+    bot.playback.speak = slow_speak
+    assert await bot.speak_text("Eins") is True
+    assert await bot.speak_text("Zwei") is True
+    assert spoken == []
+    release.set()
+    assert bot.playback.wait_idle(timeout=2)
+    assert spoken == ["Eins", "Zwei"]
+
+@pytest.mark.asyncio
+async def test_skip_command_requires_mod():
+    """Test that only mods and the channel owner can skip the current TTS output."""
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    bot.playback = MagicMock()
+    viewer = type('Author', (), {'name': 'viewer', 'is_mod': False})
+    mod = type('Author', (), {'name': 'helper', 'is_mod': True})
+    await bot.skip_command._callback(bot, MagicMock(author=viewer))
+    bot.playback.skip.assert_not_called()
+    await bot.skip_command._callback(bot, MagicMock(author=mod))
+    bot.playback.skip.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_volume_command_sets_output_volume(monkeypatch):
+    """Test that mods can set the TTS volume and viewers cannot."""
+    import audio_output
+    os.environ['TMI_TOKEN'] = 'dummy_token'
+    os.environ['TWITCH_CHANNEL'] = 'dummy_channel'
+    bot = Bot()
+    bot.chat = MagicMock(send=AsyncMock())
+    output = audio_output.PCMOutput()
+    monkeypatch.setattr(audio_output, 'current_output', lambda: output)
+    viewer = type('Author', (), {'name': 'viewer', 'is_mod': False})
+    mod = type('Author', (), {'name': 'helper', 'is_mod': True})
+    await bot.volume_command._callback(bot, MagicMock(author=viewer, message=MagicMock(content='!volume 10')))
+    assert output.volume == 1.0
+    await bot.volume_command._callback(bot, MagicMock(author=mod, message=MagicMock(content='!volume 40')))
+    assert output.volume == 0.4
+    bot.chat.send.assert_awaited_once()
+
 def test_missing_env_vars(monkeypatch):
     """Test that the bot exits with a clear error if required environment variables are missing."""
     from main import check_required_env_vars
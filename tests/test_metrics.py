@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+import urllib.request
+from unittest.mock import MagicMock
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import metrics
+
+@pytest.fixture
+def enabled(monkeypatch):
+    """Enables metric recording for one test."""
+    monkeypatch.setattr(metrics, "_enabled", True)
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    """Test that observe and inc are no-ops while metrics are disabled."""
+    monkeypatch.setattr(metrics, "_enabled", False)
+    histogram = metrics.Histogram("test_seconds", "Test")
+    counter = metrics.Counter("test_total", "Test", ("stage",))
+    histogram.observe(0.2)
+    counter.inc(stage="x")
+    assert histogram.count() == 0
+    assert counter.value(stage="x") == 0
+
+def test_histogram_renders_cumulative_buckets(enabled):
+    """Test that observations end up in cumulative le buckets with sum and count."""
+    histogram = metrics.Histogram("test_seconds", "Test", ("mode",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, mode="a")
+    histogram.observe(0.1, mode="a")
+    histogram.observe(3.0, mode="a")
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP test_seconds Test", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{mode="a",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{mode="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{mode="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{mode="a"} 3.15' in lines
+    assert 'test_seconds_count{mode="a"} 3' in lines
+
+def test_labels_must_match(enabled):
+    """Test that wrong label names are rejected instead of silently creating new series."""
+    counter = metrics.Counter("test_total", "Test", ("stage",))
+    with pytest.raises(ValueError):
+        counter.inc(stufe="x")
+
+def test_gauge_reads_callback_at_scrape():
+    """Test that gauges report the current value of their callback and skip failing callbacks."""
+    gauge = metrics.Gauge("test_depth", "Test", ("queue",))
+    depth = [3]
+    gauge.set_function(lambda: depth[0], queue="chat")
+    gauge.set_function(lambda: 1 / 0, queue="kaputt")
+    depth[0] = 5
+    assert gauge.render()[2:] == ['test_depth{queue="chat"} 5']
+
+def test_http_endpoint_serves_registry():
+    """Test that the endpoint serves the registry in the text format and answers 404 elsewhere."""
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("test_total", "Test"))
+    server = metrics.start_http_server(0, registry=registry)
+    try:
+        counter.inc()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert "# TYPE test_total counter" in body
+        assert "test_total 1" in body
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/anderes")
+    finally:
+        server.shutdown()
+        metrics.disable()
+
+@pytest.mark.asyncio
+async def test_ai_responder_records_latency_and_cache_lookups(enabled):
+    """Test that an OpenAI request records first-token and total time and the response cache is counted."""
+    from types import SimpleNamespace
+    from ai_responder import AIResponder
+    async def create(**kwargs):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hallo"))])
+    responder = AIResponder(api_key="dummy")
+    client = MagicMock()
+    client.chat.completions.create = create
+    responder._client = client
+    before = metrics.LLM_TOTAL.count(mode="complete")
+    hits = metrics.CACHE_LOOKUPS.value(cache="response", result="hit")
+    await responder.get_response("Metrik-Test")
+    await responder.get_response("Metrik-Test")
+    assert metrics.LLM_TOTAL.count(mode="complete") == before + 1
+    assert metrics.CACHE_LOOKUPS.value(cache="response", result="hit") == hits + 1
@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from admission import Priority
+from model_router import ModelRouter, Route, parse_routes
+
+ROUTES = '''[
+    {"name": "fast", "model": "mini", "max_tokens": 60, "max_prompt_tokens": 50, "priorities": ["follower", "viewer"]},
+    {"name": "smart", "model": "big"}
+]'''
+
+def test_parse_routes_and_validation():
+    """Test that routes are parsed with defaults and invalid specs are rejected."""
+    fast, smart = parse_routes(ROUTES, default_max_tokens=100)
+    assert fast == Route("fast", "mini", 60, 50, frozenset({Priority.FOLLOWER, Priority.VIEWER}))
+    assert smart == Route("smart", "big", 100)
+    for spec in ("kein json", "[]", '[{"name": "ohne Modell"}]', '[{"model": "x", "priorities": ["king"]}]'):
+        with pytest.raises(ValueError):
+            parse_routes(spec, 100)
+
+def test_routes_by_prompt_size_and_priority():
+    """Test that short viewer prompts take the fast route and long or privileged ones the smart route."""
+    router = ModelRouter(parse_routes(ROUTES, 100))
+    assert router.choose(10, Priority.VIEWER).name == "fast"
+    assert router.choose(80, Priority.VIEWER).name == "smart"
+    assert router.choose(10, Priority.PTT).name == "smart"
+    assert router.choose(10, Priority.MOD).name == "smart"
+
+def test_slow_model_is_skipped_until_samples_expire():
+    """Test that a model above the latency SLO is avoided and tried again after the window."""
+    now = [0.0]
+    router = ModelRouter(parse_routes(ROUTES, 100), latency_slo=1.0, window=60, min_samples=3, clock=lambda: now[0])
+    for _ in range(3):
+        router.observe("mini", 4.0)
+    assert router.latency("mini") == 4.0
+    assert router.choose(10, Priority.VIEWER).name == "smart"
+    now[0] = 61.0
+    assert router.latency("mini") is None
+    assert router.choose(10, Priority.VIEWER).name == "fast"
+
+def test_fastest_route_is_used_when_all_miss_slo():
+    """Test that the matching route with the lowest latency wins if every one is above the SLO."""
+    router = ModelRouter(parse_routes(ROUTES, 100), latency_slo=1.0, min_samples=1)
+    router.observe("mini", 3.0)
+    router.observe("big", 2.0)
+    assert router.choose(10, Priority.VIEWER).name == "smart"
+    router.observe("big", 9.0)
+    router.observe("big", 9.0)
+    assert router.choose(10, Priority.VIEWER).name == "fast"
+
+def test_from_env_falls_back_to_default_model(monkeypatch):
+    """Test that missing or invalid OPENAI_ROUTES keep the single configured model."""
+    monkeypatch.delenv("OPENAI_ROUTES", raising=False)
+    assert ModelRouter.from_env("gpt-x", 100).routes == [Route("default", "gpt-x", 100)]
+    monkeypatch.setenv("OPENAI_ROUTES", "kaputt")
+    assert ModelRouter.from_env("gpt-x", 100).routes == [Route("default", "gpt-x", 100)]
+    monkeypatch.setenv("OPENAI_ROUTES", ROUTES)
+    assert [route.model for route in ModelRouter.from_env("gpt-x", 100).routes] == ["mini", "big"]
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from playback import PlaybackScheduler
+
+class BlockingSpeaker:
+    """A speak function that blocks until released or stopped."""
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.spoken = []
+        self.stopped = []
+    def __call__(self, text, stop_event=None):
+        self.started.set()
+        while not self.release.is_set():
+            if stop_event.wait(0.01):
+                self.stopped.append(text)
+                return
+        self.spoken.append(text)
+
+def test_enqueue_plays_in_order():
+    """Test that queued utterances are spoken in order by the worker."""
+    spoken = []
+    scheduler = PlaybackScheduler(speak=lambda text, stop_event=None: spoken.append(text), max_backlog=10)
+    for text in ("eins", "zwei", "drei"):
+        assert scheduler.enqueue(text)
+    assert scheduler.wait_idle(timeout=2)
+    assert spoken == ["eins", "zwei", "drei"]
+
+def test_backlog_limit_signals_back_pressure():
+    """Test that enqueue returns False once the backlog is full."""
+    speaker = BlockingSpeaker()
+    scheduler = PlaybackScheduler(speak=speaker, max_backlog=2)
+    assert scheduler.enqueue("läuft")
+    assert speaker.started.wait(2)
+    assert scheduler.enqueue("a")
+    assert scheduler.enqueue("b")
+    assert scheduler.is_full()
+    assert scheduler.enqueue("c") is False
+    assert scheduler.dropped == 1
+    speaker.release.set()
+    assert scheduler.wait_idle(timeout=2)
+    assert speaker.spoken == ["läuft", "a", "b"]
+
+def test_skip_and_flush():
+    """Test that skip stops the current utterance and flush drops the waiting ones."""
+    speaker = BlockingSpeaker()
+    scheduler = PlaybackScheduler(speak=speaker, max_backlog=5)
+    scheduler.enqueue("aktuell")
+    assert speaker.started.wait(2)
+    scheduler.enqueue("wartet 1")
+    scheduler.enqueue("wartet 2")
+    assert scheduler.flush() == 2
+    assert scheduler.skip() is True
+    assert scheduler.wait_idle(timeout=2)
+    assert speaker.stopped == ["aktuell"]
+    assert speaker.spoken == []
+    assert scheduler.skip() is False
+
+def test_speak_errors_do_not_stop_worker():
+    """Test that an exception while speaking does not stop the worker."""
+    spoken = []
+    def speak(text, stop_event=None):
+        if text == "fail":
+            raise RuntimeError("kaputt")
+        spoken.append(text)
+    scheduler = PlaybackScheduler(speak=speak, max_backlog=5)
+    scheduler.enqueue("fail")
+    scheduler.enqueue("ok")
+    assert scheduler.wait_idle(timeout=2)
+    assert spoken == ["ok"]
+
+def test_stop_rejects_new_utterances():
+    """Test that a stopped scheduler rejects new utterances."""
+    scheduler = PlaybackScheduler(speak=lambda text, stop_event=None: None, max_backlog=5)
+    scheduler.stop()
+    assert scheduler.enqueue("zu spät") is False
+
+def test_identical_waiting_utterances_are_coalesced():
+    """Test that an identical text already waiting in the queue is not queued twice."""
+    speaker = BlockingSpeaker()
+    scheduler = PlaybackScheduler(speak=speaker, max_backlog=5)
+    scheduler.enqueue("läuft")
+    assert speaker.started.wait(2)
+    assert scheduler.enqueue("Hallo zusammen!")
+    assert scheduler.enqueue("Hallo zusammen!")
+    assert scheduler.backlog == 1
+    speaker.release.set()
+    assert scheduler.wait_idle(timeout=2)
+    assert speaker.spoken == ["läuft", "Hallo zusammen!"]
@@ -1,6 +1,8 @@
 import pytest
+import os
 import time
 from ptt import PTTRecorder
+from state_store import StateStore
 
 def test_ptt_queue_single_transcript():
     """Testet, dass ein einzelnes Transkript korrekt verarbeitet wird."""
@@ -77,3 +79,82 @@ def test_context_prompt_building():
     time.sleep(0.1)
     # Die zweite Anfrage sollte den Kontext enthalten
     assert any("Tobi liebt Schokolade." in call and "Was liebt Tobi?" in call for call in results)
+
+def test_stop_recording_uploads_wav_from_memory(monkeypatch, tmp_path):
+    """Testet, dass die Aufnahme ohne Datei auf der Festplatte an Whisper übergeben wird."""
+    import numpy as np
+    from unittest.mock import MagicMock
+    import http_clients
+    monkeypatch.chdir(tmp_path)
+    client = MagicMock()
+    client.audio.transcriptions.create.return_value = "Hallo"
+    monkeypatch.setattr(http_clients, "openai_client", lambda: client)
+    results = []
+    recorder = PTTRecorder(send_chat_callback=results.append)
+    recorder.recording = True
+    recorder.stream = MagicMock()
+    tone = (8000 * np.sin(np.arange(8000) / 5)).astype(np.int16).reshape(-1, 1)
+    recorder._callback(tone, 8000, None, None)
+    recorder.stop_recording()
+    name, data = client.audio.transcriptions.create.call_args.kwargs["file"]
+    assert (name, data[:4]) in (("aufnahme.flac", b"fLaC"), ("aufnahme.wav", b"RIFF"))
+    assert os.listdir(tmp_path) == []
+    recorder.transcript_queue.join()
+    assert results == ["Hallo"]
+
+def test_stop_recording_drops_silence(monkeypatch):
+    """Testet, dass eine Aufnahme ohne Sprache nicht hochgeladen wird."""
+    import numpy as np
+    from unittest.mock import MagicMock
+    import http_clients
+    client = MagicMock()
+    monkeypatch.setattr(http_clients, "openai_client", lambda: client)
+    recorder = PTTRecorder()
+    recorder.recording = True
+    recorder.stream = MagicMock()
+    recorder._callback(np.full((16000, 1), 3, dtype=np.int16), 16000, None, None)
+    recorder.stop_recording()
+    client.audio.transcriptions.create.assert_not_called()
+
+def test_streaming_mode_transcribes_segments_while_recording(monkeypatch):
+    """Testet, dass im Streaming-Modus Segmente an Pausen vorab transkribiert und zusammengesetzt werden."""
+    import numpy as np
+    from unittest.mock import MagicMock
+    monkeypatch.setenv("PTT_STREAMING", "true")
+    monkeypatch.setenv("PTT_SEGMENT_MIN_SECONDS", "1")
+    calls = []
+    class FakeTranscriber:
+        name = "fake"
+        def transcribe(self, samples, samplerate):
+            calls.append(len(samples))
+            return f"Teil{len(calls)}"
+    results = []
+    recorder = PTTRecorder(send_chat_callback=results.append, transcriber=FakeTranscriber())
+    recorder.recording = True
+    recorder.stream = MagicMock()
+    speech = (8000 * np.sin(np.arange(16000) / 5)).astype(np.int16).reshape(-1, 1)
+    pause = np.zeros((16000, 1), dtype=np.int16)
+    recorder._callback(np.concatenate([speech, pause]), 32000, None, None)
+    recorder.cut_segment(final=False)
+    recorder.segment_pool.submit(lambda: None).result()
+    assert calls == [16000 + 3200]  # Schnitt in der Pausenmitte, danach Stille bis auf 200 ms gekürzt
+    recorder._callback(speech, 16000, None, None)
+    recorder.stop_recording()
+    recorder.transcript_queue.join()
+    assert results == ["Teil1 Teil2"]
+
+def test_ptt_context_survives_restart(tmp_path):
+    """Testet, dass der PTT-Kontext über den Zustandsspeicher einen Neustart überdauert."""
+    path = str(tmp_path / "state.db")
+    state = StateStore(path)
+    recorder = PTTRecorder(send_chat_callback=lambda text: None, context_size=2, state=state)
+    for transcript in ("eins", "zwei", "drei"):
+        recorder.transcript_queue.put(transcript)
+    recorder.transcript_queue.join()
+    state.close()
+    state = StateStore(path)
+    try:
+        restarted = PTTRecorder(send_chat_callback=lambda text: None, context_size=2, state=state)
+        assert restarted.context_memory == ["zwei", "drei"]
+    finally:
+        state.close()
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, RetryPolicy, Upstream
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+    def __init__(self) -> None:
+        self.now = 0.0
+    def __call__(self) -> float:
+        return self.now
+
+def make_upstream(retries: int = 2, threshold: int = 3, hedge_after: float = 0.0, clock=None) -> Upstream:
+    """Creates an upstream without backoff delays."""
+    breaker = CircuitBreaker("test", failure_threshold=threshold, reset_timeout=10, clock=clock or FakeClock())
+    return Upstream("test", retry=RetryPolicy(retries=retries, base_delay=0), breaker=breaker, hedge_after=hedge_after)
+
+def test_deadline_counts_down_and_never_goes_negative():
+    """Test that the remaining budget shrinks with the clock and stops at zero."""
+    clock = FakeClock()
+    deadline = Deadline(5, clock=clock)
+    clock.now = 2
+    assert deadline.remaining() == 3
+    clock.now = 7
+    assert deadline.remaining() == 0 and deadline.expired
+
+def test_backoff_is_jittered_and_capped():
+    """Test that retry delays stay between zero and the exponential cap."""
+    policy = RetryPolicy(retries=5, base_delay=0.1, max_delay=0.3)
+    delays = [policy.delay(attempt) for attempt in range(5) for _ in range(20)]
+    assert all(0 <= delay <= 0.3 for delay in delays)
+    assert len(set(delays)) > 1
+
+def test_call_retries_transient_errors_with_remaining_budget():
+    """Test that transient errors are retried and every attempt gets the time left in the deadline."""
+    clock = FakeClock()
+    upstream = make_upstream()
+    timeouts = []
+    def attempt(remaining):
+        timeouts.append(remaining)
+        clock.now += 1
+        if len(timeouts) < 3:
+            raise TimeoutError()
+        return "ok"
+    assert upstream.call(attempt, Deadline(10, clock=clock)) == "ok"
+    assert timeouts == [10, 9, 8]
+
+def test_call_does_not_retry_permanent_errors_or_exhausted_budget():
+    """Test that non-transient errors and errors after the deadline are raised at once."""
+    clock = FakeClock()
+    upstream = make_upstream()
+    calls = []
+    def bad_request(remaining):
+        calls.append(remaining)
+        raise ValueError("400")
+    with pytest.raises(ValueError):
+        upstream.call(bad_request, Deadline(10, clock=clock))
+    assert len(calls) == 1
+    def slow(remaining):
+        calls.append(remaining)
+        clock.now += remaining
+        raise TimeoutError()
+    with pytest.raises(TimeoutError):
+        upstream.call(slow, Deadline(5, clock=clock))
+    assert len(calls) == 2
+
+def test_circuit_opens_fails_fast_and_recovers_after_trial():
+    """Test the closed, open, half-open cycle of the circuit breaker."""
+    clock = FakeClock()
+    upstream = make_upstream(retries=0, threshold=2, clock=clock)
+    def failing(remaining):
+        raise ConnectionError()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            upstream.call(failing, Deadline(10, clock=clock))
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        upstream.call(lambda remaining: "ok", Deadline(10, clock=clock))
+    clock.now = 10
+    assert upstream.breaker.allow()
+    assert not upstream.breaker.allow()
+    upstream.success()
+    assert upstream.call(lambda remaining: "ok", Deadline(10, clock=clock)) == "ok"
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_trial_reopens_circuit():
+    """Test that a failing half-open trial opens the circuit again."""
+    clock = FakeClock()
+    upstream = make_upstream(retries=0, threshold=1, clock=clock)
+    def failing(remaining):
+        raise ConnectionError()
+    with pytest.raises(ConnectionError):
+        upstream.call(failing, Deadline(10, clock=clock))
+    clock.now = 10
+    with pytest.raises(ConnectionError):
+        upstream.call(failing, Deadline(10, clock=clock))
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+
+def test_permanent_errors_do_not_open_circuit():
+    """Test that errors meaning the upstream answered (e.g. HTTP 400) reset the failure count."""
+    upstream = make_upstream(retries=0, threshold=2)
+    for exc in (ConnectionError(), ValueError(), ConnectionError()):
+        def attempt(remaining, exc=exc):
+            raise exc
+        with pytest.raises(type(exc)):
+            upstream.call(attempt, Deadline(10))
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_call_async_hedges_slow_request():
+    """Test that a second request is started after hedge_after and the first result wins."""
+    upstream = make_upstream(hedge_after=0.05)
+    started = []
+    cancelled = []
+    async def attempt(remaining):
+        index = len(started)
+        started.append(index)
+        try:
+            await asyncio.sleep(1 if index == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return index
+    assert await upstream.call_async(attempt, Deadline(5)) == 1
+    await asyncio.sleep(0)
+    assert started == [0, 1]
+    assert cancelled == [0]
+
+@pytest.mark.asyncio
+async def test_call_async_retries_and_does_not_hedge_fast_requests():
+    """Test that async calls are retried and answers before hedge_after start no second request."""
+    upstream = make_upstream(hedge_after=0.5)
+    calls = []
+    async def attempt(remaining):
+        calls.append(remaining)
+        if len(calls) == 1:
+            raise asyncio.TimeoutError()
+        return "ok"
+    assert await upstream.call_async(attempt, Deadline(5)) == "ok"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_does_not_block_circuit():
+    """Test that a cancelled trial call releases the half-open slot instead of blocking the circuit."""
+    clock = FakeClock()
+    upstream = make_upstream(retries=0, threshold=1, clock=clock)
+    def failing(remaining):
+        raise ConnectionError()
+    with pytest.raises(ConnectionError):
+        upstream.call(failing, Deadline(10, clock=clock))
+    clock.now = 10
+    started = asyncio.Event()
+    async def hanging(remaining):
+        started.set()
+        await asyncio.sleep(60)
+    task = asyncio.ensure_future(upstream.call_async(hanging, Deadline(10, clock=clock)))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    clock.now = 1000
+    assert upstream.breaker.state == CircuitBreaker.HALF_OPEN
+    assert upstream.breaker.allow()
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from state_store import StateStore
+
+def test_values_survive_reopen_in_wal_mode(tmp_path):
+    """Test that committed values are read back after a restart and the database uses WAL."""
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.put("ns", "a", {"x": [1, 2]})
+    store.put("ns", "b", "zwei", ttl=60)
+    store.put("anderer", "a", 3)
+    store.close()
+    reopened = StateStore(path)
+    try:
+        assert reopened.get("ns", "a") == {"x": [1, 2]}
+        assert sorted(key for key, _, _ in reopened.load("ns")) == ["a", "b"]
+        assert reopened.get("ns", "fehlt", "default") == "default"
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        reopened.close()
+
+def test_expired_entries_are_skipped_and_purged(tmp_path):
+    """Test that expired entries are not returned, remaining TTLs are reported and expired rows are purged on open."""
+    path = str(tmp_path / "state.db")
+    now = [1000.0]
+    store = StateStore(path, clock=lambda: now[0])
+    store.put("ns", "kurz", 1, ttl=10)
+    store.put("ns", "lang", 2, ttl=100)
+    store.put("ns", "immer", 3)
+    assert store.flush()
+    now[0] += 40
+    assert store.get("ns", "kurz") is None
+    assert store.load("ns") == [("immer", 3, None), ("lang", 2, 60.0)]
+    store.close()
+    StateStore(path, clock=lambda: now[0]).close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 2
+
+def test_writes_are_batched_and_do_not_block(tmp_path):
+    """Test that writes return before they are committed and flush commits them in one go."""
+    store = StateStore(str(tmp_path / "state.db"), flush_interval=60)
+    try:
+        for i in range(100):
+            store.put("ns", str(i), i)
+        store.delete("ns", "0")
+        assert store.get("ns", "5") is None
+        assert store.flush()
+        assert len(store.load("ns")) == 99
+        assert store.backlog == 0
+    finally:
+        store.close()
+
+def test_concurrent_writers_and_readers(tmp_path):
+    """Test that several threads can write and read at the same time through the single writer."""
+    store = StateStore(str(tmp_path / "state.db"), flush_interval=0.01)
+    errors = []
+    def worker(n: int) -> None:
+        try:
+            for i in range(50):
+                store.put("ns", f"{n}-{i}", i)
+                store.get("ns", f"{n}-0")
+        except sqlite3.Error as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    assert not errors
+    reopened = StateStore(store.path)
+    try:
+        assert len(reopened.load("ns")) == 200
+    finally:
+        reopened.close()
+
+def test_audio_index_keeps_lru_order(tmp_path):
+    """Test that the TTS audio index is returned least recently used first."""
+    now = [1000.0]
+    store = StateStore(str(tmp_path / "state.db"), clock=lambda: now[0])
+    try:
+        for key in ("a", "b", "c"):
+            store.touch_audio(key, 10)
+            now[0] += 1
+        store.touch_audio("a", 10)
+        store.remove_audio("b")
+        store.flush()
+        assert store.audio_index() == [("c", 10), ("a", 10)]
+    finally:
+        store.close()
+
+@pytest.mark.asyncio
+async def test_async_reads(tmp_path):
+    """Test that aget and aload return the committed values."""
+    store = StateStore(str(tmp_path / "state.db"))
+    try:
+        store.put("ns", "a", [1])
+        store.flush()
+        assert await store.aget("ns", "a") == [1]
+        assert await store.aload("ns") == [("a", [1], None)]
+    finally:
+        store.close()
+
+def test_from_env(tmp_path, monkeypatch):
+    """Test that the store is only created with STATE_DB and closed stores drop writes."""
+    monkeypatch.delenv("STATE_DB", raising=False)
+    assert StateStore.from_env() is None
+    monkeypatch.setenv("STATE_DB", str(tmp_path / "state.db"))
+    store = StateStore.from_env()
+    assert store is not None
+    store.close()
+    store.put("ns", "a", 1)
+    assert store.flush() is False
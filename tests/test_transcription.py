@@ -0,0 +1,53 @@
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import http_clients
+from transcription import LocalWhisperTranscriber, OpenAITranscriber, create_transcriber
+
+def test_create_transcriber_from_env(monkeypatch):
+    """Test that TRANSCRIPTION_BACKEND selects the backend and unknown values fall back to openai."""
+    monkeypatch.setenv("TRANSCRIPTION_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_WHISPER_MODEL", "base")
+    backend = create_transcriber()
+    assert isinstance(backend, LocalWhisperTranscriber) and backend.model_size == "base"
+    backend.close()
+    monkeypatch.setenv("TRANSCRIPTION_BACKEND", "unbekannt")
+    assert isinstance(create_transcriber(), OpenAITranscriber)
+
+def test_openai_transcriber_uploads_encoded_audio(monkeypatch):
+    """Test that the OpenAI backend uploads the encoded recording with the language hint."""
+    client = MagicMock()
+    client.audio.transcriptions.create.return_value = " Hallo Welt \n"
+    monkeypatch.setattr(http_clients, "openai_client", lambda: client)
+    backend = OpenAITranscriber(upload_format="wav", language="de")
+    assert backend.transcribe(np.zeros((1600, 1), dtype=np.int16), 16000) == "Hallo Welt"
+    kwargs = client.audio.transcriptions.create.call_args.kwargs
+    assert kwargs["file"][0] == "aufnahme.wav" and kwargs["language"] == "de"
+
+def test_local_transcriber_loads_model_once_and_runs_in_pool():
+    """Test that the local backend keeps its model resident and feeds it float audio."""
+    backend = LocalWhisperTranscriber(workers=2)
+    calls = []
+    def transcribe(audio, language=None, beam_size=5):
+        calls.append(audio)
+        return iter([SimpleNamespace(text=" Hallo"), SimpleNamespace(text=" Welt")]), None
+    backend._model = SimpleNamespace(transcribe=transcribe)
+    samples = np.full((1600, 1), 16384, dtype=np.int16)
+    assert backend.transcribe(samples, 16000) == "Hallo Welt"
+    assert backend.submit(samples, 16000).result() == "Hallo Welt"
+    assert calls[0].dtype == np.float32 and calls[0].shape == (1600,)
+    assert calls[0][0] == pytest.approx(0.5)
+    backend.close()
+
+def test_local_transcriber_reports_missing_dependency(monkeypatch):
+    """Test that a missing faster-whisper package raises a readable error."""
+    monkeypatch.setitem(sys.modules, "faster_whisper", None)
+    backend = LocalWhisperTranscriber()
+    with pytest.raises(RuntimeError, match="faster-whisper"):
+        backend.transcribe(np.zeros((1600, 1), dtype=np.int16), 16000)
+    backend.close()
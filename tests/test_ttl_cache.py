@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ttl_cache import MISSING, TTLCache
+
+def test_entries_expire_after_ttl():
+    """Test that entries are returned until their TTL has passed."""
+    now = [0.0]
+    cache = TTLCache(ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    now[0] = 11.0
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert "b" in cache and "a" not in cache
+
+def test_falsy_values_are_distinguishable_from_misses():
+    """Test that cached False is returned and a miss yields the MISSING sentinel."""
+    cache = TTLCache(ttl=10)
+    cache.set("neg", False)
+    assert cache.get("neg", MISSING) is False
+    assert cache.get("unknown", MISSING) is MISSING
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_size_bound_evicts_least_recently_used():
+    """Test that the cache never holds more than max_size entries."""
+    cache = TTLCache(ttl=10, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+def test_entries_lists_live_entries_with_expiry():
+    """Test that entries returns only unexpired entries with their expiry time."""
+    now = [0.0]
+    cache = TTLCache(ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    now[0] = 11.0
+    assert cache.entries() == [("b", 2, 30.0)]
@@ -0,0 +1,243 @@
+import os
+import sys
+from unittest.mock import MagicMock
+import pytest
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tts
+
+@pytest.fixture(autouse=True)
+def external_player(monkeypatch):
+    """Use the external player path; the in-process output is tested in test_audio_output."""
+    monkeypatch.setenv("TTS_OUTPUT", "player")
+    monkeypatch.setenv("RETRY_BASE_DELAY", "0")
+    monkeypatch.setattr(tts, "_elevenlabs", None)
+
+class FakePlayer:
+    """A fake player process that records the bytes written to its stdin."""
+    def __init__(self, cmd, broken_after: int = None, returncode: int = 0) -> None:
+        self.cmd = cmd
+        self.written = []
+        self.closed = False
+        self.broken_after = broken_after
+        self.returncode = returncode
+        self.stdin = self
+    def write(self, data: bytes) -> None:
+        if self.broken_after is not None and len(self.written) >= self.broken_after:
+            raise BrokenPipeError()
+        self.written.append(data)
+    def close(self) -> None:
+        self.closed = True
+    def wait(self, timeout: float = None) -> int:
+        return self.returncode
+
+def test_play_audio_stream_writes_chunks_as_they_arrive(monkeypatch):
+    """Test that each chunk is written to the player before the next one is read."""
+    players = []
+    def popen(cmd, **kwargs):
+        players.append(FakePlayer(cmd))
+        return players[-1]
+    monkeypatch.setattr("subprocess.Popen", popen)
+    seen_by_player = []
+    def chunks():
+        for chunk in (b"a", b"b", b"c"):
+            yield chunk
+            seen_by_player.append(len(players[0].written))
+    assert tts.play_audio_stream(chunks()) is True
+    assert seen_by_player == [1, 2, 3]
+    assert players[0].closed
+
+def test_play_audio_stream_falls_back_when_player_missing(monkeypatch):
+    """Test that mpv is used when mpg123 is not installed."""
+    players = []
+    def popen(cmd, **kwargs):
+        if cmd[0] == "mpg123":
+            raise FileNotFoundError(cmd[0])
+        players.append(FakePlayer(cmd))
+        return players[-1]
+    monkeypatch.setattr("subprocess.Popen", popen)
+    assert tts.play_audio_stream(iter([b"x", b"y"])) is True
+    assert players[0].cmd[0] == "mpv"
+    assert players[0].written == [b"x", b"y"]
+
+def test_play_audio_stream_replays_received_bytes_after_broken_pipe(monkeypatch):
+    """Test that the fallback player receives the bytes already read plus the rest."""
+    players = []
+    def popen(cmd, **kwargs):
+        if cmd[0] == "mpg123":
+            players.append(FakePlayer(cmd, broken_after=1, returncode=1))
+        else:
+            players.append(FakePlayer(cmd))
+        return players[-1]
+    monkeypatch.setattr("subprocess.Popen", popen)
+    assert tts.play_audio_stream(iter([b"1", b"2", b"3"])) is True
+    assert players[1].written == [b"1", b"2", b"3"]
+
+def test_play_audio_stream_without_player(monkeypatch, caplog):
+    """Test that a missing player is logged and reported as failure."""
+    def popen(cmd, **kwargs):
+        raise FileNotFoundError(cmd[0])
+    monkeypatch.setattr("subprocess.Popen", popen)
+    with caplog.at_level("ERROR"):
+        assert tts.play_audio_stream(iter([b"x"])) is False
+    assert "Audioausgabe fehlgeschlagen" in caplog.text
+
+def test_speak_text_requests_streaming_endpoint(monkeypatch):
+    """Test that speak_text uses the streaming endpoint with a chunked response."""
+    calls = []
+    def post(self, url, **kwargs):
+        calls.append((url, kwargs))
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = iter([b"mp3", b""])
+        return response
+    played = []
+    monkeypatch.setenv("ELEVENLABS_VOICE_ID", "voice123")
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.extend(chunks) or True)
+    tts.speak_text("Hallo")
+    url, kwargs = calls[0]
+    assert url.endswith("/text-to-speech/voice123/stream")
+    assert kwargs["stream"] is True
+    assert played == [b"mp3"]
+
+def test_speak_text_logs_timeout(monkeypatch, caplog):
+    """Test that a timeout is logged and not raised."""
+    def post(*args, **kwargs):
+        raise requests.Timeout()
+    monkeypatch.setattr("requests.Session.post", post)
+    with caplog.at_level("ERROR"):
+        tts.speak_text("Hallo")
+    assert "Timeout" in caplog.text
+
+def test_speak_text_uses_cache_for_repeated_text(monkeypatch):
+    """Test that a repeated text is played from the cache without a second request."""
+    from tts_cache import TTSAudioCache
+    calls = []
+    def post(self, url, **kwargs):
+        calls.append(url)
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = iter([b"mp", b"3"])
+        return response
+    played = []
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.append(b"".join(chunks)) or True)
+    cache = TTSAudioCache()
+    tts.speak_text("Willkommen!", cache=cache)
+    tts.speak_text("Willkommen!", cache=cache)
+    assert len(calls) == 1
+    assert played == [b"mp3", b"mp3"]
+    assert cache.stats()["memory_hits"] == 1
+
+def test_speak_text_does_not_cache_aborted_download(monkeypatch):
+    """Test that audio is only cached when the download completed."""
+    import threading
+    from tts_cache import TTSAudioCache
+    stop_event = threading.Event()
+    def post(self, url, **kwargs):
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = iter([b"a", b"b"])
+        return response
+    def play(chunks, stop_event=None):
+        next(iter(chunks))
+        stop_event.set()
+        return True
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", play)
+    cache = TTSAudioCache()
+    tts.speak_text("Hallo", stop_event=stop_event, cache=cache)
+    assert cache.stats()["memory_entries"] == 0
+
+def test_split_for_synthesis_at_sentence_boundaries():
+    """Test that long texts are split into sentences, short sentences joined and long ones cut at words."""
+    text = "Ja. Das ist der erste richtige Satz der Antwort. " + "Wort " * 30 + "Ende."
+    chunks = tts.split_for_synthesis(text, 60)
+    assert chunks[0] == "Ja. Das ist der erste richtige Satz der Antwort."
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert " ".join(chunks) == " ".join(text.split())
+    assert tts.split_for_synthesis("Kurz. Knapp.", 60) == ["Kurz. Knapp."]
+    assert tts.split_for_synthesis(text, 0) == [text.strip()]
+
+def test_speak_text_synthesizes_chunks_in_parallel_and_plays_in_order(monkeypatch):
+    """Test that chunks are requested concurrently (bounded by TTS_PARALLEL) and played in text order."""
+    import threading
+    import time
+    lock = threading.Lock()
+    active = []
+    peak = []
+    def post(self, url, json=None, **kwargs):
+        with lock:
+            active.append(json["text"])
+            peak.append(len(active))
+        # Spätere Abschnitte sind schneller fertig als frühere
+        time.sleep(0.05 if json["text"].startswith("Erster") else 0.01)
+        with lock:
+            active.remove(json["text"])
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = iter([json["text"].split()[0].encode()])
+        return response
+    played = []
+    monkeypatch.setenv("TTS_CHUNK_CHARS", "60")
+    monkeypatch.setenv("TTS_PARALLEL", "2")
+    monkeypatch.setattr(tts, "_pool", None)
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.append(b"".join(chunks)) or True)
+    text = ("Erster Satz mit genug Text für einen eigenen Abschnitt. Zweiter Satz mit genug Text für einen Abschnitt. "
+            "Dritter Satz mit genug Text für einen eigenen Abschnitt.")
+    tts.speak_text(text)
+    assert played == [b"Erster", b"Zweiter", b"Dritter"]
+    assert max(peak) == 2
+
+def test_speak_text_skips_failing_chunk(monkeypatch, caplog):
+    """Test that a chunk whose request fails is skipped and the others are still played."""
+    def post(self, url, json=None, **kwargs):
+        if json["text"].startswith("Zweiter"):
+            raise requests.ConnectionError("weg")
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = iter([json["text"].split()[0].encode()])
+        return response
+    played = []
+    monkeypatch.setenv("TTS_CHUNK_CHARS", "60")
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.append(b"".join(chunks)) or True)
+    text = ("Erster Satz mit genug Text für einen eigenen Abschnitt. Zweiter Satz mit genug Text für einen Abschnitt. "
+            "Dritter Satz mit genug Text für einen eigenen Abschnitt.")
+    with caplog.at_level("ERROR"):
+        tts.speak_text(text)
+    assert played == [b"Erster", b"Dritter"]
+    assert "weg" in caplog.text
+
+def test_speak_text_retries_server_error(monkeypatch):
+    """Test that an ElevenLabs 5xx answer is retried before the audio is played."""
+    statuses = [500, 200]
+    def post(self, url, **kwargs):
+        response = MagicMock(status_code=statuses.pop(0))
+        if response.status_code >= 400:
+            response.raise_for_status.side_effect = requests.HTTPError("500 Server Error", response=response)
+        response.iter_content.return_value = iter([b"mp3"])
+        return response
+    played = []
+    monkeypatch.setattr("requests.Session.post", post)
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.extend(chunks) or True)
+    tts.speak_text("Hallo")
+    assert statuses == []
+    assert played == [b"mp3"]
+
+def test_speak_text_skips_synthesis_while_circuit_is_open(monkeypatch, caplog):
+    """Test that no request is made while ElevenLabs is degraded, but cached audio still plays."""
+    from tts_cache import TTSAudioCache
+    calls = []
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kwargs: calls.append(url))
+    played = []
+    monkeypatch.setattr(tts, "play_audio_stream", lambda chunks, stop_event=None: played.extend(chunks) or True)
+    breaker = tts.elevenlabs_upstream().breaker
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    cache = TTSAudioCache()
+    cache.put(tts.tts_cache_key("Willkommen!"), b"mp3")
+    with caplog.at_level("WARNING"):
+        tts.speak_text("Hallo", cache=cache)
+        tts.speak_text("Willkommen!", cache=cache)
+    assert calls == []
+    assert played == [b"mp3"]
+    assert "nur als Text" in caplog.text
@@ -0,0 +1,99 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tts_cache import TTSAudioCache
+from state_store import StateStore
+
+def test_key_depends_on_text_voice_model_and_settings():
+    """Test that every part of the synthesis request changes the cache key."""
+    base = TTSAudioCache.make_key("Hallo", "voice", "model", {"stability": 0.75})
+    assert base == TTSAudioCache.make_key("Hallo", "voice", "model", {"stability": 0.75})
+    assert base != TTSAudioCache.make_key("Hallo!", "voice", "model", {"stability": 0.75})
+    assert base != TTSAudioCache.make_key("Hallo", "voice2", "model", {"stability": 0.75})
+    assert base != TTSAudioCache.make_key("Hallo", "voice", "model2", {"stability": 0.75})
+    assert base != TTSAudioCache.make_key("Hallo", "voice", "model", {"stability": 0.5})
+    assert base != TTSAudioCache.make_key("Hallo", "voice", "model", {"stability": 0.75}, "pcm_22050")
+
+def test_memory_tier_evicts_least_recently_used():
+    """Test that the memory tier stays within its byte cap and evicts the LRU entry."""
+    cache = TTSAudioCache(memory_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 10
+    assert stats["memory_hits"] == 3
+    assert stats["misses"] == 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that audio stored on disk is found by a new cache instance."""
+    cache = TTSAudioCache(memory_bytes=1024, disk_dir=str(tmp_path))
+    cache.put("key", b"audio")
+    restarted = TTSAudioCache(memory_bytes=1024, disk_dir=str(tmp_path))
+    assert restarted.get("key") == b"audio"
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get("key") == b"audio"
+    assert restarted.stats()["memory_hits"] == 1
+
+def test_disk_tier_respects_byte_cap(tmp_path):
+    """Test that the disk tier evicts the least recently used files beyond its cap."""
+    cache = TTSAudioCache(memory_bytes=0, disk_dir=str(tmp_path), disk_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"12345")
+    assert sorted(os.listdir(tmp_path)) == ["a.audio", "c.audio"]
+    assert cache.stats()["disk_bytes"] == 10
+
+def test_from_env_can_disable_cache(monkeypatch):
+    """Test that TTS_CACHE_ENABLED=false disables the cache."""
+    monkeypatch.setenv("TTS_CACHE_ENABLED", "false")
+    assert TTSAudioCache.from_env() is None
+
+def test_disk_index_is_kept_in_state_store(tmp_path, monkeypatch):
+    """Test that the sizes of indexed files are taken from the state store on restart instead of a stat per file."""
+    disk_dir = str(tmp_path / "cache")
+    state = StateStore(str(tmp_path / "state.db"))
+    try:
+        cache = TTSAudioCache(memory_bytes=0, disk_dir=disk_dir, disk_bytes=10, state=state)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        assert cache.get("a") == b"1234"
+        state.flush()
+        real_stat = os.stat
+        def stat(path, *args, **kwargs):
+            assert not str(path).endswith(TTSAudioCache.FILE_SUFFIX), "indizierte Dateien sollten nicht geprüft werden"
+            return real_stat(path, *args, **kwargs)
+        monkeypatch.setattr(os, "stat", stat)
+        restarted = TTSAudioCache(memory_bytes=0, disk_dir=disk_dir, disk_bytes=10, state=state)
+        restarted.put("c", b"1234")
+        assert restarted.get("b") is None
+        assert restarted.get("a") == b"1234"
+    finally:
+        state.close()
+
+def test_unindexed_files_are_reconciled_with_state_store(tmp_path):
+    """Test that files missing from the state store index are adopted and evicted first, and stale entries are dropped."""
+    disk_dir = tmp_path / "cache"
+    state = StateStore(str(tmp_path / "state.db"))
+    try:
+        cache = TTSAudioCache(memory_bytes=0, disk_dir=str(disk_dir), disk_bytes=10, state=state)
+        cache.put("a", b"1234")
+        cache.put("weg", b"1234")
+        state.flush()
+        (disk_dir / "weg.audio").unlink()
+        # Datei, deren Indexeintrag vor einem Absturz nicht mehr gespeichert wurde
+        (disk_dir / "verwaist.audio").write_bytes(b"1234")
+        restarted = TTSAudioCache(memory_bytes=0, disk_dir=str(disk_dir), disk_bytes=10, state=state)
+        assert restarted.stats()["disk_bytes"] == 8
+        restarted.put("b", b"1234")
+        assert sorted(os.listdir(disk_dir)) == ["a.audio", "b.audio"]
+        state.flush()
+        assert sorted(key for key, _ in state.audio_index()) == ["a", "b"]
+    finally:
+        state.close()
@@ -0,0 +1,197 @@
+import os
+import sys
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from twitch_api import HelixClient
+from state_store import StateStore
+
+USERS = {"kanal": "1", "fan": "100", "gast": "200"}
+FOLLOWERS = {"100"}
+
+async def start_helix_stub(requests_log: list) -> TestServer:
+    """Starts a local Helix stub that records every request."""
+    async def users(request):
+        requests_log.append(("users", request.query.getall("login", [])))
+        data = [{"id": USERS[l], "login": l} for l in request.query.getall("login", []) if l in USERS]
+        return web.json_response({"data": data})
+    async def follows(request):
+        requests_log.append(("follows", request.query["from_id"]))
+        total = 1 if request.query["from_id"] in FOLLOWERS and request.query["to_id"] == "1" else 0
+        return web.json_response({"total": total, "data": []})
+    app = web.Application()
+    app.router.add_get("/helix/users", users)
+    app.router.add_get("/helix/users/follows", follows)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+@pytest.mark.asyncio
+async def test_follower_checks_are_cached():
+    """Test that the channel ID, user IDs and follow results are only requested once."""
+    log = []
+    server = await start_helix_stub(log)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")))
+    try:
+        assert await client.resolve_channel_id() == "1"
+        assert await client.is_follower("Fan") is True
+        assert await client.is_follower("fan") is True
+        assert await client.is_follower("gast") is False
+        assert await client.is_follower("gast") is False
+    finally:
+        await client.aclose()
+        await server.close()
+    assert log.count(("users", ["kanal"])) == 1
+    assert log.count(("follows", "100")) == 1
+    assert log.count(("follows", "200")) == 1
+
+@pytest.mark.asyncio
+async def test_negative_results_expire_sooner():
+    """Test that a negative follow result is cached with the shorter negative TTL."""
+    log = []
+    server = await start_helix_stub(log)
+    now = [0.0]
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")), follower_ttl=600, negative_ttl=60)
+    client.follow_cache.clock = lambda: now[0]
+    try:
+        assert await client.is_follower("gast") is False
+        now[0] = 61.0
+        FOLLOWERS.add("200")
+        assert await client.is_follower("gast") is True
+    finally:
+        FOLLOWERS.discard("200")
+        await client.aclose()
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_unknown_user_and_missing_credentials():
+    """Test that unknown users and missing credentials are not followers."""
+    log = []
+    server = await start_helix_stub(log)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")))
+    try:
+        assert await client.is_follower("niemand") is False
+    finally:
+        await client.aclose()
+        await server.close()
+    assert await HelixClient(None, None, "kanal").is_follower("fan") is False
+
+@pytest.mark.asyncio
+async def test_network_errors_are_not_cached():
+    """Test that an unreachable API yields False without caching the result."""
+    client = HelixClient("cid", "token", "kanal", base_url="http://127.0.0.1:9/helix", timeout=1)
+    try:
+        assert await client.is_follower("fan") is False
+        assert "fan" not in client.follow_cache
+    finally:
+        await client.aclose()
+
+@pytest.mark.asyncio
+async def test_prefetch_resolves_logins_in_one_batch():
+    """Test that prefetched logins are resolved in bulk and their follow status is cached."""
+    import asyncio
+    log = []
+    server = await start_helix_stub(log)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")), batch_window=0.05)
+    try:
+        await client.resolve_channel_id()
+        for login in ("fan", "Gast", "niemand", "fan"):
+            client.prefetch(login)
+        await asyncio.sleep(0.3)
+        log.clear()
+        # Der Hot Path braucht keine Netzwerkanfrage mehr
+        assert await client.is_follower("fan") is True
+        assert await client.is_follower("gast") is False
+        assert await client.is_follower("niemand") is False
+        assert log == []
+    finally:
+        await client.aclose()
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_get_user_ids_batches_100_logins_per_request():
+    """Test that more than 100 logins are split into several bulk requests."""
+    log = []
+    server = await start_helix_stub(log)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")))
+    try:
+        logins = [f"user{i}" for i in range(150)] + ["fan"]
+        result = await client.get_user_ids(logins)
+        assert result["fan"] == "100"
+        assert result["user0"] is None
+        assert [len(entry[1]) for entry in log] == [100, 51]
+        await client.get_user_ids(logins)
+        assert len(log) == 2
+    finally:
+        await client.aclose()
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_is_follower_awaits_running_prefetch():
+    """Test that a hot-path check joins a running background check instead of duplicating it."""
+    import asyncio
+    log = []
+    server = await start_helix_stub(log)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")), batch_window=0.01)
+    try:
+        await client.resolve_channel_id()
+        client.prefetch("fan")
+        await asyncio.sleep(0.02)
+        results = await asyncio.gather(client.is_follower("fan"), client.is_follower("fan"))
+        assert results == [True, True]
+        assert log.count(("follows", "100")) == 1
+    finally:
+        await client.aclose()
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_within_deadline(monkeypatch):
+    """Test that a Helix 5xx answer is retried and the follow check still succeeds."""
+    monkeypatch.setenv("RETRY_BASE_DELAY", "0")
+    failures = [503]
+    async def users(request):
+        if failures:
+            return web.json_response({"error": "Service Unavailable"}, status=failures.pop())
+        return web.json_response({"data": [{"id": USERS[l], "login": l} for l in request.query.getall("login", [])]})
+    async def follows(request):
+        return web.json_response({"total": 1, "data": []})
+    app = web.Application()
+    app.router.add_get("/helix/users", users)
+    app.router.add_get("/helix/users/follows", follows)
+    server = TestServer(app)
+    await server.start_server()
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")))
+    try:
+        assert await client.is_follower("fan") is True
+    finally:
+        await client.aclose()
+        await server.close()
+    assert failures == []
+
+@pytest.mark.asyncio
+async def test_caches_are_restored_from_state_store(tmp_path):
+    """Test that user IDs and follow results persisted before a restart are not requested again."""
+    log = []
+    server = await start_helix_stub(log)
+    path = str(tmp_path / "state.db")
+    state = StateStore(path)
+    client = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")), state=state)
+    restarted = None
+    try:
+        assert await client.is_follower("fan") is True
+        await client.aclose()
+        state.close()
+        requests_before = len(log)
+        state = StateStore(path)
+        restarted = HelixClient("cid", "token", "kanal", base_url=str(server.make_url("/helix")), state=state)
+        await restarted.restore()
+        assert await restarted.resolve_channel_id() == "1"
+        assert await restarted.is_follower("fan") is True
+        assert len(log) == requests_before
+    finally:
+        if restarted is not None:
+            await restarted.aclose()
+        state.close()
+        await server.close()
@@ -0,0 +1,168 @@
+"""Transcription: Pluggable speech-to-text backends for PTT recordings.
+
+- ``openai`` (default): uploads the recording to the OpenAI transcription API (Whisper), with retries
+  within WHISPER_TIMEOUT and a circuit breaker (see resilience.Upstream).
+- ``local``: runs a quantized Whisper model on the CPU with the optional faster-whisper package. The
+  model is loaded on first use, stays resident and is shared by a small worker pool.
+
+The backend is selected with TRANSCRIPTION_BACKEND; see create_transcriber for all settings.
+"""
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional, Protocol
+import numpy as np
+from config import env_number
+from audio_buffer import encode_upload
+import http_clients
+import resilience
+
+class TranscriptionBackend(Protocol):
+    """Interface of a transcription backend.
+
+    Implementations must be thread-safe; ``transcribe`` may be called from several threads. Backends
+    that subclass this protocol inherit the no-op ``warm_up`` and ``close``.
+    """
+    name: str
+
+    def transcribe(self, samples: np.ndarray, samplerate: int) -> str:
+        """Transcribes 16-bit PCM samples and returns the text.
+
+        Raises:
+            Exception: Backend-specific errors; the caller logs them.
+        """
+        ...
+
+    def warm_up(self) -> None:
+        """Prepares the backend (e.g. loads a model) so the first utterance is not slower."""
+
+    def close(self) -> None:
+        """Releases resources held by the backend."""
+
+class OpenAITranscriber(TranscriptionBackend):
+    """Transcription via the OpenAI API using the shared pooled client.
+
+    Args:
+        model (str): Transcription model.
+        upload_format (str): ``flac`` or ``wav`` (see audio_buffer.encode_upload).
+        language (str, optional): ISO-639-1 language hint, e.g. ``de``.
+        timeout (float): Deadline per recording in seconds, shared by all retries.
+    """
+    name = "openai"
+
+    def __init__(self, model: str = "whisper-1", upload_format: str = "flac", language: Optional[str] = None,
+                 timeout: float = 30.0) -> None:
+        self.model = model
+        self.upload_format = upload_format
+        self.language = language
+        self.timeout = timeout
+        self.upstream = resilience.Upstream.from_env("whisper", "WHISPER", is_transient=http_clients.is_transient_error)
+
+    def transcribe(self, samples: np.ndarray, samplerate: int) -> str:
+        filename, audio = encode_upload(samples, samplerate, self.upload_format)
+        logging.info("Lade %.1fs Audio hoch (%s, %d Bytes)", len(samples) / samplerate, filename, len(audio))
+        kwargs = {"language": self.language} if self.language else {}
+        transcript = self.upstream.call(
+            lambda remaining: http_clients.openai_client().audio.transcriptions.create(
+                model=self.model,
+                file=(filename, audio),
+                response_format="text",
+                timeout=remaining,
+                **kwargs
+            ),
+            resilience.Deadline(self.timeout),
+        )
+        return transcript.strip()
+
+class LocalWhisperTranscriber(TranscriptionBackend):
+    """Transcription on the CPU with faster-whisper (CTranslate2, int8 quantized by default).
+
+    Args:
+        model_size (str): faster-whisper model name or path, e.g. ``small`` or ``base``.
+        compute_type (str): CTranslate2 compute type, e.g. ``int8``.
+        workers (int): Number of utterances transcribed in parallel.
+        cpu_threads (int): CPU threads per worker (0 lets CTranslate2 decide).
+        language (str, optional): Language code, e.g. ``de``; None detects the language.
+    """
+    name = "local"
+
+    def __init__(self, model_size: str = "small", compute_type: str = "int8", workers: int = 1,
+                 cpu_threads: int = 0, language: Optional[str] = None) -> None:
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = max(workers, 1)
+        self.cpu_threads = cpu_threads
+        self.language = language
+        self._model: Any = None
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcribe")
+
+    def _load_model(self) -> Any:
+        with self._lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError as exc:
+                    raise RuntimeError(
+                        "Fehlende Abhängigkeit: faster-whisper. Bitte installiere mit 'pip install faster-whisper'."
+                    ) from exc
+                started = time.perf_counter()
+                self._model = WhisperModel(
+                    self.model_size, device="cpu", compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads, num_workers=self.workers
+                )
+                logging.info("Lokales Whisper-Modell '%s' geladen (%.1fs)", self.model_size, time.perf_counter() - started)
+            return self._model
+
+    def _run(self, samples: np.ndarray) -> str:
+        model = self._load_model()
+        audio = samples.reshape(len(samples), -1).mean(axis=1).astype(np.float32) / 32768.0
+        segments, _info = model.transcribe(audio, language=self.language, beam_size=1)
+        return "".join(segment.text for segment in segments).strip()
+
+    def submit(self, samples: np.ndarray, samplerate: int) -> "concurrent.futures.Future[str]":
+        """Queues samples for transcription in the worker pool and returns a future for the text."""
+        if samplerate != 16000:
+            raise ValueError("Das lokale Whisper-Modell erwartet 16 kHz Audio")
+        return self._pool.submit(self._run, samples)
+
+    def transcribe(self, samples: np.ndarray, samplerate: int) -> str:
+        return self.submit(samples, samplerate).result()
+
+    def warm_up(self) -> None:
+        self._pool.submit(self._load_model)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+def create_transcriber(backend: Optional[str] = None) -> TranscriptionBackend:
+    """Creates the transcription backend configured by TRANSCRIPTION_BACKEND (``openai`` or ``local``).
+
+    Settings: TRANSCRIPTION_LANGUAGE (default unset, auto-detect); for openai WHISPER_MODEL (default
+    whisper-1), PTT_UPLOAD_FORMAT (default flac) and WHISPER_TIMEOUT (default 30s); for local LOCAL_WHISPER_MODEL (default small),
+    LOCAL_WHISPER_COMPUTE_TYPE (default int8), LOCAL_WHISPER_WORKERS (default 1) and
+    LOCAL_WHISPER_THREADS (default 0, automatic).
+    """
+    backend = (backend or os.environ.get("TRANSCRIPTION_BACKEND", "openai")).lower()
+    language = os.environ.get("TRANSCRIPTION_LANGUAGE") or None
+    timeout = env_number("WHISPER_TIMEOUT", 30.0)
+    if backend == "local":
+        workers = int(env_number("LOCAL_WHISPER_WORKERS", 1))
+        cpu_threads = int(env_number("LOCAL_WHISPER_THREADS", 0))
+        return LocalWhisperTranscriber(
+            model_size=os.environ.get("LOCAL_WHISPER_MODEL", "small"),
+            compute_type=os.environ.get("LOCAL_WHISPER_COMPUTE_TYPE", "int8"),
+            workers=workers,
+            cpu_threads=cpu_threads,
+            language=language,
+        )
+    if backend != "openai":
+        logging.warning("Unbekanntes TRANSCRIPTION_BACKEND '%s', verwende openai", backend)
+    return OpenAITranscriber(
+        model=os.environ.get("WHISPER_MODEL", "whisper-1"),
+        upload_format=os.environ.get("PTT_UPLOAD_FORMAT", "flac").lower(),
+        language=language,
+        timeout=timeout,
+    )
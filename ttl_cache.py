@@ -0,0 +1,79 @@
+"""TTL cache: Size-bounded LRU cache with per-entry expiry.
+
+Used for AI responses and other short-lived lookups. Values of None or False can be cached too;
+use the MISSING sentinel to tell a cache miss from a cached falsy value.
+"""
+import collections
+import threading
+import time
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+MISSING = object()
+
+class TTLCache:
+    """LRU cache whose entries expire after a time-to-live.
+
+    Args:
+        ttl (float): Default time-to-live in seconds.
+        max_size (int): Maximum number of entries; the least recently used entry is evicted first.
+        clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+    """
+    def __init__(self, ttl: float, max_size: int = 1024, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data: "collections.OrderedDict[Hashable, tuple[float, Any]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores value for key with the given or the default time-to-live."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes key and returns its value (expired or not), or default."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def entries(self) -> List[Tuple[Hashable, Any, float]]:
+        """Returns (key, value, expires_at) for all live entries, least recently used first."""
+        with self._lock:
+            now = self.clock()
+            return [(key, value, expires_at) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > self.clock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,427 @@
+"""TTS: Text-to-Speech via the ElevenLabs streaming API with direct playback.
+
+By default the audio is requested as raw PCM and played in-process through one persistent output
+stream (see audio_output.PCMOutput). With TTS_OUTPUT=player, or if no output device can be opened, MP3
+is requested and written straight into the stdin of an external player (mpg123, fallback mpv). Either
+way playback starts as soon as the first kilobytes have arrived and no audio file is written to disk.
+
+Long texts are split at sentence boundaries (at most TTS_CHUNK_CHARS characters per request) and the
+chunks are synthesized concurrently by a small worker pool (TTS_PARALLEL requests at a time). Playback
+follows the original order: the first chunk plays while it is still downloading and the following
+ones are already being generated.
+
+Each request has a deadline of ELEVENLABS_TIMEOUT seconds (default 20) for all attempts together;
+transient errors are retried, and while ElevenLabs is degraded the circuit breaker skips synthesis so
+replies go out as text only (cached audio is still played, see resilience.Upstream).
+"""
+import collections
+import concurrent.futures
+import itertools
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+import requests
+from config import env_number
+from tts_cache import TTSAudioCache
+import audio_output
+import http_clients
+import metrics
+import resilience
+
+ELEVENLABS_TTS_STREAM_PATH = "/v1/text-to-speech/{voice_id}/stream"
+# Player, die MP3-Daten von stdin lesen ("-"), in Reihenfolge der Bevorzugung
+PLAYER_COMMANDS: Tuple[List[str], ...] = (
+    ["mpg123", "-q", "-"],
+    ["mpv", "--quiet", "--no-video", "-"],
+)
+CHUNK_SIZE = 4096
+TTS_TIMEOUT = 20.0
+VOICE_SETTINGS = {"stability": 0.75, "similarity_boost": 0.25}
+# Satzende: Satzzeichen (ggf. gefolgt von Anführungszeichen/Klammern) und ein Leerzeichen
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]»“]*\s')
+# Kürzere Sätze werden mit dem folgenden zusammengefasst (eine Anfrage pro "Ja." lohnt nicht)
+MIN_CHUNK_CHARS = 40
+
+_lock = threading.Lock()
+_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_elevenlabs: Optional[resilience.Upstream] = None
+
+def chunk_chars() -> int:
+    """Maximum characters per synthesis request (TTS_CHUNK_CHARS, default 300, 0 disables splitting)."""
+    return int(env_number("TTS_CHUNK_CHARS", 300))
+
+def parallel_requests() -> int:
+    """Concurrent synthesis requests per text (TTS_PARALLEL, default 3)."""
+    return max(int(env_number("TTS_PARALLEL", 3)), 1)
+
+def request_timeout() -> float:
+    """Deadline of one ElevenLabs request including retries (ELEVENLABS_TIMEOUT, default 20)."""
+    return env_number("ELEVENLABS_TIMEOUT", TTS_TIMEOUT)
+
+def elevenlabs_upstream() -> resilience.Upstream:
+    """Returns the shared retry and circuit breaker settings for ElevenLabs (prefix ELEVENLABS)."""
+    global _elevenlabs
+    with _lock:
+        if _elevenlabs is None:
+            _elevenlabs = resilience.Upstream.from_env("elevenlabs", "ELEVENLABS", is_transient=http_clients.is_transient_error)
+        return _elevenlabs
+
+def _synthesis_pool() -> concurrent.futures.ThreadPoolExecutor:
+    """Returns the shared worker pool for chunk synthesis, creating it on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(max_workers=parallel_requests(), thread_name_prefix="tts-synth")
+        return _pool
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Splits a sentence longer than max_chars at word boundaries."""
+    parts: List[str] = []
+    current = ""
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+def split_for_synthesis(text: str, max_chars: int) -> List[str]:
+    """Splits text into sentence chunks of at most max_chars characters for separate TTS requests.
+
+    Sentences shorter than MIN_CHUNK_CHARS are joined with the next sentence, sentences longer than
+    max_chars are split at word boundaries.
+
+    Args:
+        text (str): The text to be spoken.
+        max_chars (int): Maximum characters per chunk; 0 or less returns the whole text as one chunk.
+
+    Returns:
+        List[str]: The chunks in speaking order.
+    """
+    text = text.strip()
+    if not text or max_chars <= 0 or len(text) <= max_chars:
+        return [text] if text else []
+    sentences: List[str] = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    chunks: List[str] = []
+    for sentence in sentences:
+        for part in _split_long(sentence, max_chars):
+            if chunks and len(chunks[-1]) < MIN_CHUNK_CHARS and len(chunks[-1]) + 1 + len(part) <= max_chars:
+                chunks[-1] = f"{chunks[-1]} {part}"
+            else:
+                chunks.append(part)
+    return chunks
+
+def _voice_config() -> Tuple[str, str]:
+    """Returns the configured ElevenLabs voice ID and model ID."""
+    voice_id = os.environ.get('ELEVENLABS_VOICE_ID', 'tKmESGVo91DcC5kFPRS6')
+    model_id = os.environ.get('ELEVENLABS_MODEL_ID', 'eleven_multilingual_v2')
+    return voice_id, model_id
+
+def build_tts_request(text: str, output_format: Optional[str] = None) -> Tuple[str, dict, dict]:
+    """Builds URL, headers and JSON payload for an ElevenLabs streaming TTS request.
+
+    Args:
+        text (str): The text to be spoken.
+        output_format (str, optional): ElevenLabs output format, e.g. ``pcm_22050``. None requests MP3.
+
+    Returns:
+        Tuple[str, dict, dict]: URL, headers and payload.
+    """
+    api_key = os.environ.get('ELEVENLABS_API_KEY', 'PLACEHOLDER_API_KEY')
+    voice_id, model_id = _voice_config()
+    url = http_clients.elevenlabs_base_url() + ELEVENLABS_TTS_STREAM_PATH.format(voice_id=voice_id)
+    if output_format:
+        url += f"?output_format={output_format}"
+    headers = {
+        "xi-api-key": api_key,
+        "Content-Type": "application/json",
+        "Accept": "audio/pcm" if output_format else "audio/mpeg"
+    }
+    payload = {
+        "text": text,
+        "model_id": model_id,
+        "voice_settings": dict(VOICE_SETTINGS)
+    }
+    return url, headers, payload
+
+def tts_cache_key(text: str, output_format: Optional[str] = None) -> str:
+    """Returns the audio cache key for text with the current voice, model, voice settings and output format."""
+    voice_id, model_id = _voice_config()
+    return TTSAudioCache.make_key(text, voice_id, model_id, VOICE_SETTINGS, output_format)
+
+def _error_detail(response: requests.Response) -> str:
+    """Extracts a readable error detail from an ElevenLabs error response."""
+    try:
+        error_json = response.json()
+        return error_json.get('detail') or error_json.get('message') or str(error_json)
+    except ValueError:
+        return response.text
+
+def _wait_player(proc: subprocess.Popen, stop_event: Optional[threading.Event]) -> int:
+    """Waits for the player to exit and terminates it early if stop_event is set."""
+    if stop_event is None:
+        return proc.wait()
+    while True:
+        try:
+            return proc.wait(timeout=0.1)
+        except subprocess.TimeoutExpired:
+            if stop_event.is_set():
+                proc.terminate()
+                return proc.wait()
+
+def play_audio_stream(chunks: Iterable[bytes], stop_event: Optional[threading.Event] = None) -> bool:
+    """Pipes MP3 chunks into the stdin of the first working player as they arrive.
+
+    If a player is missing or fails, the next one is started and receives the bytes already read
+    (kept in memory) followed by the rest of the stream.
+
+    Args:
+        chunks (Iterable[bytes]): MP3 data chunks, e.g. from ``Response.iter_content``.
+        stop_event (threading.Event, optional): When set, download and playback are aborted.
+
+    Returns:
+        bool: True if a player finished successfully or playback was stopped, False otherwise.
+    """
+    started = time.perf_counter()
+    try:
+        return _play_with_players(iter(chunks), stop_event)
+    finally:
+        metrics.PLAYBACK.observe(time.perf_counter() - started)
+
+def _play_with_players(chunks: Iterator[bytes], stop_event: Optional[threading.Event]) -> bool:
+    received: List[bytes] = []
+    for cmd in PLAYER_COMMANDS:
+        try:
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, bufsize=0
+            )
+        except FileNotFoundError:
+            logging.warning("Player %s nicht gefunden, versuche nächsten Player", cmd[0])
+            continue
+        try:
+            for chunk in received:
+                proc.stdin.write(chunk)
+            for chunk in chunks:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                received.append(chunk)
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            logging.warning("%s hat die Audiodaten nicht angenommen", cmd[0])
+        finally:
+            # Schließen signalisiert dem Player das Ende der Daten, auch bei Abbruch des Downloads
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = _wait_player(proc, stop_event)
+        if stop_event is not None and stop_event.is_set():
+            logging.info("TTS-Wiedergabe abgebrochen")
+            return True
+        if returncode == 0:
+            return True
+        logging.warning("%s fehlgeschlagen (Exit-Code %s), versuche nächsten Player", cmd[0], returncode)
+    logging.error("Audioausgabe fehlgeschlagen: kein Player (mpg123/mpv) verfügbar")
+    metrics.ERRORS.inc(stage="playback")
+    return False
+
+def _post_audio(url: str, headers: dict, payload: dict, timeout: float) -> requests.Response:
+    """One attempt of the streaming TTS request; raises requests.HTTPError with the response attached."""
+    response = http_clients.requests_session().post(
+        url, headers=headers, json=payload, timeout=(http_clients.connect_timeout(), timeout), stream=True
+    )
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as http_exc:
+        # Fehlertext laden, bevor die Verbindung freigegeben wird
+        response.content
+        response.close()
+        http_exc.response = response
+        raise
+    return response
+
+def _open_audio(text: str, output_format: Optional[str], deadline: resilience.Deadline) -> Optional[requests.Response]:
+    """Sends the streaming TTS request with retries; returns the response, or None after logging an HTTP error.
+
+    Raises:
+        requests.RequestException: On connection errors and timeouts after the last attempt.
+        resilience.CircuitOpenError: While ElevenLabs is degraded.
+    """
+    url, headers, payload = build_tts_request(text, output_format)
+    try:
+        return elevenlabs_upstream().call(lambda remaining: _post_audio(url, headers, payload, remaining), deadline)
+    except requests.HTTPError as http_exc:
+        response = http_exc.response
+        metrics.ERRORS.inc(stage="tts")
+        logging.error(
+            "TTS-Fehler (HTTP %s): %s | Detail: %s", response.status_code, http_exc, _error_detail(response)
+        )
+        return None
+
+def _iter_audio(response: requests.Response, started: float) -> Iterator[bytes]:
+    """Yields the non-empty audio chunks of a response and records the time to the first byte."""
+    first = True
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if chunk:
+            if first:
+                metrics.TTS_FIRST_BYTE.observe(time.perf_counter() - started)
+                first = False
+            yield chunk
+
+def _log_request_error(exc: Exception, timeout: float) -> None:
+    """Logs a failed ElevenLabs request."""
+    if isinstance(exc, resilience.CircuitOpenError):
+        logging.warning("ElevenLabs vorübergehend deaktiviert, Antwort nur als Text")
+        return
+    metrics.ERRORS.inc(stage="tts")
+    if isinstance(exc, requests.Timeout):
+        logging.error("TTS-Fehler: Die Anfrage an ElevenLabs hat das Timeout überschritten (%ss). Text ggf. kürzen oder später erneut versuchen.", timeout)
+    else:
+        logging.error("TTS-Fehler: %s", exc)
+
+def _fetch_chunk(text: str, output_format: Optional[str], timeout: float, stop_event: threading.Event,
+                 cache: Optional[TTSAudioCache], sink: "queue.Queue[Optional[bytes]]") -> None:
+    """Synthesizes one chunk in a pool worker and passes its audio to sink; None marks the end."""
+    try:
+        if stop_event.is_set():
+            return
+        key = None
+        if cache is not None:
+            key = tts_cache_key(text, output_format)
+            audio = cache.get(key)
+            metrics.record_lookup("tts", audio is not None)
+            if audio is not None:
+                sink.put(audio)
+                return
+        started = time.perf_counter()
+        response = _open_audio(text, output_format, resilience.Deadline(timeout))
+        if response is None:
+            return
+        received: List[bytes] = []
+        try:
+            for chunk in _iter_audio(response, started):
+                if stop_event.is_set():
+                    return
+                received.append(chunk)
+                sink.put(chunk)
+        finally:
+            response.close()
+        if key is not None and received:
+            cache.put(key, b"".join(received))
+    except (requests.RequestException, OSError, resilience.CircuitOpenError) as exc:
+        _log_request_error(exc, timeout)
+    finally:
+        sink.put(None)
+
+def _drain(sink: "queue.Queue[Optional[bytes]]", stop_event: threading.Event) -> Iterator[bytes]:
+    """Yields the audio of a chunk as the worker delivers it, until its end marker or stop_event."""
+    while True:
+        try:
+            chunk = sink.get(timeout=0.1)
+        except queue.Empty:
+            if stop_event.is_set():
+                return
+            continue
+        if chunk is None:
+            return
+        yield chunk
+
+def _speak_chunks(chunks: List[str], output_format: Optional[str], play: Callable[..., bool], timeout: float,
+                  stop_event: threading.Event, cache: Optional[TTSAudioCache]) -> None:
+    """Synthesizes chunks concurrently and plays them strictly in order as each one becomes ready."""
+    pool = _synthesis_pool()
+    pending = iter(chunks)
+    jobs: Deque[Tuple[concurrent.futures.Future, queue.Queue]] = collections.deque()
+
+    def submit_next() -> None:
+        text = next(pending, None)
+        if text is not None:
+            sink: queue.Queue = queue.Queue()
+            jobs.append((pool.submit(_fetch_chunk, text, output_format, timeout, stop_event, cache, sink), sink))
+
+    # Höchstens TTS_PARALLEL Abschnitte im Voraus anfordern, damit der Speicher begrenzt bleibt
+    for _ in range(parallel_requests()):
+        submit_next()
+    try:
+        while jobs and not stop_event.is_set():
+            _, sink = jobs.popleft()
+            submit_next()
+            audio = _drain(sink, stop_event)
+            first = next(audio, None)
+            if first is not None:
+                play(itertools.chain([first], audio), stop_event)
+    finally:
+        for future, _ in jobs:
+            future.cancel()
+
+def speak_text(text: str, timeout: Optional[float] = None, stop_event: Optional[threading.Event] = None, cache: Optional[TTSAudioCache] = None) -> None:
+    """Converts text to speech using the ElevenLabs streaming API and plays it while it downloads.
+
+    This call blocks until playback has finished (with the in-process output: until only the last
+    TTS_PREFETCH_SECONDS are left, so the next utterance follows without a gap). Errors are logged and not
+    raised, so a failing TTS never interrupts chat processing. With a cache, repeated texts are played
+    without a network request and completely downloaded audio is stored for the next time. Texts longer
+    than TTS_CHUNK_CHARS are split into sentence chunks that are synthesized concurrently and played in
+    order; a failing chunk is skipped.
+
+    Args:
+        text (str): The text to be spoken.
+        timeout (float, optional): Deadline of each ElevenLabs request in seconds, including retries.
+            Defaults to ELEVENLABS_TIMEOUT or 20.
+        stop_event (threading.Event, optional): When set, download and playback are aborted.
+        cache (TTSAudioCache, optional): Audio cache to read from and write to.
+    """
+    if stop_event is not None and stop_event.is_set():
+        return
+    timeout = timeout if timeout is not None else request_timeout()
+    output = audio_output.shared_output() if audio_output.pcm_enabled() else None
+    output_format = f"pcm_{output.samplerate}" if output is not None else None
+    play = output.play if output is not None else play_audio_stream
+    parts = split_for_synthesis(text, chunk_chars())
+    if len(parts) > 1:
+        _speak_chunks(parts, output_format, play, timeout, stop_event or threading.Event(), cache)
+        return
+    key = None
+    if cache is not None:
+        key = tts_cache_key(text, output_format)
+        audio = cache.get(key)
+        metrics.record_lookup("tts", audio is not None)
+        if audio is not None:
+            logging.debug("TTS-Cache-Treffer: %.40s", text)
+            play([audio], stop_event)
+            return
+    started = time.perf_counter()
+    try:
+        response = _open_audio(text, output_format, resilience.Deadline(timeout))
+        if response is None:
+            return
+        received: List[bytes] = []
+        complete = []
+        def chunks() -> Iterator[bytes]:
+            for chunk in _iter_audio(response, started):
+                received.append(chunk)
+                yield chunk
+            complete.append(True)
+        try:
+            play(chunks(), stop_event)
+        finally:
+            response.close()
+        # Nur vollständig geladene Audiodaten cachen
+        if key is not None and complete:
+            cache.put(key, b"".join(received))
+    except (requests.RequestException, OSError, resilience.CircuitOpenError) as exc:
+        _log_request_error(exc, timeout)
@@ -0,0 +1,229 @@
+"""TTS cache: Content-addressed cache for synthesized ElevenLabs audio.
+
+The key is a SHA-256 hash over the text, the voice ID, the model ID and the voice settings, so a
+changed voice or setting never plays stale audio. Audio is kept in an in-memory LRU tier and, if a
+cache directory is configured, in an on-disk tier with its own byte cap and LRU eviction.
+
+With a state store (STATE_DB), size and last use of every disk file are kept in SQLite, so the disk
+index is read with one indexed query at startup instead of a directory scan with a stat per file.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+from config import env_number
+from state_store import StateStore
+
+class TTSAudioCache:
+    """Two-tier LRU cache (memory, optional disk) for TTS audio.
+
+    Args:
+        memory_bytes (int): Byte cap of the in-memory tier.
+        disk_dir (str, optional): Directory of the on-disk tier. If None, only the memory tier is used.
+        disk_bytes (int): Byte cap of the on-disk tier.
+        state (StateStore, optional): Store that keeps the index of the on-disk tier.
+    """
+    # Neutrale Endung: je nach output_format liegt MP3 oder rohes PCM in der Datei
+    FILE_SUFFIX = ".audio"
+
+    def __init__(self, memory_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None, disk_bytes: int = 256 * 1024 * 1024,
+                 state: Optional[StateStore] = None) -> None:
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.memory_hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+        self._memory: "collections.OrderedDict[str, bytes]" = collections.OrderedDict()
+        self._memory_size = 0
+        self._disk_index: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.state = state
+        if disk_dir:
+            try:
+                os.makedirs(disk_dir, exist_ok=True)
+                self._load_disk_index()
+            except OSError as exc:
+                logging.error("TTS-Cache-Verzeichnis nicht nutzbar (%s): %s", disk_dir, exc)
+                self.disk_dir = None
+
+    @classmethod
+    def from_env(cls, state: Optional[StateStore] = None) -> Optional["TTSAudioCache"]:
+        """Creates a cache from environment variables, or returns None if TTS_CACHE_ENABLED is false.
+
+        TTS_CACHE_MEMORY_MB (default 32), TTS_CACHE_DIR (default unset, no disk tier) and
+        TTS_CACHE_DISK_MB (default 256) configure the tiers.
+        """
+        if os.environ.get("TTS_CACHE_ENABLED", "true").lower() in ("0", "false", "no", "off"):
+            return None
+        return cls(
+            memory_bytes=int(env_number("TTS_CACHE_MEMORY_MB", 32)) * 1024 * 1024,
+            disk_dir=os.environ.get("TTS_CACHE_DIR") or None,
+            disk_bytes=int(env_number("TTS_CACHE_DISK_MB", 256)) * 1024 * 1024,
+            state=state,
+        )
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: dict, output_format: Optional[str] = None) -> str:
+        """Builds the content-addressed cache key for a synthesis request (output_format None means MP3)."""
+        parts = [text, voice_id, model_id, voice_settings] + ([output_format] if output_format else [])
+        material = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached audio for key or None, updating LRU order and hit/miss counters."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            if key in self._disk_index:
+                audio = self._read_disk(key)
+                if audio is not None:
+                    self.disk_hits += 1
+                    self._put_memory(key, audio)
+                    return audio
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        """Stores audio in the memory tier and, if configured, in the disk tier."""
+        if not audio:
+            return
+        with self._lock:
+            self._put_memory(key, audio)
+            if self.disk_dir and key not in self._disk_index:
+                self._write_disk(key, audio)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and tier sizes."""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_size,
+            }
+
+    def _put_memory(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + self.FILE_SUFFIX)
+
+    def _load_disk_index(self) -> None:
+        names = self._list_disk()
+        indexed = self.state.audio_index() if self.state is not None else []
+        if indexed:
+            self._reconcile(names, indexed)
+        else:
+            self._scan_disk(names)
+        self._evict_disk()
+        logging.info("TTS-Cache geladen: %d Dateien, %d Bytes", len(self._disk_index), self._disk_size)
+
+    def _list_disk(self) -> List[str]:
+        """Returns the keys of all cache files in the directory."""
+        return [name[:-len(self.FILE_SUFFIX)] for name in os.listdir(self.disk_dir) if name.endswith(self.FILE_SUFFIX)]
+
+    def _stat_entries(self, keys: Iterable[str]) -> List[Tuple[float, str, int]]:
+        """Returns ``(mtime, key, size)`` of the given cache files, oldest first."""
+        entries = []
+        for key in keys:
+            try:
+                stat = os.stat(self._path(key))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, key, stat.st_size))
+        return sorted(entries)
+
+    def _scan_disk(self, keys: List[str]) -> None:
+        for mtime, key, size in self._stat_entries(keys):
+            self._disk_index[key] = size
+            self._disk_size += size
+            if self.state is not None:
+                # Index einmalig aus dem Verzeichnis übernehmen
+                self.state.touch_audio(key, size, last_used=mtime)
+
+    def _reconcile(self, keys: List[str], indexed: List[Tuple[str, int]]) -> None:
+        """Builds the disk index from the state store and the file list.
+
+        Files without an index entry (written before a crash lost the last batch, or after the database
+        was reset) are adopted as least recently used, so they count against the cap and are evicted first.
+        Index entries whose file is gone are removed.
+        """
+        present = set(keys)
+        known = {key for key, _ in indexed}
+        for _, key, size in self._stat_entries(key for key in keys if key not in known):
+            self._disk_index[key] = size
+            self._disk_size += size
+            # Auch im Index als älteste Einträge, damit die Reihenfolge nach dem nächsten Start gleich bleibt
+            self.state.touch_audio(key, size, last_used=0.0)
+        for key, size in indexed:
+            if key in present:
+                self._disk_index[key] = size
+                self._disk_size += size
+            else:
+                self.state.remove_audio(key)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+        except OSError as exc:
+            logging.warning("TTS-Cache-Datei nicht lesbar (%s): %s", path, exc)
+            self._disk_size -= self._disk_index.pop(key, 0)
+            if self.state is not None:
+                self.state.remove_audio(key)
+            return None
+        self._disk_index.move_to_end(key)
+        if self.state is not None:
+            self.state.touch_audio(key, len(audio))
+        return audio
+
+    def _write_disk(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logging.warning("TTS-Cache-Datei konnte nicht geschrieben werden (%s): %s", path, exc)
+            return
+        self._disk_index[key] = len(audio)
+        self._disk_size += len(audio)
+        if self.state is not None:
+            self.state.touch_audio(key, len(audio))
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_size > self.disk_bytes and self._disk_index:
+            key, size = self._disk_index.popitem(last=False)
+            self._disk_size -= size
+            if self.state is not None:
+                self.state.remove_audio(key)
+            try:
+                os.remove(self._path(key))
+            except OSError as exc:
+                logging.warning("TTS-Cache-Datei konnte nicht gelöscht werden: %s", exc)
@@ -0,0 +1,350 @@
+"""Twitch API: Helix client with a shared HTTP session and cached follower checks.
+
+The channel ID is resolved once, logins are mapped to user IDs through a long-lived cache, and
+follow relations are cached with a TTL (shorter for negative results, so new followers get
+access soon). All requests share one aiohttp session and its keep-alive connections.
+
+Logins seen in chat can be prefetched: they are collected over a short window, resolved in bulk
+(up to 100 logins per request) and their follow status is checked in the background, so the
+access decision is usually cached before the viewer asks anything.
+
+Each Helix request has a deadline of HELIX_TIMEOUT seconds for all attempts together; transient errors
+are retried and a circuit breaker fails fast while Helix is degraded (see resilience.Upstream).
+
+With a state store (STATE_DB), resolved user IDs and follow results are also written to SQLite and
+restored at startup with their remaining TTL, so a restart does not repeat the lookups.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Set
+import aiohttp
+from config import env_number
+from state_store import StateStore
+from ttl_cache import MISSING, TTLCache
+import http_clients
+import metrics
+import resilience
+
+class HelixClient:
+    """Minimal Twitch Helix client for user and follower lookups.
+
+    Args:
+        client_id (str): Twitch application client ID.
+        access_token (str): OAuth access token.
+        channel (str): Login of the channel whose followers are checked.
+        base_url (str): Helix base URL.
+        timeout (float): Deadline per request in seconds, shared by all retries.
+        follower_ttl (float): Seconds a positive follow result is cached.
+        negative_ttl (float): Seconds a negative follow result is cached.
+        cache_size (int): Maximum number of entries per cache.
+        batch_window (float): Seconds prefetched logins are collected before they are resolved in bulk.
+        prefetch_concurrency (int): Maximum number of concurrent background follow checks.
+        state (StateStore, optional): Store that persists the user ID and follow caches.
+    """
+    BASE_URL = "https://api.twitch.tv/helix"
+    USER_ID_TTL = 24 * 3600
+    USER_IDS_NAMESPACE = "twitch_user_ids"
+    MAX_LOGINS_PER_REQUEST = 100
+
+    def __init__(self, client_id: Optional[str], access_token: Optional[str], channel: str, base_url: str = BASE_URL,
+                 timeout: float = 10.0, follower_ttl: float = 600.0, negative_ttl: float = 60.0, cache_size: int = 5000,
+                 batch_window: float = 0.5, prefetch_concurrency: int = 4, state: Optional[StateStore] = None) -> None:
+        self.client_id = client_id
+        self.access_token = access_token
+        self.channel = channel.lower()
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.channel_id: Optional[str] = None
+        self.user_ids = TTLCache(ttl=self.USER_ID_TTL, max_size=cache_size)
+        self.follow_cache = TTLCache(ttl=follower_ttl, max_size=cache_size)
+        self.batch_window = batch_window
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pending: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._follow_tasks: Dict[str, asyncio.Task] = {}
+        self._follow_waiting: Set[asyncio.Task] = set()
+        self._background: Set[asyncio.Task] = set()
+        self._prefetch_slots = asyncio.Semaphore(max(prefetch_concurrency, 1))
+        self.upstream = resilience.Upstream.from_env("helix", "HELIX", is_transient=http_clients.is_transient_error)
+        self.state = state
+        # Follow-Ergebnisse gelten nur für diesen Kanal
+        self._follow_namespace = f"twitch_follows:{self.channel}"
+
+    @classmethod
+    def from_env(cls, state: Optional[StateStore] = None) -> "HelixClient":
+        """Creates a client from CLIENT_ID, TMI_TOKEN and TWITCH_CHANNEL.
+
+        HELIX_TIMEOUT (default 10), FOLLOWER_CACHE_TTL (default 600), FOLLOWER_NEGATIVE_TTL (default 60)
+        and FOLLOWER_CACHE_SIZE (default 5000) tune timeouts and caches. HELIX_BATCH_WINDOW (default 0.5)
+        and HELIX_PREFETCH_CONCURRENCY (default 4) tune the prefetch.
+        """
+        return cls(
+            client_id=os.environ.get("CLIENT_ID"),
+            access_token=os.environ.get("TMI_TOKEN"),
+            channel=os.environ.get("TWITCH_CHANNEL", ""),
+            base_url=os.environ.get("TWITCH_HELIX_BASE_URL", cls.BASE_URL),
+            timeout=env_number("HELIX_TIMEOUT", 10.0),
+            follower_ttl=env_number("FOLLOWER_CACHE_TTL", 600.0),
+            negative_ttl=env_number("FOLLOWER_NEGATIVE_TTL", 60.0),
+            cache_size=int(env_number("FOLLOWER_CACHE_SIZE", 5000)),
+            batch_window=env_number("HELIX_BATCH_WINDOW", 0.5),
+            prefetch_concurrency=int(env_number("HELIX_PREFETCH_CONCURRENCY", 4)),
+            state=state,
+        )
+
+    async def restore(self) -> None:
+        """Loads the persisted user IDs and follow results into the caches. Called once at startup."""
+        if self.state is None:
+            return
+        for cache, namespace in ((self.user_ids, self.USER_IDS_NAMESPACE), (self.follow_cache, self._follow_namespace)):
+            for login, value, ttl in await self.state.aload(namespace):
+                cache.set(login, value, ttl=ttl)
+        logging.info("Helix-Caches wiederhergestellt: %d Nutzer-IDs, %d Follower-Ergebnisse", len(self.user_ids), len(self.follow_cache))
+
+    def _remember(self, cache: TTLCache, namespace: str, login: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Caches a lookup result and hands it to the state store, if any."""
+        cache.set(login, value, ttl=ttl)
+        if self.state is not None:
+            self.state.put(namespace, login, value, ttl=cache.ttl if ttl is None else ttl)
+
+    @property
+    def configured(self) -> bool:
+        """True if client ID and access token are available."""
+        return bool(self.client_id and self.access_token)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared session, creating it inside the running event loop on first use."""
+        if self._session is None or self._session.closed:
+            headers = {"Client-ID": self.client_id, "Authorization": f"Bearer {self.access_token}"}
+            self._session = http_clients.create_aiohttp_session(headers=headers, timeout=self.timeout)
+        return self._session
+
+    async def warm_up(self) -> None:
+        """Opens a pooled connection to the Helix API so the first follower check skips the TLS handshake."""
+        if not self.configured:
+            return
+        try:
+            async with self._get_session().head(self.base_url):
+                logging.debug("Verbindung vorgewärmt: %s", self.base_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logging.debug("Vorwärmen von %s fehlgeschlagen: %s", self.base_url, exc)
+
+    async def aclose(self) -> None:
+        """Cancels pending prefetches and closes the shared HTTP session."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending.clear()
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_json(self, path: str, params) -> dict:
+        """Performs a GET request against the Helix API with retries and returns the decoded JSON body.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: After the last failed attempt, also for HTTP errors.
+            resilience.CircuitOpenError: While Helix is degraded.
+        """
+        return await self.upstream.call_async(
+            lambda remaining: self._request_json(path, params, remaining), resilience.Deadline(self.timeout)
+        )
+
+    async def _request_json(self, path: str, params, timeout: float) -> dict:
+        """One attempt of a Helix GET request."""
+        async with self._get_session().get(
+            f"{self.base_url}/{path}", params=params, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            logging.debug("Helix %s %s -> %s", path, params, data)
+            return data
+
+    async def get_user_ids(self, logins: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolves logins to user IDs in bulk, using the login cache.
+
+        Uncached logins are requested in batches of up to 100 per Helix request.
+
+        Args:
+            logins (Iterable[str]): Twitch login names.
+
+        Returns:
+            Dict[str, Optional[str]]: Lowercase login to user ID, None for unknown users.
+        """
+        result: Dict[str, Optional[str]] = {}
+        missing = []
+        for login in dict.fromkeys(login.lower() for login in logins):
+            cached = self.user_ids.get(login, MISSING)
+            if cached is MISSING:
+                missing.append(login)
+            else:
+                result[login] = cached
+        for start in range(0, len(missing), self.MAX_LOGINS_PER_REQUEST):
+            batch = missing[start:start + self.MAX_LOGINS_PER_REQUEST]
+            data = await self._get_json("users", [("login", login) for login in batch])
+            found = {user["login"].lower(): user["id"] for user in data.get("data", [])}
+            for login in batch:
+                user_id = found.get(login)
+                if user_id is None:
+                    logging.warning("No data found for user: %s", login)
+                    self._remember(self.user_ids, self.USER_IDS_NAMESPACE, login, None, ttl=self.negative_ttl)
+                else:
+                    self._remember(self.user_ids, self.USER_IDS_NAMESPACE, login, user_id)
+                result[login] = user_id
+        return result
+
+    async def get_user_id(self, login: str) -> Optional[str]:
+        """Resolves a login to a user ID, using the login cache.
+
+        Args:
+            login (str): Twitch login name.
+
+        Returns:
+            Optional[str]: The user ID, or None if the user does not exist.
+        """
+        login = login.lower()
+        return (await self.get_user_ids([login]))[login]
+
+    async def resolve_channel_id(self) -> Optional[str]:
+        """Resolves and caches the ID of the configured channel. Called once at startup."""
+        if self.channel_id is None and self.configured:
+            try:
+                self.channel_id = await self.get_user_id(self.channel)
+            except (aiohttp.ClientError, asyncio.TimeoutError, resilience.CircuitOpenError) as exc:
+                logging.error("Kanal-ID konnte nicht ermittelt werden: %s", exc)
+        return self.channel_id
+
+    async def is_follower(self, login: str) -> bool:
+        """Checks whether a user follows the channel, using the follow cache.
+
+        A background check that is already running for the same user is awaited instead of
+        starting a second request. Network errors, and any check while Helix is degraded, are
+        logged and treated as "not a follower" without being cached.
+
+        Args:
+            login (str): Twitch login name.
+
+        Returns:
+            bool: True if the user is a follower, False otherwise.
+        """
+        if not self.configured:
+            logging.warning("CLIENT_ID or TMI_TOKEN missing for follower check.")
+            return False
+        login = login.lower()
+        cached = self.follow_cache.get(login, MISSING)
+        metrics.record_lookup("follower", cached is not MISSING)
+        if cached is not MISSING:
+            return cached
+        task = self._follow_tasks.get(login)
+        if task is None or task in self._follow_waiting:
+            # Eine noch auf einen Slot wartende Hintergrundprüfung wird durch eine direkte Prüfung ersetzt
+            task = self._register_follow_task(login, self._check_follow(login))
+        return await asyncio.shield(task)
+
+    async def _check_follow(self, login: str) -> bool:
+        """Requests the follow relation for login and caches the result."""
+        cached = self.follow_cache.get(login, MISSING)
+        if cached is not MISSING:
+            return cached
+        try:
+            channel_id = await self.resolve_channel_id()
+            if channel_id is None:
+                return False
+            user_id = await self.get_user_id(login)
+            if user_id is None:
+                self._remember(self.follow_cache, self._follow_namespace, login, False, ttl=self.negative_ttl)
+                return False
+            data = await self._get_json("users/follows", {"from_id": user_id, "to_id": channel_id})
+        except resilience.CircuitOpenError:
+            logging.warning("Helix vorübergehend deaktiviert, %s gilt vorerst nicht als Follower", login)
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            metrics.ERRORS.inc(stage="helix")
+            logging.error("Follower-Prüfung für %s fehlgeschlagen: %s", login, exc)
+            return False
+        is_follower = data.get("total", 0) > 0
+        if is_follower:
+            logging.info("User '%s' IS a follower of channel '%s'", login, self.channel)
+            self._remember(self.follow_cache, self._follow_namespace, login, True)
+        else:
+            logging.info("User '%s' is NOT a follower of channel '%s'", login, self.channel)
+            self._remember(self.follow_cache, self._follow_namespace, login, False, ttl=self.negative_ttl)
+        return is_follower
+
+    def prefetch(self, login: str) -> None:
+        """Schedules a login for bulk resolution and a background follow check.
+
+        Must be called from within the running event loop. Logins are collected for batch_window
+        seconds (or until 100 are pending) and then resolved with as few requests as possible.
+
+        Args:
+            login (str): Twitch login name.
+        """
+        if not self.configured:
+            return
+        login = login.lower()
+        if login in self._pending or login in self._follow_tasks or login in self.follow_cache:
+            return
+        self._pending.add(login)
+        if len(self._pending) >= self.MAX_LOGINS_PER_REQUEST:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._start_flush)
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _register_follow_task(self, login: str, coro) -> asyncio.Task:
+        """Starts a follow check and registers it so concurrent checks for login can join it."""
+        task = self._track(asyncio.ensure_future(coro))
+        self._follow_tasks[login] = task
+
+        def unregister(done: asyncio.Task) -> None:
+            if self._follow_tasks.get(login) is done:
+                del self._follow_tasks[login]
+        task.add_done_callback(unregister)
+        return task
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        logins, self._pending = list(self._pending), set()
+        if logins:
+            self._track(asyncio.ensure_future(self._flush(logins)))
+
+    async def _flush(self, logins: list) -> None:
+        """Resolves a batch of logins in bulk and starts their background follow checks."""
+        try:
+            await self.resolve_channel_id()
+            await self.get_user_ids(logins)
+        except (aiohttp.ClientError, asyncio.TimeoutError, resilience.CircuitOpenError) as exc:
+            metrics.ERRORS.inc(stage="helix")
+            logging.warning("Batch-Auflösung von %d Logins fehlgeschlagen: %s", len(logins), exc)
+            return
+        logging.debug("Prefetch: %d Logins aufgelöst", len(logins))
+        for login in logins:
+            if login not in self._follow_tasks and login not in self.follow_cache:
+                task = self._register_follow_task(login, self._prefetch_follow(login))
+                self._follow_waiting.add(task)
+
+    async def _prefetch_follow(self, login: str) -> bool:
+        """Background follow check, limited to prefetch_concurrency concurrent requests."""
+        me = asyncio.current_task()
+        try:
+            async with self._prefetch_slots:
+                self._follow_waiting.discard(me)
+                if self._follow_tasks.get(login) is not me:
+                    # Der Hot Path hat die Prüfung inzwischen selbst übernommen
+                    return self.follow_cache.get(login, False)
+                return await self._check_follow(login)
+        finally:
+            self._follow_waiting.discard(me)